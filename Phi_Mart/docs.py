@@ -0,0 +1,41 @@
+"""
+Swagger and ReDoc views, built on first use.
+
+drf_yasg and its inspectors are a sizeable part of a cold start and the
+docs are seldom requested, so the URLconf routes to light wrappers and
+the drf_yasg schema view is only created when a docs URL is first hit.
+"""
+
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_docs_view(renderer):
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+    from rest_framework import permissions
+
+    schema_view = get_schema_view(
+        openapi.Info(
+            title="Phi_Mart Rest Api",
+            default_version='v1',
+            description="Api documentation for Phi_Mart",
+            terms_of_service="https://www.google.com/policies/terms/",
+            contact=openapi.Contact(email="contact@snippets.local"),
+            license=openapi.License(name="BSD License"),
+        ),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+    if renderer is None:
+        return schema_view.without_ui(cache_timeout=0)
+    return schema_view.with_ui(renderer, cache_timeout=0)
+
+
+def docs_view(renderer=None):
+    """ The schema itself for None, otherwise the 'swagger' or 'redoc' UI """
+    def view(request, *args, **kwargs):
+        return get_docs_view(renderer)(request, *args, **kwargs)
+    # like the drf_yasg view it stands in for
+    view.csrf_exempt = True
+    return view
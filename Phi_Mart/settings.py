@@ -10,10 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import sys
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
-import cloudinary
+from decouple import Csv, config
 
 
 
@@ -29,6 +29,9 @@ SECRET_KEY = 'django-insecure-cr-61ridkr9#bfk*$d3j9(=-cz3=9ap)whw^w$z!iokl2)fp9@
 
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
+# debug_toolbar and its panels, off on the serverless deployment (vercel.json) to keep cold starts short
+# and under `manage.py test`, which runs with DEBUG off and which the toolbar refuses to run in
+DEBUG_TOOLBAR = config('DEBUG_TOOLBAR', default=DEBUG and 'test' not in sys.argv[1:2], cast=bool)
 
 ALLOWED_HOSTS = ['.vercel.app', '127.0.0.1']
 AUTH_USER_MODEL = 'users.User'
@@ -38,7 +41,7 @@ AUTH_USER_MODEL = 'users.User'
 INSTALLED_APPS = [
     "whitenoise.runserver_nostatic",
     'users', 
-    "debug_toolbar",
+    *(["debug_toolbar"] if DEBUG_TOOLBAR else []),
     'django_filters',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -60,7 +63,9 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    "api.profiling.RequestProfilingMiddleware",
+    "api.replicas.ReplicaRoutingMiddleware",
+    *(["debug_toolbar.middleware.DebugToolbarMiddleware"] if DEBUG_TOOLBAR else []),
     'django.middleware.security.SecurityMiddleware',
     "whitenoise.middleware.WhiteNoiseMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -73,6 +78,17 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'Phi_Mart.urls'
 
+# sampled per-request profiling with Server-Timing headers, see api/profiling.py
+REQUEST_PROFILING = {
+    # fraction of requests profiled, 0 turns the middleware off
+    'SAMPLE_RATE': config('PROFILING_SAMPLE_RATE', default=0.01, cast=float),
+    # profiled requests over either budget are logged as warnings
+    'QUERY_BUDGET': config('PROFILING_QUERY_BUDGET', default=25, cast=int),
+    'LATENCY_BUDGET_MS': config('PROFILING_LATENCY_BUDGET_MS', default=500, cast=int),
+    # Server-Timing for every client, staff users always get it
+    'SERVER_TIMING': config('PROFILING_SERVER_TIMING', default=DEBUG, cast=bool),
+}
+
 
 INTERNAL_IPS = [
     # ...
@@ -125,14 +141,56 @@ DATABASES = {
     }
 }
 
+# read replicas of default, e.g. replica_hosts=10.0.0.2,10.0.0.3, see api/replicas.py
+for index, replica_host in enumerate(config('replica_hosts', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': replica_host, 'TEST': {'MIRROR': 'default'}}
+# tests only use default, apart from the routing tests in api/tests.py which read through replica1,
+# a mirror of default stands in for it when none is configured
+if 'test' in sys.argv[1:2]:
+    DATABASE_REPLICAS = []
+    DATABASES.setdefault('replica1', {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}})
+else:
+    DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# seconds a client's reads stay on default after it wrote, longer than the replication lag
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+# pins must be seen by every process, so they live in the shared cache (CACHES is defined below)
+REPLICA_CACHE_ALIAS = 'shared'
+
 
 # Configuration
-cloudinary.config(
-    cloud_name=config('cloud_name'),
-    api_key=config('api_key'),
-    api_secret=config('api_secret'),
-    secure=True
-)
+# read by the cloudinary SDK when it is first imported, see products/fields.py
+CLOUDINARY = {
+    'cloud_name': config('cloud_name'),
+    'api_key': config('api_key'),
+    'api_secret': config('api_secret'),
+    'secure': True,
+}
+
+# Cache
+# `default` is local to each process. `shared` is seen by every worker and serverless instance, see api/caching.py:
+# Redis when REDIS_URL is set (needs the redis package), otherwise a table in the database created by `migrate`
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'phimart_shared_cache',
+    },
+}
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
+# the catalog version must be seen by every process, the response cache is off on a process-local alias
+CATALOG_CACHE_ALIAS = 'shared'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+# share of requests counted in the hit/miss statistics, see `manage.py catalog_cache_stats`
+CATALOG_CACHE_STATS_SAMPLE_RATE = config('CATALOG_CACHE_STATS_SAMPLE_RATE', default=0.01, cast=float)
 
 # Media Storage Setting 
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
@@ -179,13 +237,59 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# credentials of the Cloudinary media storage, the same account as CLOUDINARY
+CLOUDINARY_STORAGE = {
+    'CLOUD_NAME': CLOUDINARY['cloud_name'],
+    'API_KEY': CLOUDINARY['api_key'],
+    'API_SECRET': CLOUDINARY['api_secret'],
+}
+
+# product image pipeline, see products/images.py
+# images are kept in Cloudinary, the serverless filesystem is read-only and lost between invocations.
+# PRODUCT_IMAGES_LOCAL=True keeps them under MEDIA_ROOT instead, for development
+PRODUCT_IMAGES_LOCAL = config('PRODUCT_IMAGES_LOCAL', default=False, cast=bool)
+PRODUCT_IMAGES = {
+    # any Django storage class
+    'STORAGE': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': BASE_DIR / 'media' / 'product_images',
+            'base_url': '/media/product_images/',
+        },
+    } if PRODUCT_IMAGES_LOCAL else {
+        'BACKEND': 'cloudinary_storage.storage.MediaCloudinaryStorage',
+    },
+    # a `manage.py process_product_images --loop` worker is running, otherwise the upload request renders the variants
+    'WORKER': config('PRODUCT_IMAGES_WORKER', default=False, cast=bool),
+    # bounding boxes in pixels, images keep their aspect ratio and are never enlarged
+    'VARIANTS': {
+        'thumbnail': (160, 160),
+        'card': (480, 480),
+        'detail': (1200, 1200),
+    },
+    'QUALITY': 80,
+}
+
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
 }
 
+# build product and category lists from .values() rows instead of the serializers, see products/fastlist.py
+FAST_LIST_RENDERING = config('FAST_LIST_RENDERING', default=False, cast=bool)
+
+# users behind JWTs are resolved from a short-lived cache instead of a query per request, see users/authentication.py
+JWT_USER_CACHE = {
+    'MAX_SIZE': 10000,
+    # seconds another process may keep serving a user after a change, this process forgets it at once
+    'TTL': 30,
+    # Django cache alias shared by every process, consulted before the database
+    'SHARED_CACHE_ALIAS': config('JWT_USER_CACHE_ALIAS', default=None),
+    'SHARED_TTL': 300,
+}
+
 
 SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('JWT',),
@@ -217,12 +321,38 @@ SWAGGER_SETTINGS = {
     }
 }
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# mail is queued in the database with the request, see api/mail.py
+EMAIL_BACKEND = 'api.mail.OutboxEmailBackend'
+EMAIL_OUTBOX = {
+    # a `manage.py send_outbox --loop` worker is running, otherwise each request delivers its own mail once it commits
+    'WORKER': config('EMAIL_OUTBOX_WORKER', default=False, cast=bool),
+    # bearer token of the scheduled retry drain at /api/outbox/drain (vercel.json crons), the endpoint is off without it
+    'CRON_SECRET': config('CRON_SECRET', default=''),
+    # seconds one drain request may spend sending
+    'DRAIN_SECONDS': 20,
+}
 EMAIL_HOST = config('EMAIL_HOST')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool)
 EMAIL_PORT = config('EMAIL_PORT')
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=10, cast=int)
 
 BACKEND_URL = config('BACKEND_URL')
-FRONTEND_URL = config('FRONTEND_URL')
\ No newline at end of file
+FRONTEND_URL = config('FRONTEND_URL')
+
+# SSLCommerz gateway, see orders/payments.py
+SSLCOMMERZ = {
+    'STORE_ID': config('SSLCOMMERZ_STORE_ID'),
+    'STORE_PASS': config('SSLCOMMERZ_STORE_PASS'),
+    'SANDBOX': config('SSLCOMMERZ_SANDBOX', default=True, cast=bool),
+    # overrides the sandbox/live URL, e.g. http://127.0.0.1:8021 for `manage.py payment_gateway_stub`
+    'BASE_URL': config('SSLCOMMERZ_BASE_URL', default=''),
+    # (connect, read) seconds
+    'TIMEOUT': (3.05, 10),
+    'RETRIES': 2,
+    'BACKOFF': 0.5,
+    'POOL_SIZE': 20,
+}
+# target for a cold start, importing Phi_Mart/wsgi.py and serving the first request, see `manage.py profile_startup`
+STARTUP_BUDGET_MS = config('STARTUP_BUDGET_MS', default=1000, cast=int)
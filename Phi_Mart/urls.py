@@ -16,38 +16,23 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from debug_toolbar.toolbar import debug_toolbar_urls
 from .views import api_root_view
+from .docs import docs_view
 from django.conf.urls.static import static
 from django.conf import settings
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-from rest_framework import permissions
 
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Phi_Mart Rest Api",
-        default_version='v1',
-        description="Api documentation for Phi_Mart",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="contact@snippets.local"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
-
 urlpatterns = [
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0),
-         name='schema-json'),
-    path('swagger/', schema_view.with_ui('swagger',
-         cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc',
-         cache_timeout=0), name='schema-redoc'),
+    path('swagger<format>/', docs_view(), name='schema-json'),
+    path('swagger/', docs_view('swagger'), name='schema-swagger-ui'),
+    path('redoc/', docs_view('redoc'), name='schema-redoc'),
     path('admin/', admin.site.urls),
     path('', api_root_view),
     path('api-auth/', include('rest_framework.urls')), 
     path('api/', include('api.urls'), name='api-root'), 
     
-] + debug_toolbar_urls() + static(settings.MEDIA_URL, document_root = settings.MEDIA_ROOT)
+] + static(settings.MEDIA_URL, document_root = settings.MEDIA_ROOT)
+
+if settings.DEBUG_TOOLBAR: 
+    from debug_toolbar.toolbar import debug_toolbar_urls
+    urlpatterns += debug_toolbar_urls()
@@ -1 +1,9 @@
+from django.contrib import admin
+from api.models import OutboxEmail
 
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin): 
+    list_display = ['subject', 'from_email', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status']
+    exclude = ['message']
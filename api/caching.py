@@ -0,0 +1,24 @@
+"""
+Caches shared between processes.
+
+The catalog version (products/cache.py), read-your-writes pins
+(api/replicas.py) and the shared tier of the JWT user cache only work
+when every worker and every serverless instance sees the same cache.
+settings.CACHES['shared'] is such a cache: Redis, or a table in the
+database created by `migrate`. A process-local backend would silently
+give every process its own copy, so the features check `is_shared()` and
+switch themselves off, or refuse to start, when pointed at one.
+"""
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+# DatabaseCache queries its table as a model of this app label
+DATABASE_CACHE_APP_LABEL = 'django_cache'
+
+
+def is_shared(alias):
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
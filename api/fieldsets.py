@@ -0,0 +1,120 @@
+"""
+Sparse fieldsets for read endpoints.
+
+`?fields=id,name,price` renders only the listed top-level fields, and
+`?expand=category` swaps a related id for the nested object. Unknown
+names are answered with a 400 that lists the valid ones. The rendered
+field set also plans the query: only the columns those fields read are
+loaded, and relations are joined or prefetched only when a rendered field
+walks them.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def requested_fieldset(request):
+    """ (fields, expand) asked for by a read request, fields is None when the client did not narrow them """
+    if request is None or request.method not in SAFE_METHODS:
+        return None, set()
+
+    def names(param):
+        return {name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()}
+
+    return names(FIELDS_PARAM) or None, names(EXPAND_PARAM)
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Narrow and expand the serializer's fields from the request in its context.
+    Only the top-level serializer of a response is narrowed, nested ones render in full.
+    """
+    # field name -> serializer class rendered in its place on ?expand=
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, expand = requested_fieldset(self.context.get('request'))
+        errors = {}
+        unknown_expand = expand - set(self.expandable_fields)
+        if unknown_expand:
+            errors[EXPAND_PARAM] = [self.unknown_names(unknown_expand, self.expandable_fields)]
+        unknown_fields = (fields or set()) - set(self.fields) - set(self.expandable_fields)
+        if unknown_fields:
+            errors[FIELDS_PARAM] = [self.unknown_names(unknown_fields, self.fields)]
+        if errors:
+            raise serializers.ValidationError(errors)
+        for name in expand & set(self.expandable_fields):
+            self.fields[name] = self.expandable_fields[name](read_only=True)
+        if fields is not None:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
+
+    @staticmethod
+    def unknown_names(unknown, valid):
+        return f"Unknown: {', '.join(sorted(unknown))}. Valid: {', '.join(valid) or 'none'}."
+
+
+def plan_fieldset(serializer, model, prefix=''):
+    """
+    Return (columns, select_related, prefetch_related) needed to render `serializer` for `model`.
+    Fields that are not model fields can name what they read in the serializer's `field_sources`,
+    e.g. {'price_with_tax': ['price'], 'total': ['items__product']}.
+    """
+    columns, select, prefetch = {model._meta.pk.name}, set(), set()
+    field_sources = getattr(serializer, 'field_sources', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        nested = nested if isinstance(nested, serializers.BaseSerializer) else None
+        for source in field_sources.get(name, [field.source]):
+            attribute, _, rest = source.partition('__')
+            try:
+                model_field = model._meta.get_field(attribute)
+            except FieldDoesNotExist:
+                continue
+            if not model_field.is_relation:
+                columns.add(attribute)
+                continue
+            path = prefix + source
+            if model_field.many_to_one or (model_field.one_to_one and model_field.concrete):
+                columns.add(attribute)
+                if not nested and not rest:
+                    # only the id is rendered, the column alone is enough
+                    continue
+                if prefix or rest:
+                    prefetch.add(path)
+                else:
+                    select.add(path)
+            else:
+                prefetch.add(path)
+            if nested is not None and not rest:
+                _, nested_select, nested_prefetch = plan_fieldset(nested, model_field.related_model, f'{path}__')
+                prefetch |= nested_select | nested_prefetch
+    return columns, select, prefetch
+
+
+class SparseFieldsetMixin:
+    """ Load only what the rendered fields read, see plan_fieldset """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS or not hasattr(queryset, 'model'):
+            return queryset
+        columns, select, prefetch = plan_fieldset(self.get_serializer(), queryset.model)
+        # the paginator reads the ordering columns of the first and last rows for its cursors
+        ordering = [*queryset.query.order_by, *(getattr(self.paginator, 'page_ordering', None) or [])]
+        for key in ordering:
+            if isinstance(key, str) and '__' not in key:
+                try:
+                    columns.add(queryset.model._meta.get_field(key.lstrip('-')).name)
+                except FieldDoesNotExist:
+                    pass
+        queryset = queryset.only(*columns).prefetch_related(*prefetch)
+        # select_related() without arguments would follow every foreign key
+        return queryset.select_related(*select) if select else queryset
@@ -0,0 +1,209 @@
+"""
+Transactional email outbox.
+
+OutboxEmailBackend is the EMAIL_BACKEND: sending a message stores it as
+an OutboxEmail row, in the same transaction as the request that sent it,
+so a rolled back request sends no mail. OutboxWorker delivers queued rows
+over one reused SMTP connection and retries failures with exponential
+backoff. Who runs it depends on settings.EMAIL_OUTBOX:
+- with a worker (`manage.py send_outbox --loop`), requests never wait on
+  SMTP and the worker drains the outbox in batches
+- without one, the default and the case on Vercel, the request delivers
+  its own messages once its transaction commits, as a plain SMTP backend
+  would. Messages that fail stay queued, and the scheduled drain at
+  /api/outbox/drain (vercel.json crons) retries them
+"""
+
+import email.policy
+import logging
+import smtplib
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.utils import timezone
+from api.models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WORKER': False,
+    'CRON_SECRET': '',
+    'DRAIN_SECONDS': 20,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_OUTBOX', {})}
+
+
+class SMTPUnavailable(Exception):
+    """ No connection to the mail server could be opened, nothing is wrong with the messages """
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        # only used to address messages the way it would when sending, it never connects here
+        smtp = SMTPBackend(fail_silently=self.fail_silently)
+        rows = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            rows.append(OutboxEmail(
+                from_email=smtp.prep_address(message.from_email),
+                recipients=[smtp.prep_address(address) for address in message.recipients()],
+                subject=str(message.subject)[:255],
+                message=message.message(policy=email.policy.SMTP).as_bytes(),
+            ))
+        OutboxEmail.objects.bulk_create(rows)
+        if rows and not get_config()['WORKER']:
+            ids = [row.pk for row in rows]
+            transaction.on_commit(lambda: deliver_queued(ids), using=DEFAULT_DB_ALIAS)
+        return len(rows)
+
+
+def deliver_queued(ids):
+    """ Deliver the given queued messages now, failures are left queued for a retry """
+    worker = OutboxWorker(batch_size=len(ids))
+    try:
+        worker.run_batch(ids)
+    except SMTPUnavailable as error:
+        logger.warning("Outbox delivery deferred: %s", error)
+    finally:
+        worker.close()
+    return worker.stats
+
+
+def drain(seconds):
+    """ Deliver due messages batch by batch for up to `seconds`, returns the worker's counters """
+    worker = OutboxWorker()
+    deadline = time.monotonic() + seconds
+    try:
+        while time.monotonic() < deadline and worker.run_batch():
+            pass
+    except SMTPUnavailable as error:
+        logger.warning("Outbox drain stopped: %s", error)
+    finally:
+        worker.close()
+    return worker.stats
+
+
+class OutboxWorker:
+    """ Deliver due outbox messages in batches, keeping counters for the summary """
+
+    def __init__(self, batch_size=50, max_attempts=5, backoff=30, max_backoff=3600, lease=300):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # claimed messages are hidden from other workers for this many seconds
+        self.lease = lease
+        self.smtp = SMTPBackend()
+        self.stats = {'batches': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'connections': 0, 'seconds': 0.0}
+
+    def claim(self, ids=None):
+        now = timezone.now()
+        with transaction.atomic():
+            due = OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+                status=OutboxEmail.QUEUED, next_attempt_at__lte=now)
+            if ids is not None:
+                due = due.filter(pk__in=ids)
+            batch = list(due.order_by('next_attempt_at', 'pk')[:self.batch_size])
+            if batch:
+                OutboxEmail.objects.filter(pk__in=[message.pk for message in batch]).update(
+                    next_attempt_at=now + timedelta(seconds=self.lease))
+        return batch
+
+    def run_batch(self, ids=None):
+        """
+        Deliver one batch of due messages, or of those among `ids`, returns how many it held.
+        Raises SMTPUnavailable after recording progress
+        """
+        batch = self.claim(ids)
+        if not batch:
+            return 0
+        start = time.perf_counter()
+        sent, failed, unavailable = [], [], None
+        for index, message in enumerate(batch):
+            try:
+                error = self.deliver(message)
+            except SMTPUnavailable as error:
+                unavailable = error
+                # the rest of the batch was never tried, so it does not use up attempts
+                OutboxEmail.objects.filter(pk__in=[message.pk for message in batch[index:]]).update(
+                    next_attempt_at=timezone.now() + timedelta(seconds=self.backoff))
+                break
+            if error is None:
+                sent.append(message.pk)
+            else:
+                failed.append((message, error))
+
+        if sent:
+            OutboxEmail.objects.filter(pk__in=sent).update(
+                status=OutboxEmail.SENT, sent_at=Now(), attempts=F('attempts') + 1, last_error='')
+        for message, error in failed:
+            self.schedule_retry(message, error)
+        if failed:
+            OutboxEmail.objects.bulk_update(
+                [message for message, _ in failed], ['status', 'attempts', 'next_attempt_at', 'last_error'])
+
+        self.stats['batches'] += 1
+        self.stats['sent'] += len(sent)
+        self.stats['seconds'] += time.perf_counter() - start
+        if unavailable is not None:
+            raise unavailable
+        return len(batch)
+
+    def deliver(self, message):
+        """ Send one message over the shared connection, returns None or the error """
+        for reconnect in (False, True):
+            if reconnect or self.smtp.connection is None:
+                self.connect()
+            try:
+                self.smtp.connection.sendmail(message.from_email, message.recipients, bytes(message.message))
+                return None
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused) as error:
+                # the server answered, the connection is still good
+                return error
+            except (smtplib.SMTPException, OSError) as error:
+                # a dropped connection gets one fresh one before the message counts as failed
+                if reconnect:
+                    self.close()
+                    return error
+
+    def connect(self):
+        self.close()
+        try:
+            self.smtp.open()
+        except (smtplib.SMTPException, OSError) as error:
+            self.close()
+            raise SMTPUnavailable(f"Can not connect to {self.smtp.host}:{self.smtp.port}: {error!r}") from error
+        self.stats['connections'] += 1
+
+    def schedule_retry(self, message, error):
+        message.attempts += 1
+        message.last_error = repr(error)[:1000]
+        if self.is_permanent(error) or message.attempts >= self.max_attempts:
+            message.status = OutboxEmail.FAILED
+            self.stats['failed'] += 1
+        else:
+            delay = min(self.backoff * 2 ** (message.attempts - 1), self.max_backoff)
+            message.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+            self.stats['retried'] += 1
+
+    @staticmethod
+    def is_permanent(error):
+        """ 5xx answers will not change on a retry """
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return all(code >= 500 for code, _ in error.recipients.values())
+        return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+    def close(self):
+        try:
+            self.smtp.close()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.connection = None
@@ -0,0 +1,187 @@
+import json
+import math
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from api.management.commands.seed_benchmark_data import EMAIL_DOMAIN
+from api.profiling import RequestProfile
+from orders.models import Cart, Order, OrderItem
+from products.models import Category, Product, ProductImage, Review
+from users.models import User
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the API routes with Django's test client against the data from `seed_benchmark_data` and report "
+        "p50/p95/p99 latency, throughput and queries per request for each endpoint. --output writes the results "
+        "as JSON, --baseline compares them with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Measured requests per endpoint")
+        parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per endpoint first")
+        parser.add_argument('--concurrency', type=int, default=1, help="Client threads per endpoint")
+        parser.add_argument('--endpoints', help="Comma separated endpoint names, all by default")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        user = (
+            User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}', cart__isnull=False, orders__isnull=False)
+            .order_by('pk').first()
+        )
+        product = Product.objects.filter(category__name__startswith='Benchmark ').order_by('-review_count').first()
+        if user is None or product is None:
+            raise CommandError("No benchmark data, run `manage.py seed_benchmark_data` first")
+
+        endpoints = self.endpoints(user, product)
+        if options['endpoints']:
+            wanted = {name.strip() for name in options['endpoints'].split(',')}
+            unknown = wanted - {name for name, *_ in endpoints}
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = [endpoint for endpoint in endpoints if endpoint[0] in wanted]
+        if settings.DEBUG:
+            self.stderr.write("DEBUG is on, debug_toolbar and query logging make the numbers pessimistic")
+
+        headers = {'HTTP_AUTHORIZATION': f'JWT {AccessToken.for_user(user)}'}
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, path, authenticated in endpoints:
+                results[name] = self.measure(path, headers if authenticated else {}, options)
+                self.stdout.write(self.format_row(name, results[name]))
+
+        report = {'meta': self.meta(options), 'endpoints': results}
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['baseline']:
+            self.compare(options['baseline'], results)
+
+    def endpoints(self, user, product):
+        """ (name, path, authenticated), catalog reads run signed in too, anonymous ones are served from the catalog cache """
+        order = Order.objects.filter(user=user).order_by('-created_at').first()
+        product_ids = ','.join(str(pk) for pk in Product.objects.order_by('pk').values_list('pk', flat=True)[:50])
+        search_term = product.name.split()[0].lower()
+        return [
+            ('products-list', reverse('products-list'), True),
+            ('products-list-anonymous', reverse('products-list'), False),
+            ('products-list-sparse', reverse('products-list') + '?fields=id,name,price', True),
+            ('products-search', reverse('products-list') + f'?search={search_term}', True),
+            ('product-detail', reverse('products-detail', args=[product.pk]), True),
+            ('categories-list', reverse('category-list'), True),
+            ('product-reviews', reverse('product-review-list', args=[product.pk]), True),
+            ('product-images', reverse('product-images-list', args=[product.pk]), True),
+            ('cart-detail', reverse('carts-detail', args=[user.cart.pk]), True),
+            ('orders-list', reverse('orders-list'), True),
+            ('order-detail', reverse('orders-detail', args=[order.pk]), True),
+            ('has-ordered-products', reverse('has-ordered-products') + f'?product_ids={product_ids}', True),
+            ('current-user', reverse('user-me'), True),
+        ]
+
+    def measure(self, path, headers, options):
+        for _ in range(options['warmup']):
+            Client().get(path, **headers)
+
+        def run(count):
+            client = Client()
+            samples = []
+            try:
+                for _ in range(count):
+                    profile = RequestProfile()
+                    start = time.perf_counter()
+                    with ExitStack() as stack:
+                        # every alias, so reads routed to replicas are counted too
+                        for alias in connections:
+                            stack.enter_context(connections[alias].execute_wrapper(profile))
+                        response = client.get(path, **headers)
+                    samples.append((time.perf_counter() - start, profile.queries, response.status_code))
+            finally:
+                if options['concurrency'] > 1:
+                    # worker threads open connections of their own
+                    connections.close_all()
+            return samples
+
+        total, concurrency = options['requests'], max(1, options['concurrency'])
+        shares = [total // concurrency + (index < total % concurrency) for index in range(concurrency)]
+        start = time.perf_counter()
+        if concurrency == 1:
+            samples = run(total)
+        else:
+            with ThreadPoolExecutor(concurrency) as executor:
+                samples = [sample for part in executor.map(run, shares) for sample in part]
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency * 1000 for latency, _, _ in samples)
+        queries = [count for _, count, _ in samples]
+        return {
+            'path': path,
+            'requests': len(samples),
+            'errors': sum(status >= 400 for _, _, status in samples),
+            'p50_ms': round(self.percentile(latencies, 50), 2),
+            'p95_ms': round(self.percentile(latencies, 95), 2),
+            'p99_ms': round(self.percentile(latencies, 99), 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'requests_per_sec': round(len(samples) / elapsed, 1),
+            'queries': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+        }
+
+    @staticmethod
+    def percentile(values, percent):
+        """ Nearest-rank percentile of sorted values """
+        return values[max(0, math.ceil(percent / 100 * len(values)) - 1)]
+
+    def format_row(self, name, result):
+        errors = f", {result['errors']} errors" if result['errors'] else ''
+        return (
+            f"{name:<24} p50 {result['p50_ms']:>7.2f}ms  p95 {result['p95_ms']:>7.2f}ms  p99 {result['p99_ms']:>7.2f}ms  "
+            f"{result['requests_per_sec']:>7.1f} req/s  {result['queries']:>5.1f} queries{errors}"
+        )
+
+    def meta(self, options):
+        return {
+            'commit': current_commit(),
+            'created_at': timezone.now().isoformat(timespec='seconds'),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'volumes': {
+                model._meta.model_name: model.objects.count()
+                for model in (User, Category, Product, ProductImage, Review, Cart, Order, OrderItem)
+            },
+        }
+
+    def compare(self, path, results):
+        with open(path) as file:
+            baseline = json.load(file)['endpoints']
+        self.stdout.write(f"Compared with {path}:")
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                self.stdout.write(f"{name:<24} new")
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+            queries = result['queries'] - before['queries']
+            self.stdout.write(f"{name:<24} p95 {change:+6.1f}%  queries {queries:+.1f}")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from api.replicas import get_query_counts, reset_query_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Report how many queries requests sent to the primary and to each read replica. The counters live "
+        "in the default cache, so this needs a shared backend (file, database, redis) to see the web workers' counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the counters after reporting")
+
+    def handle(self, *args, **options):
+        counts = get_query_counts()
+        total = sum(counts.values())
+        for alias, count in counts.items():
+            share = count / total * 100 if total else 0
+            self.stdout.write(f"{alias:<12} {count:>10} queries  {share:5.1f}%")
+        if options['reset']:
+            reset_query_counts()
+            self.stdout.write("Counters reset")
@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.management.commands.benchmark_api import current_commit
+
+# runs in a fresh interpreter, the way a serverless instance starts: import the WSGI entry point, serve one request
+COLD_START = r'''
+import importlib, io, json, sys, time
+if 'importtime' in sys._xoptions:
+    # -X importtime only sees import statements, Django loads settings, apps and URLconfs with import_module
+    import_module = importlib.import_module
+    def logged_import_module(name, package=None):
+        if name.startswith('.'):
+            return import_module(name, package)
+        __import__(name)
+        return sys.modules[name]
+    importlib.import_module = logged_import_module
+start = time.perf_counter()
+from Phi_Mart.wsgi import app
+loaded = time.perf_counter()
+statuses = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '', 'SERVER_PROTOCOL': 'HTTP/1.1',
+    'SERVER_NAME': '127.0.0.1', 'SERVER_PORT': '80', 'HTTP_HOST': '127.0.0.1', 'REMOTE_ADDR': '127.0.0.1',
+    'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+response = app(environ, lambda status, headers, exc_info=None: statuses.append(int(status.split()[0])))
+b''.join(response)
+response.close()
+done = time.perf_counter()
+print(json.dumps({'import_ms': (loaded - start) * 1000, 'first_request_ms': (done - loaded) * 1000, 'status': statuses[0]}))
+'''
+
+IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold starts of Phi_Mart/wsgi.py in fresh interpreters, importing it and serving a first request, "
+        "against settings.STARTUP_BUDGET_MS, and report the heaviest imports from `python -X importtime`. "
+        "--output writes the results as JSON, --baseline compares them with an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Cold starts to measure, the median is reported")
+        parser.add_argument('--path', default='/api/', help="Path of the first request")
+        parser.add_argument('--top', type=int, default=15, help="Packages and imports to list")
+        parser.add_argument('--budget-ms', type=float, help="Defaults to settings.STARTUP_BUDGET_MS")
+        parser.add_argument('--check', action='store_true', help="Fail when the median is over the budget")
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+
+    def handle(self, *args, **options):
+        budget = options['budget_ms'] or settings.STARTUP_BUDGET_MS
+        runs = [self.cold_start(options['path']) for _ in range(max(1, options['runs']))]
+        if any(run['status'] >= 400 for run in runs):
+            self.stderr.write(f"{options['path']} answered {runs[0]['status']}, pick a path that works without data")
+        # importtime adds its own overhead, so the breakdown comes from a separate run
+        imports = self.import_times(options['path'])
+
+        def median(key):
+            return round(statistics.median(run[key] for run in runs), 1)
+
+        total = [run['import_ms'] + run['first_request_ms'] for run in runs]
+        result = {
+            'cold_start_ms': round(statistics.median(total), 1),
+            'min_ms': round(min(total), 1),
+            'max_ms': round(max(total), 1),
+            'import_ms': median('import_ms'),
+            'first_request_ms': median('first_request_ms'),
+            'process_ms': median('process_ms'),
+            'budget_ms': budget,
+            'packages': self.packages(imports),
+            'imports': self.entry_points(imports)[:options['top']],
+        }
+        self.report(result, len(runs), options['top'])
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'meta': self.meta(options, len(runs)), 'startup': result}, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['baseline']:
+            self.compare(options['baseline'], result, options['top'])
+        if options['check'] and result['cold_start_ms'] > budget:
+            raise CommandError(f"Cold start {result['cold_start_ms']}ms is over the {budget}ms budget")
+
+    def run_child(self, path, *flags):
+        start = time.perf_counter()
+        child = subprocess.run(
+            [sys.executable, *flags, '-c', COLD_START, path],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        elapsed = (time.perf_counter() - start) * 1000
+        if child.returncode:
+            raise CommandError(f"The cold start failed:\n{child.stderr[-2000:]}")
+        return child, elapsed
+
+    def cold_start(self, path):
+        child, elapsed = self.run_child(path)
+        # the last line, settings or apps may print before it
+        run = json.loads(child.stdout.strip().splitlines()[-1])
+        # the whole process, interpreter startup included
+        run['process_ms'] = elapsed
+        return run
+
+    def import_times(self, path):
+        """ Every import of a cold start in the order `-X importtime` lists them, children before their parent """
+        child, _ = self.run_child(path, '-X', 'importtime')
+        project = {path.name for path in settings.BASE_DIR.iterdir() if (path / '__init__.py').exists()}
+        rows = []
+        for line in child.stderr.splitlines():
+            match = IMPORT_TIME.match(line)
+            if match:
+                package = match[4].split('.')[0]
+                rows.append({
+                    'module': match[4], 'package': package, 'first_party': package in project, 'depth': len(match[3]) // 2,
+                    'self_ms': int(match[1]) / 1000, 'cumulative_ms': int(match[2]) / 1000,
+                })
+        # walking backwards every module comes after the one that imported it
+        stack = []
+        for row in reversed(rows):
+            while stack and stack[-1]['depth'] >= row['depth']:
+                stack.pop()
+            row['parent'] = stack[-1] if stack else None
+            stack.append(row)
+
+        for row in rows:
+            # the project module responsible for the import, the one to change to avoid it
+            importer = row['parent']
+            while importer is not None and (not importer['first_party'] or importer['package'] == row['package']):
+                importer = importer['parent']
+            row['importer'] = importer['module'] if importer else None
+        return rows
+
+    def packages(self, rows):
+        """ Own import time per top-level package, with the project module that first imported it """
+        packages = {}
+        for row in rows:
+            package = packages.setdefault(row['package'], {'self_ms': 0.0, 'modules': 0, 'via': row['importer']})
+            package['self_ms'] += row['self_ms']
+            package['modules'] += 1
+        return sorted(
+            ({'package': name, **package, 'self_ms': round(package['self_ms'], 1)} for name, package in packages.items()),
+            key=lambda package: package['self_ms'], reverse=True,
+        )
+
+    def entry_points(self, rows):
+        """ Imports of other packages made by project modules, with everything they import in turn """
+        return sorted(
+            (
+                {'module': row['module'], 'cumulative_ms': round(row['cumulative_ms'], 1), 'by': row['parent']['module']}
+                for row in rows
+                if not row['first_party'] and row['parent'] is not None and row['parent']['first_party']
+            ),
+            key=lambda entry: entry['cumulative_ms'], reverse=True,
+        )
+
+    def report(self, result, runs, top):
+        verdict = 'within' if result['cold_start_ms'] <= result['budget_ms'] else 'OVER'
+        self.stdout.write(
+            f"Cold start, median of {runs}: {result['cold_start_ms']:.1f}ms "
+            f"(import {result['import_ms']:.1f}ms, first request {result['first_request_ms']:.1f}ms), "
+            f"range {result['min_ms']:.1f}-{result['max_ms']:.1f}ms, {verdict} the {result['budget_ms']}ms budget"
+        )
+        self.stdout.write(f"Whole process with interpreter startup: {result['process_ms']:.1f}ms")
+        self.stdout.write("Heaviest packages (own import time):")
+        for package in result['packages'][:top]:
+            self.stdout.write(
+                f"  {package['package']:<28} {package['self_ms']:>7.1f}ms  {package['modules']:>4} modules  via {package['via'] or '-'}"
+            )
+        self.stdout.write("Heaviest imports made by project modules (with everything they import):")
+        for entry in result['imports']:
+            self.stdout.write(f"  {entry['module']:<40} {entry['cumulative_ms']:>7.1f}ms  by {entry['by']}")
+
+    def meta(self, options, runs):
+        return {
+            'commit': current_commit(),
+            'created_at': timezone.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'settings': os.environ.get('DJANGO_SETTINGS_MODULE'),
+            'debug': settings.DEBUG,
+            'debug_toolbar': settings.DEBUG_TOOLBAR,
+            'path': options['path'],
+            'runs': runs,
+        }
+
+    def compare(self, path, result, top):
+        with open(path) as file:
+            baseline = json.load(file)['startup']
+        change = result['cold_start_ms'] - baseline['cold_start_ms']
+        self.stdout.write(
+            f"Compared with {path}: cold start {change:+.1f}ms "
+            f"({change / baseline['cold_start_ms'] * 100 if baseline['cold_start_ms'] else 0.0:+.1f}%)"
+        )
+        before = {package['package']: package['self_ms'] for package in baseline['packages']}
+        after = {package['package']: package['self_ms'] for package in result['packages']}
+        changed = sorted(before.keys() | after.keys(), key=lambda name: -abs(after.get(name, 0) - before.get(name, 0)))
+        for name in changed[:top]:
+            difference = after.get(name, 0) - before.get(name, 0)
+            label = 'gone' if name not in after else 'new' if name not in before else f'{difference:+.1f}ms'
+            self.stdout.write(f"  {name:<28} {label}")
@@ -0,0 +1,154 @@
+import random
+import time
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from orders.models import Cart, CartItem, Order, OrderItem
+from products.models import Category, Product, ProductImage, Review
+from users.models import User
+
+# every generated user has an address here, and every generated category this prefix, see --clear
+EMAIL_DOMAIN = 'bench.phimart.test'
+CATEGORY_PREFIX = 'Benchmark'
+
+WORDS = [
+    'steel', 'cotton', 'wireless', 'classic', 'portable', 'organic', 'leather', 'smart', 'compact', 'vintage',
+    'ceramic', 'bamboo', 'waterproof', 'premium', 'handmade', 'digital', 'ergonomic', 'lightweight', 'solar', 'wooden',
+]
+NOUNS = ['lamp', 'jacket', 'speaker', 'kettle', 'backpack', 'watch', 'chair', 'mug', 'headphones', 'notebook']
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, categories, products, images, reviews, carts and orders "
+        "for `benchmark_api`, using bulk inserts. Works on SQLite and PostgreSQL. --clear removes a previous run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--images', type=int, default=3, help="Up to this many images per product")
+        parser.add_argument('--reviews', type=int, default=20000)
+        parser.add_argument('--carts', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--items', type=int, default=4, help="Up to this many lines per cart and per order")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help="Only remove previously generated data")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            self.clear()
+            if options['clear']:
+                self.stdout.write("Removed the generated benchmark data")
+                return
+            users = self.step('users', self.users, options['users'])
+            categories = self.step('categories', self.categories, options['categories'])
+            products = self.step('products', self.products, options['products'], categories)
+            self.step('images', self.images, products, options['images'])
+            self.step('reviews', self.reviews, options['reviews'], products, users)
+            self.step('carts', self.carts, users[:options['carts']], products, options['items'])
+            self.step('orders', self.orders, options['orders'], users, products, options['items'])
+
+    def step(self, name, generate, *args):
+        start = time.perf_counter()
+        created = generate(*args)
+        elapsed = time.perf_counter() - start
+        count = created if isinstance(created, int) else len(created)
+        self.stdout.write(f"{name:<10} {count:>8} rows in {elapsed:6.2f}s ({count / max(elapsed, 1e-9):,.0f} rows/sec)")
+        return created
+
+    def clear(self):
+        Order.objects.filter(user__email__endswith=f'@{EMAIL_DOMAIN}').delete()
+        User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+        Product.objects.filter(category__name__startswith=f'{CATEGORY_PREFIX} ').delete()
+        Category.objects.filter(name__startswith=f'{CATEGORY_PREFIX} ').delete()
+
+    def create(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def users(self, count):
+        # hashing is deliberately slow, one hash serves every generated user
+        password = make_password('benchmark')
+        return self.create(User, [
+            User(email=f'user{index}@{EMAIL_DOMAIN}', password=password, first_name=f'User{index}',
+                 last_name='Benchmark', address=f'{index} Benchmark Road', phone_number='01700000000')
+            for index in range(count)
+        ])
+
+    def categories(self, count):
+        return self.create(Category, [
+            Category(name=f'{CATEGORY_PREFIX} {index}', description=' '.join(self.rng.choices(WORDS, k=12)))
+            for index in range(count)
+        ])
+
+    def products(self, count, categories):
+        rng = self.rng
+        return self.create(Product, [
+            Product(
+                name=f'{rng.choice(WORDS).title()} {rng.choice(NOUNS)} {index}',
+                description=' '.join(rng.choices(WORDS + NOUNS, k=40)),
+                price=Decimal(rng.randint(100, 500_000)) / 100,
+                stock=rng.randint(0, 1000),
+                category=rng.choice(categories),
+            )
+            for index in range(count)
+        ])
+
+    def images(self, products, per_product):
+        # stored names only, the benchmark renders URLs and never reads the files
+        images = []
+        for product in products:
+            for index in range(self.rng.randint(0, per_product)):
+                stem = f'bench/{product.pk}-{index}'
+                images.append(ProductImage(
+                    product=product, original=f'originals/{stem}.jpg', status=ProductImage.READY,
+                    variants={variant: {'webp': f'variants/{stem}-{variant}.webp', 'jpeg': f'variants/{stem}-{variant}.jpg'}
+                              for variant in ('thumbnail', 'card', 'detail')},
+                ))
+        return self.create(ProductImage, images)
+
+    def reviews(self, count, products, users):
+        if not users:
+            return 0
+        rng = self.rng
+        # a few products get most of the reviews, like a real catalog
+        weights = [1 / (rank + 1) for rank in range(len(products))]
+        reviews = self.create(Review, [
+            Review(product=product, user=rng.choice(users), ratings=rng.choices([1, 2, 3, 4, 5], [1, 1, 2, 4, 6])[0],
+                   comment=' '.join(rng.choices(WORDS, k=rng.randint(5, 30))))
+            for product in rng.choices(products, weights, k=count)
+        ])
+        # bulk inserts skip the signals that keep the stored rating aggregates in step
+        Product.refresh_rating_aggregates({review.product_id for review in reviews})
+        return reviews
+
+    def carts(self, users, products, max_items):
+        carts = self.create(Cart, [Cart(user=user) for user in users])
+        self.create(CartItem, [
+            CartItem(cart=cart, product=product, quantity=self.rng.randint(1, 5))
+            for cart in carts for product in self.rng.sample(products, min(len(products), self.rng.randint(1, max_items)))
+        ])
+        return carts
+
+    def orders(self, count, users, products, max_items):
+        if not users:
+            return 0
+        rng = self.rng
+        statuses = [*Order.STATUS_FLOW, Order.CANCELED]
+        orders, items = [], []
+        for _ in range(count):
+            order = Order(user=rng.choice(users), status=rng.choice(statuses), total_price=0)
+            for product in rng.sample(products, min(len(products), rng.randint(1, max_items))):
+                quantity = rng.randint(1, 3)
+                items.append(OrderItem(order=order, product=product, quantity=quantity, price=product.price,
+                                       total_price=product.price * quantity))
+                order.total_price += product.price * quantity
+            orders.append(order)
+        self.create(Order, orders)
+        self.create(OrderItem, items)
+        return orders
@@ -0,0 +1,51 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from api.mail import OutboxWorker, SMTPUnavailable
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued outbox email over one reused SMTP connection, in batches, retrying failures "
+        "with exponential backoff. Drains what is due and exits, or keeps polling with --loop. "
+        "Prints a delivery summary at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=5, help="Give a message up after this many failed sends")
+        parser.add_argument('--backoff', type=float, default=30, help="Seconds before the first retry, doubled on each one after")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new messages until interrupted")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between polls of an empty outbox with --loop")
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(
+            batch_size=options['batch_size'], max_attempts=options['max_attempts'], backoff=options['backoff'])
+        try:
+            while True:
+                try:
+                    claimed = worker.run_batch()
+                except SMTPUnavailable as error:
+                    if not options['loop']:
+                        raise CommandError(f"{error}, {self.summary(worker)}")
+                    self.stderr.write(str(error))
+                    claimed = 0
+                if not claimed:
+                    # do not hold an idle connection open between polls
+                    worker.close()
+                    if not options['loop']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            worker.close()
+        self.stdout.write(self.summary(worker))
+
+    def summary(self, worker):
+        stats = worker.stats
+        rate = stats['sent'] / stats['seconds'] if stats['seconds'] else 0
+        return (
+            f"{stats['sent']} sent, {stats['retried']} to retry, {stats['failed']} failed "
+            f"in {stats['batches']} batches over {stats['connections']} SMTP connections, "
+            f"{stats['seconds']:.2f}s sending ({rate:.0f} messages/sec)"
+        )
@@ -0,0 +1,120 @@
+import random
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+from django.core.management.base import BaseCommand
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """ Just enough SMTP for smtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT """
+    stub = None
+
+    def reply(self, *lines):
+        self.wfile.write(''.join(f'{line}\r\n' for line in lines).encode())
+
+    def read_data(self):
+        lines = []
+        for line in self.rfile:
+            if line == b'.\r\n':
+                return b''.join(lines)
+            # undo dot-stuffing
+            lines.append(line[1:] if line.startswith(b'..') else line)
+        return None
+
+    def handle(self):
+        self.stub.count('connections')
+        self.reply('220 phimart-stub ESMTP')
+        sender, recipients = None, []
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            verb = line.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                self.reply('250-phimart-stub', '250-8BITMIME', '250-SMTPUTF8', '250 AUTH PLAIN')
+            elif verb == 'HELO':
+                self.reply('250 phimart-stub')
+            elif verb == 'AUTH':
+                self.reply('235 Authentication successful')
+            elif verb == 'MAIL':
+                sender, recipients = line[10:], []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(line[8:])
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = self.read_data()
+                if data is None:
+                    return
+                self.reply(self.stub.accept(sender, recipients, data))
+                sender, recipients = None, []
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class StubMailServer:
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=None, stdout=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.stdout = stdout
+        self.lock = threading.Lock()
+        self.counts = {'connections': 0, 'messages': 0, 'deferred': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def accept(self, sender, recipients, data):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.random.random() < self.fail_rate:
+            self.count('deferred')
+            return '451 Stub deferral, try again later'
+        self.count('messages')
+        if self.stdout is not None:
+            subject = message_from_bytes(data).get('Subject', '')
+            self.stdout.write(f"{sender} -> {', '.join(recipients)}: {subject}")
+        return '250 OK queued'
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local SMTP stand-in that accepts every message without delivering it, for tests and load "
+        "runs of `send_outbox`. Point EMAIL_HOST/EMAIL_PORT at it with EMAIL_USE_TLS=False."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8025)
+        parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before accepting each message")
+        parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of messages deferred with a 451")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--quiet', action='store_true', help="Do not print every message")
+
+    def handle(self, *args, **options):
+        stub = StubMailServer(
+            options['latency'], options['fail_rate'], options['seed'], None if options['quiet'] else self.stdout)
+        handler = type('StubSMTPHandler', (SMTPHandler,), {'stub': stub})
+        server = StubSMTPServer((options['host'], options['port']), handler)
+        self.stdout.write(f"SMTP stand-in on {options['host']}:{options['port']}, Ctrl-C to stop")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(", ".join(f"{count} {name}" for name, count in stub.counts.items()))
@@ -1,3 +1,34 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class OutboxEmail(models.Model): 
+    """ A message accepted by api.mail.OutboxEmailBackend, waiting for delivery by api.mail.OutboxWorker """
+    QUEUED = 'Queued'
+    SENT = 'Sent'
+    FAILED = 'Failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'), 
+        (SENT, 'Sent'), 
+        (FAILED, 'Failed'), 
+    ]
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    subject = models.CharField(max_length=255, blank=True)
+    # the complete MIME message, exactly as the SMTP backend would have sent it
+    message = models.BinaryField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta: 
+        indexes = [
+            # the worker takes due queued messages oldest first
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_due_idx'), 
+        ]
+    
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
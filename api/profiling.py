@@ -0,0 +1,154 @@
+"""
+Sampled request profiling for production.
+
+RequestProfilingMiddleware profiles a random sample of requests. For each
+one it records the DRF view and action, the query count, total database
+time, time spent serializing and the response size. The figures go to the
+`api.profiling` logger. Staff users also get them in a Server-Timing
+header, everyone else only with SERVER_TIMING on, since query counts and
+database time tell outsiders too much. Requests over the query or latency
+budget are logged as warnings, so N+1 regressions show up without
+debug_toolbar. Queries are counted with connection execute wrappers,
+which also work with DEBUG off. Configured by settings.REQUEST_PROFILING.
+"""
+
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SAMPLE_RATE': 0.0,
+    'QUERY_BUDGET': 25,
+    'LATENCY_BUDGET_MS': 500,
+    'SERVER_TIMING': False,
+}
+
+_current = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.spans = {}
+        self.active = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        """ Database execute wrapper, times every query of the request """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+@contextmanager
+def span(name):
+    """ Add the time spent in the block to `name` of the current profile, nested blocks of the same name count once """
+    profile = _current.get()
+    if profile is None or name in profile.active:
+        yield
+        return
+    profile.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.active.discard(name)
+        profile.spans[name] = profile.spans.get(name, 0.0) + time.perf_counter() - start
+
+
+def install_serializer_timing():
+    """ Time every top-level serializer `.data` of profiled requests as the `serialize` span """
+    data = serializers.BaseSerializer.data
+    if getattr(data.fget, 'profiled', False):
+        return
+
+    def profiled_data(self):
+        with span('serialize'):
+            return data.fget(self)
+    profiled_data.profiled = True
+    serializers.BaseSerializer.data = property(profiled_data)
+
+
+def view_label(view_func, request):
+    """ "ProductViewSet.list", or the view's name for plain views """
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', repr(view_func))
+    action = (getattr(view_func, 'actions', None) or {}).get(request.method.lower())
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+class RequestProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = {**DEFAULTS, **getattr(settings, 'REQUEST_PROFILING', {})}
+        if not self.config['SAMPLE_RATE']:
+            raise MiddlewareNotUsed
+        install_serializer_timing()
+
+    def __call__(self, request):
+        if random.random() >= self.config['SAMPLE_RATE']:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.report(request, response, profile, time.perf_counter() - start)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = _current.get()
+        if profile is not None:
+            profile.view = view_label(view_func, request)
+
+    def report(self, request, response, profile, elapsed):
+        # a streamed body is produced after the response leaves here, its size and queries are not known
+        size = None if response.streaming else len(response.content)
+        record = {
+            'view': profile.view or request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': profile.queries,
+            'db_ms': round(profile.db_time * 1000, 1),
+            'serialize_ms': round(profile.spans.get('serialize', 0.0) * 1000, 1),
+            'total_ms': round(elapsed * 1000, 1),
+            'response_bytes': size,
+        }
+        # DRF hands the user it authenticated down to the Django request
+        user = getattr(request, 'user', None)
+        if self.config['SERVER_TIMING'] or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={record["db_ms"]};desc="{profile.queries} queries"',
+                f'serialize;dur={record["serialize_ms"]}',
+                f'total;dur={record["total_ms"]}',
+            ])
+
+        over = []
+        if profile.queries > self.config['QUERY_BUDGET']:
+            over.append(f"{profile.queries} queries > {self.config['QUERY_BUDGET']}")
+        if record['total_ms'] > self.config['LATENCY_BUDGET_MS']:
+            over.append(f"{record['total_ms']}ms > {self.config['LATENCY_BUDGET_MS']}ms")
+        message = "%(method)s %(view)s %(status)s: %(queries)s queries, db %(db_ms)sms, serialize %(serialize_ms)sms, total %(total_ms)sms, %(response_bytes)s bytes"
+        if over:
+            logger.warning(f"Over budget ({', '.join(over)}) {message}", record, extra={'profile': record})
+        else:
+            logger.info(message, record, extra={'profile': record})
@@ -0,0 +1,181 @@
+"""
+Read replica routing.
+
+ReplicaRoutingMiddleware routes each request. Safe-method requests
+(GET, HEAD, OPTIONS) read from one of settings.DATABASE_REPLICAS, and
+everything else uses `default`. Once a request writes, the rest of it
+reads from `default` too. The client that wrote is pinned to `default`
+for REPLICA_PIN_SECONDS, so it reads its own cart and order changes even
+while the replicas lag behind. Clients are told apart by their
+Authorization header or session cookie. Outside requests (commands,
+shell, workers) every query goes to `default`.
+
+The pin has to be seen by whichever process serves the client's next
+request, so it is kept in settings.REPLICA_CACHE_ALIAS and the middleware
+refuses to start when that cache is process-local (api/caching.py).
+
+Reads whose result is cached and served to other clients go to default:
+the catalog response cache fills inside use_primary(), the JWT user cache
+and the purchased products cache (orders/cache.py) load with 'default'.
+A lagging replica would otherwise put rows older than the cache's version
+under the new version.
+
+The middleware also counts queries per alias in the default cache, and
+`manage.py db_routing_stats` reports them. For tests, replicas can mirror
+`default` ('TEST': {'MIRROR': 'default'}) or be a copy of the SQLite file.
+"""
+
+import hashlib
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+from api.caching import DATABASE_CACHE_APP_LABEL, is_shared
+
+PIN_KEY = 'db:pin:{client}'
+QUERIES_KEY = 'db:queries:{alias}'
+
+_state = ContextVar('replica_routing', default=None)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def get_pin_alias():
+    return getattr(settings, 'REPLICA_CACHE_ALIAS', 'default')
+
+
+@contextmanager
+def use_primary():
+    """ Read from default inside the block, for reads whose result is cached and served to other clients """
+    state = _state.get()
+    if state is None or state.primary:
+        yield
+        return
+    state.primary = True
+    try:
+        yield
+    finally:
+        # a write inside the block keeps the rest of the request on default
+        state.primary = state.wrote
+
+
+class RoutingState:
+    def __init__(self, primary, replica):
+        # read from default for the rest of the request
+        self.primary = primary
+        self.replica = replica
+        self.wrote = False
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.primary or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # a database cache holds versions and pins, read stale they would serve stale data
+        if model._meta.app_label == DATABASE_CACHE_APP_LABEL:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == DATABASE_CACHE_APP_LABEL:
+            # filling a cache is not a write of the client's data
+            return DEFAULT_DB_ALIAS
+        state = _state.get()
+        if state is not None:
+            state.primary = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as default
+        pool = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema through replication
+        return False if db in get_replicas() else None
+
+
+def client_key(request):
+    """ Who is asking, as far as the middleware can tell before authentication runs """
+    credential = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return hashlib.sha256(credential.encode()).hexdigest()[:32] if credential else None
+
+
+class QueryCounter:
+    def __init__(self):
+        self.counts = {}
+
+    def wrapper(self, alias):
+        def count(execute, sql, params, many, context):
+            self.counts[alias] = self.counts.get(alias, 0) + 1
+            return execute(sql, params, many, context)
+        return count
+
+
+def record_queries(counts):
+    for alias, count in counts.items():
+        key = QUERIES_KEY.format(alias=alias)
+        # add() is a no-op when the key exists, incr() then works on every backend
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            cache.set(key, count, timeout=None)
+
+
+def get_query_counts():
+    aliases = [DEFAULT_DB_ALIAS, *get_replicas()]
+    return {alias: cache.get(QUERIES_KEY.format(alias=alias), 0) for alias in aliases}
+
+
+def reset_query_counts():
+    cache.delete_many([QUERIES_KEY.format(alias=alias) for alias in [DEFAULT_DB_ALIAS, *get_replicas()]])
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.replicas = get_replicas()
+        if not self.replicas:
+            raise MiddlewareNotUsed
+        if not is_shared(get_pin_alias()):
+            raise ImproperlyConfigured(
+                f"REPLICA_CACHE_ALIAS '{get_pin_alias()}' is a process-local cache, "
+                "pins set by one process would not keep a client's reads on default in the others"
+            )
+        self.pins = caches[get_pin_alias()]
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def __call__(self, request):
+        client = client_key(request)
+        primary = request.method not in SAFE_METHODS or (client is not None and self.is_pinned(client))
+        state = RoutingState(primary, random.choice(self.replicas))
+        counter = QueryCounter()
+        token = _state.set(state)
+        try:
+            with ExitStack() as stack:
+                for alias in [DEFAULT_DB_ALIAS, *self.replicas]:
+                    stack.enter_context(connections[alias].execute_wrapper(counter.wrapper(alias)))
+                response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and client is not None:
+            self.pins.set(PIN_KEY.format(client=client), time.time() + self.pin_seconds, self.pin_seconds)
+        record_queries(counter.counts)
+        return response
+
+    def is_pinned(self, client):
+        # the pin holds its deadline, the cache timeout only clears it away afterwards
+        deadline = self.pins.get(PIN_KEY.format(client=client))
+        return deadline is not None and deadline > time.time()
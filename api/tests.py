@@ -1,3 +1,276 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import timedelta
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from api.mail import drain
+from api.management.commands.smtp_stub import SMTPHandler, StubMailServer, StubSMTPServer
+from api.management.commands.seed_benchmark_data import EMAIL_DOMAIN
+from api.models import OutboxEmail
+from api.replicas import ReplicaRoutingMiddleware
+from orders.models import Cart
+from products.models import Category, Product
+from rest_framework_simplejwt.tokens import AccessToken
+from users.authentication import get_local_cache
+from users.models import User
 
-# Create your tests here.
+
+class RecordingMailServer(StubMailServer):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.received = []
+
+    def accept(self, sender, recipients, data):
+        reply = super().accept(sender, recipients, data)
+        if reply.startswith('250'):
+            self.received.append((sender, recipients, data))
+        return reply
+
+
+class SMTPServerMixin:
+    """ Runs the `smtp_stub` SMTP stand-in on a free port and points the mail settings at it """
+    fail_rate = 0.0
+
+    def setUp(self):
+        super().setUp()
+        self.mail_server = RecordingMailServer(fail_rate=self.fail_rate)
+        handler = type('RecordingSMTPHandler', (SMTPHandler,), {'stub': self.mail_server})
+        server = StubSMTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        smtp = override_settings(
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.server_address[1], EMAIL_USE_TLS=False,
+            EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        )
+        smtp.enable()
+        self.addCleanup(smtp.disable)
+
+
+@override_settings(EMAIL_BACKEND='api.mail.OutboxEmailBackend', EMAIL_OUTBOX={'WORKER': False})
+class DeliverOnCommitTests(SMTPServerMixin, TestCase):
+    def test_mail_is_sent_once_the_transaction_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            mail.send_mail('Your order', 'It ships tomorrow', 'shop@example.com', ['buyer@example.com'])
+            self.assertEqual(self.mail_server.received, [])
+        self.assertEqual(len(self.mail_server.received), 1)
+        sender, recipients, data = self.mail_server.received[0]
+        self.assertIn('buyer@example.com', recipients[0])
+        self.assertIn(b'Subject: Your order', data)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+
+    def test_rolled_back_mail_is_never_sent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    mail.send_mail('Your order', 'It ships tomorrow', 'shop@example.com', ['buyer@example.com'])
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self.mail_server.received, [])
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_unreachable_server_leaves_the_mail_queued(self):
+        with override_settings(EMAIL_PORT=1), self.assertLogs('api.mail', 'WARNING'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(mail.send_mail('Your order', 'Body', 'shop@example.com', ['buyer@example.com']), 1)
+        message = OutboxEmail.objects.get()
+        self.assertEqual(message.status, OutboxEmail.QUEUED)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+
+@override_settings(EMAIL_BACKEND='api.mail.OutboxEmailBackend', EMAIL_OUTBOX={'WORKER': False})
+class DeferredDeliveryTests(SMTPServerMixin, TestCase):
+    fail_rate = 1.0
+
+    def test_deferred_mail_is_retried_later(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            mail.send_mail('Your order', 'Body', 'shop@example.com', ['buyer@example.com'])
+        message = OutboxEmail.objects.get()
+        self.assertEqual((message.status, message.attempts), (OutboxEmail.QUEUED, 1))
+        self.assertIn('451', message.last_error)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+
+@override_settings(
+    EMAIL_BACKEND='api.mail.OutboxEmailBackend',
+    EMAIL_OUTBOX={'WORKER': True, 'CRON_SECRET': 'cron-secret', 'DRAIN_SECONDS': 5},
+)
+class OutboxWorkerTests(SMTPServerMixin, TestCase):
+    def queue(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(count):
+                mail.send_mail(f'Message {index}', 'Body', 'shop@example.com', [f'buyer{index}@example.com'])
+
+    def test_requests_only_queue_when_a_worker_runs(self):
+        self.queue(3)
+        self.assertEqual(self.mail_server.received, [])
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.QUEUED).count(), 3)
+
+    def test_drain_delivers_due_mail_over_one_connection(self):
+        self.queue(3)
+        OutboxEmail.objects.filter(subject='Message 2').update(next_attempt_at=timezone.now() + timedelta(hours=1))
+        stats = drain(5)
+        self.assertEqual((stats['sent'], stats['connections']), (2, 1))
+        self.assertEqual(len(self.mail_server.received), 2)
+        self.assertEqual(OutboxEmail.objects.get(status=OutboxEmail.QUEUED).subject, 'Message 2')
+
+    def test_drain_endpoint_requires_the_cron_secret(self):
+        self.queue(1)
+        url = reverse('outbox-drain')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer cron-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['sent'], 1)
+        self.assertEqual(len(self.mail_server.received), 1)
+
+    def test_drain_endpoint_is_off_without_a_secret(self):
+        with override_settings(EMAIL_OUTBOX={'WORKER': True}):
+            self.assertEqual(self.client.get(reverse('outbox-drain')).status_code, 404)
+
+
+class BenchmarkHarnessTests(TestCase):
+    def seed(self, *options):
+        call_command(
+            'seed_benchmark_data', '--users', '5', '--categories', '2', '--products', '10', '--reviews', '20',
+            '--carts', '3', '--orders', '5', *options, stdout=io.StringIO(),
+        )
+
+    def test_every_endpoint_answers_on_generated_data(self):
+        self.seed()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('benchmark_api', '--requests', '2', '--warmup', '0', '--output', path, stdout=io.StringIO(), stderr=io.StringIO())
+            with open(path) as file:
+                report = json.load(file)
+        self.assertEqual(report['meta']['volumes']['product'], 10)
+        for name, result in report['endpoints'].items():
+            with self.subTest(endpoint=name):
+                self.assertEqual((result['requests'], result['errors']), (2, 0))
+                self.assertGreaterEqual(result['p99_ms'], result['p50_ms'])
+
+    def test_clear_removes_only_generated_data(self):
+        User.objects.create_user(email='buyer@example.com')
+        Category.objects.create(name='Lamps')
+        self.seed()
+        self.seed('--clear')
+        self.assertFalse(User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').exists())
+        self.assertEqual(list(User.objects.values_list('email', flat=True)), ['buyer@example.com'])
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['Lamps'])
+        self.assertFalse(Product.objects.exists())
+
+
+# replica1 mirrors default, a second connection to the test database, so it can only be
+# told apart by the queries it runs. The rows must be committed for that connection to see
+# them, hence a TransactionTestCase.
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica1'}
+
+    def setUp(self):
+        # flushing leaves the cache table alone, and users must be looked up again in every test
+        caches['shared'].clear()
+        get_local_cache().clear()
+        self.user = User.objects.create_user(email='buyer@example.com')
+        category = Category.objects.create(name='Lamps')
+        Product.objects.create(name='Desk lamp', description='A lamp', price=10, stock=5, category=category)
+        self.headers = {'HTTP_AUTHORIZATION': f'JWT {AccessToken.for_user(self.user)}'}
+
+    def get(self, url, **headers):
+        with CaptureQueriesContext(connections['replica1']) as replica:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in replica.captured_queries]
+
+    def test_safe_requests_read_from_the_replica(self):
+        _, replica_queries = self.get(reverse('carts-list'), **self.headers)
+        self.assertTrue(any('orders_cart' in sql for sql in replica_queries))
+        # the user cache is filled from default
+        self.assertFalse(any('users_user' in sql for sql in replica_queries))
+
+    def test_writer_reads_its_writes_until_the_pin_expires(self):
+        self.assertEqual(self.client.post(reverse('carts-list'), **self.headers).status_code, 201)
+        response, replica_queries = self.get(reverse('carts-list'), **self.headers)
+        self.assertEqual((len(response.data), replica_queries), (1, []))
+        later = mock.Mock(time=mock.Mock(return_value=time.time() + 6))
+        with mock.patch('api.replicas.time', later):
+            _, replica_queries = self.get(reverse('carts-list'), **self.headers)
+        self.assertTrue(replica_queries)
+
+    def test_pin_is_per_client(self):
+        self.client.post(reverse('carts-list'), **self.headers)
+        other = User.objects.create_user(email='other@example.com')
+        _, replica_queries = self.get(reverse('carts-list'), HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(other)}')
+        self.assertTrue(replica_queries)
+
+    def test_catalog_cache_fills_from_default(self):
+        response, replica_queries = self.get(reverse('products-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(replica_queries, [])
+        self.assertEqual(response.data['results'][0]['name'], 'Desk lamp')
+
+    def test_purchased_products_cache_fills_from_default(self):
+        url = reverse('has-ordered-products') + '?product_ids=1,2'
+        _, replica_queries = self.get(url, **self.headers)
+        self.assertFalse(any('orders_orderitem' in sql for sql in replica_queries))
+
+    @override_settings(REPLICA_CACHE_ALIAS='default')
+    def test_pins_require_a_shared_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ReplicaRoutingMiddleware(lambda request: None)
+
+
+@override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 1.0, 'QUERY_BUDGET': 100, 'LATENCY_BUDGET_MS': 60000})
+class RequestProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        Product.objects.create(name='Desk lamp', description='A lamp', price=10, stock=5, category=category)
+        cls.staff = User.objects.create_user(email='staff@example.com', is_staff=True)
+
+    def get(self, **headers):
+        with self.assertLogs('api.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('products-list'), **headers)
+        return response, logs.records[0]
+
+    def test_profiled_requests_are_logged_without_a_header(self):
+        response, record = self.get()
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(record.levelname, 'INFO')
+        self.assertEqual(record.profile['view'], 'ProductViewSet.list')
+        self.assertGreater(record.profile['queries'], 0)
+        self.assertEqual(record.profile['response_bytes'], len(response.content))
+
+    def test_staff_get_server_timing(self):
+        response, record = self.get(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.staff)}')
+        self.assertIn(f'desc="{record.profile["queries"]} queries"', response['Server-Timing'])
+
+    def test_server_timing_for_everyone_when_on(self):
+        with override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 1.0, 'SERVER_TIMING': True}):
+            response, _ = self.get()
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+    def test_requests_over_budget_are_warnings(self):
+        with override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 1.0, 'QUERY_BUDGET': 0}):
+            _, record = self.get()
+        self.assertEqual(record.levelname, 'WARNING')
+        self.assertIn('queries > 0', record.getMessage())
+
+    def test_unsampled_requests_are_not_profiled(self):
+        with override_settings(REQUEST_PROFILING={'SAMPLE_RATE': 0.5}):
+            with mock.patch('api.profiling.random.random', return_value=0.7), self.assertNoLogs('api.profiling'):
+                response = self.client.get(reverse('products-list'))
+        self.assertNotIn('Server-Timing', response)
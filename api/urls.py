@@ -1,7 +1,8 @@
 from django.urls import path, include
-from products.views import ProductViewSet, CategoryViewSet, ReviewViewSet, ProductImageViewSet
+from products.views import ProductViewSet, CategoryViewSet, ReviewViewSet, ProductImageViewSet, ProductExportView
 from rest_framework_nested import routers
-from orders.views import CartViewSet, CartItemViewSet, OrderViewSet, initiate_payment, payment_success, payment_cancel, payment_fail, HasOrderedProduct
+from api.views import OutboxDrainView
+from orders.views import CartViewSet, CartItemViewSet, OrderViewSet, initiate_payment, payment_success, payment_cancel, payment_fail, HasOrderedProduct, HasOrderedProducts
 router = routers.DefaultRouter()
 router.register('products', ProductViewSet, basename='products')
 router.register('categories', CategoryViewSet)
@@ -21,9 +22,12 @@ carts_router.register('items', CartItemViewSet, basename='cart-items')
 urlpatterns =[
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')),
+    path('products/export/', ProductExportView.as_view(), name='product-export'), 
     path('payment/initiate', initiate_payment, name = "initiate-payment"), 
     path('payment/success', payment_success, name = "payment-success"), 
     path('payment/fail', payment_fail, name = "payment-fail"), 
     path('payment/cancel', payment_cancel, name = "payment-cancel"), 
-    path('orders/has-ordered/<int:product_id>', HasOrderedProduct.as_view(), name='has-ordered-product' )
+    path('orders/has-ordered/<int:product_id>', HasOrderedProduct.as_view(), name='has-ordered-product' ), 
+    path('orders/has-ordered/', HasOrderedProducts.as_view(), name='has-ordered-products'), 
+    path('outbox/drain', OutboxDrainView.as_view(), name='outbox-drain'), 
 ]+ router.urls + product_router.urls + carts_router.urls
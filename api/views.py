@@ -1,2 +1,26 @@
-from django.shortcuts import render
+import hmac
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from api.mail import drain, get_config
 
+
+class OutboxDrainView(APIView):
+    """
+    Deliver due outbox email, for the scheduled job in vercel.json where no worker can run
+    - called with `Authorization: Bearer <settings.EMAIL_OUTBOX['CRON_SECRET']>`, as Vercel's cron does
+    - not found while no secret is configured
+    - sends for at most EMAIL_OUTBOX['DRAIN_SECONDS'] and returns the delivery counters
+    """
+    authentication_classes = []
+    permission_classes = []
+    swagger_schema = None
+
+    def get(self, request):
+        config = get_config()
+        if not config['CRON_SECRET']:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        expected = f"Bearer {config['CRON_SECRET']}"
+        if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), expected.encode()):
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        return Response(drain(config['DRAIN_SECONDS']))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from orders.models import Cart, CartItem, Order, OrderItem
+from orders.models import Cart, CartItem, Order, OrderItem, PaymentCallback
 
 
 @admin.register(Cart)
@@ -12,3 +12,10 @@ class OrderAdmin(admin.ModelAdmin):
 
 admin.site.register(CartItem)
 admin.site.register(OrderItem)
+
+
+@admin.register(PaymentCallback)
+class PaymentCallbackAdmin(admin.ModelAdmin): 
+    list_display = ['tran_id', 'order', 'gateway_status', 'amount', 'state', 'received_at']
+    list_filter = ['state', 'gateway_status']
+    search_fields = ['tran_id', 'val_id']
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class OrdersConfig(AppConfig):
     name = 'orders'
+
+    def ready(self):
+        import orders.signals
+        from django.core.signals import setting_changed
+        from orders.payments import reset_gateway
+        setting_changed.connect(reset_gateway)
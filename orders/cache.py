@@ -0,0 +1,54 @@
+"""
+Per-user cache of the product ids a user has ordered, for "has ordered" lookups.
+
+The set is built with one query on first use and dropped whenever one of the
+user's orders is created, canceled, changed or deleted (after the transaction
+commits), so the next lookup rebuilds it. It shares the catalog cache, and
+like it is skipped when that cache is local to the process.
+
+A lookup may read the orders just before one commits and store the set just
+after the commit dropped it. So, as in users/authentication.py, each user
+has a generation that every invalidation moves: the set is stored with the
+generation read before the query, and counts as a miss once it moved.
+"""
+
+import uuid
+from django.db import DEFAULT_DB_ALIAS, transaction
+from orders.models import Order, OrderItem
+from products.cache import get_cache, get_timeout, is_enabled
+
+PURCHASED_KEY = 'orders:purchased:{user_id}'
+GENERATION_KEY = 'orders:purchased:{user_id}:generation'
+
+
+def get_purchased_product_ids(user_id):
+    """ Ids of the products in the user's orders that were not canceled """
+    if not is_enabled():
+        return load_purchased_product_ids(user_id)
+    cache = get_cache()
+    key, generation_key = PURCHASED_KEY.format(user_id=user_id), GENERATION_KEY.format(user_id=user_id)
+    found = cache.get_many([key, generation_key])
+    generation, entry = found.get(generation_key), found.get(key)
+    if entry is not None and entry[0] == generation:
+        return entry[1]
+    # a lagging replica would keep an order that just committed out of the set for the whole timeout
+    product_ids = load_purchased_product_ids(user_id, using=DEFAULT_DB_ALIAS)
+    cache.set(key, (generation, product_ids), timeout=get_timeout())
+    return product_ids
+
+
+def load_purchased_product_ids(user_id, using=None):
+    return frozenset(
+        OrderItem.objects.db_manager(using).filter(order__user_id=user_id)
+        .exclude(order__status=Order.CANCELED)
+        .values_list('product_id', flat=True)
+        .distinct()
+    )
+
+
+def invalidate_purchased_product_ids(user_id, using=DEFAULT_DB_ALIAS):
+    def forget():
+        # the stored set stays until it expires, under a generation no lookup accepts any more
+        get_cache().set(GENERATION_KEY.format(user_id=user_id), uuid.uuid4().hex, timeout=get_timeout())
+
+    transaction.on_commit(forget, using=using)
@@ -0,0 +1,13 @@
+from django_filters.rest_framework import FilterSet, NumberFilter
+from orders.models import Order
+
+
+class OrderFilter(FilterSet): 
+    user = NumberFilter(field_name='user_id')
+    
+    class Meta: 
+        model = Order
+        fields = {
+            'status': ['exact'], 
+            'created_at': ['gte', 'lt'], 
+        }
@@ -0,0 +1,123 @@
+import random
+import threading
+import time
+from decimal import Decimal
+from uuid import uuid4
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from orders.models import Cart, CartItem, OrderItem
+from orders.services import OrderServices
+from products.models import Category, Product
+from rest_framework.exceptions import ValidationError
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Check out many carts from concurrent threads against a few products with limited stock, "
+        "report orders/sec and verify no product was oversold. The scratch data is removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--products', type=int, default=5)
+        parser.add_argument('--stock', type=int, default=100, help="Starting stock per product")
+        parser.add_argument('--lines', type=int, default=2, help="Products per cart")
+        parser.add_argument('--max-quantity', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        threads, carts = options['threads'], options['carts']
+        if options['lines'] > options['products']:
+            raise CommandError("--lines can not exceed --products")
+        rng = random.Random(options['seed'])
+        tag = uuid4().hex[:8]
+
+        category = Category.objects.create(name=f'Checkout benchmark {tag}')
+        products = Product.objects.bulk_create(
+            Product(name=f'Checkout benchmark {i}', description='', price=Decimal('1.00'),
+                    stock=options['stock'], category=category)
+            for i in range(options['products'])
+        )
+        users = User.objects.bulk_create(
+            User(email=f'checkout-{tag}-{i}@example.com', password='!') for i in range(carts)
+        )
+        cart_objects = Cart.objects.bulk_create(Cart(user=user) for user in users)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=product, quantity=rng.randint(1, options['max_quantity']))
+            for cart in cart_objects
+            for product in rng.sample(products, options['lines'])
+        )
+        demand = dict(
+            CartItem.objects.filter(cart__in=cart_objects).values('product_id')
+            .annotate(total=Sum('quantity')).values_list('product_id', 'total')
+        )
+
+        queue = [(cart.user_id, cart.id) for cart in cart_objects]
+        lock = threading.Lock()
+        results = {'placed': 0, 'short': 0, 'errors': []}
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            barrier.wait()
+            try:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        user_id, cart_id = queue.pop()
+                    try:
+                        OrderServices.create_order(user_id, cart_id)
+                        outcome = 'placed'
+                    except ValidationError:
+                        outcome = 'short'
+                    except Exception as error:
+                        results['errors'].append(error)
+                        continue
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connections.close_all()
+
+        try:
+            workers = [threading.Thread(target=worker) for _ in range(threads)]
+            start = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            sold = dict(
+                OrderItem.objects.filter(product__in=products).values('product_id')
+                .annotate(total=Sum('quantity')).values_list('product_id', 'total')
+            )
+            oversold = []
+            for product in Product.objects.filter(pk__in=[p.pk for p in products]).order_by('pk'):
+                units = sold.get(product.pk, 0)
+                self.stdout.write(
+                    f"  product {product.pk}: stock {options['stock']} -> {product.stock}, "
+                    f"demand {demand.get(product.pk, 0)}, sold {units}"
+                )
+                if units > options['stock'] or product.stock != options['stock'] - units:
+                    oversold.append(product.pk)
+
+            self.stdout.write(
+                f"{threads} threads, {carts} carts on {connection.vendor}: {results['placed']} orders placed, "
+                f"{results['short']} rejected for stock, {len(results['errors'])} errors, "
+                f"{results['placed'] / elapsed:.0f} orders/sec"
+            )
+            if results['errors']:
+                # e.g. SQLite's default deferred transactions fail to upgrade their lock under contention,
+                # its OPTIONS {'transaction_mode': 'IMMEDIATE'} makes checkouts wait instead
+                self.stderr.write(f"First error: {results['errors'][0]!r}")
+            if oversold:
+                raise CommandError(f"Stock and sales disagree for products {oversold}")
+            self.stdout.write(self.style.SUCCESS("No product was oversold"))
+        finally:
+            # orders, carts and their lines go with their users and products
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            Product.objects.filter(pk__in=[product.pk for product in products]).delete()
+            category.delete()
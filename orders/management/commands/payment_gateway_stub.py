@@ -0,0 +1,149 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+import requests
+from django.core.management.base import BaseCommand
+from orders.payments import SESSION_PATH, TRANSACTION_PATH, VALIDATION_PATH
+
+PAY_PATH = '/pay/'
+
+
+class StubGateway:
+    """ In-memory stand-in for the SSLCommerz session, payment page and validation APIs """
+
+    def __init__(self, latency=0.0, fail_rate=0.0, seed=None):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.payments = {}
+
+    def create_session(self, form, base_url):
+        missing = [name for name in ('tran_id', 'total_amount', 'success_url') if not form.get(name)]
+        if missing:
+            return 200, {'status': 'FAILED', 'failedreason': f"Missing {', '.join(missing)}"}
+        sessionkey = uuid4().hex.upper()
+        with self.lock:
+            self.sessions[sessionkey] = form
+        return 200, {
+            'status': 'SUCCESS',
+            'sessionkey': sessionkey,
+            'GatewayPageURL': f'{base_url}{PAY_PATH}{sessionkey}',
+        }
+
+    def pay(self, sessionkey, outcome):
+        """ Play the customer: record the payment and post the gateway's callback to our backend """
+        with self.lock:
+            form = self.sessions.get(sessionkey)
+        if form is None:
+            return 404, {'status': 'FAILED', 'failedreason': 'Unknown session'}
+        val_id = uuid4().hex[:16]
+        payment = {
+            'status': 'VALID' if outcome == 'success' else 'FAILED',
+            'tran_id': form['tran_id'],
+            'val_id': val_id,
+            'amount': form['total_amount'],
+            'currency': form.get('currency', 'BDT'),
+            'tran_date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'bank_tran_id': uuid4().hex[:20],
+        }
+        with self.lock:
+            self.payments[val_id] = payment
+        callback = form.get(f'{outcome}_url') or form['success_url']
+        try:
+            callback_status = requests.post(callback, data=payment, allow_redirects=False, timeout=10).status_code
+        except requests.RequestException as error:
+            callback_status = str(error)
+        return 200, {'callback': callback, 'callback_status': callback_status, **payment}
+
+    def validate(self, query):
+        payment = self.payments.get(query.get('val_id'))
+        if payment is None:
+            return 200, {'status': 'INVALID_TRANSACTION'}
+        return 200, payment
+
+    def query_transaction(self, query):
+        elements = [payment for payment in list(self.payments.values()) if payment['tran_id'] == query.get('tran_id')]
+        return 200, {'APIConnect': 'DONE', 'no_of_trans_found': len(elements), 'element': elements}
+
+
+class Handler(BaseHTTPRequestHandler):
+    gateway = None
+    verbose = False
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        self.answer(form)
+
+    def do_GET(self):
+        self.answer({key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()})
+
+    def answer(self, params):
+        if self.gateway.latency:
+            time.sleep(self.gateway.latency)
+        if self.gateway.random.random() < self.gateway.fail_rate:
+            return self.send_json(503, {'status': 'FAILED', 'failedreason': 'Stub outage'})
+        path = urlparse(self.path).path
+        base_url = f'http://{self.headers.get("Host")}'
+        if path == SESSION_PATH and self.command == 'POST':
+            status, body = self.gateway.create_session(params, base_url)
+        elif path.startswith(PAY_PATH):
+            status, body = self.gateway.pay(path[len(PAY_PATH):], params.get('outcome', 'success'))
+        elif path == VALIDATION_PATH:
+            status, body = self.gateway.validate(params)
+        elif path == TRANSACTION_PATH:
+            status, body = self.gateway.query_transaction(params)
+        else:
+            status, body = 404, {'status': 'FAILED', 'failedreason': 'Unknown endpoint'}
+        self.send_json(status, body)
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local stand-in for the SSLCommerz gateway for tests and load runs. Point "
+        "SSLCOMMERZ_BASE_URL at it. Opening a session's GatewayPageURL (optionally ?outcome=fail or "
+        "cancel) plays the customer and posts the gateway callback to the session's success/fail/cancel URL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8021)
+        parser.add_argument('--latency', type=float, default=0.0, help="Seconds to wait before every answer")
+        parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--verbose-log', action='store_true', help="Log every request")
+
+    def handle(self, *args, **options):
+        handler = type('StubHandler', (Handler,), {
+            'gateway': StubGateway(options['latency'], options['fail_rate'], options['seed']),
+            'verbose': options['verbose_log'],
+        })
+        server = ThreadingHTTPServer((options['host'], options['port']), handler)
+        self.stdout.write(
+            f"Stub gateway on http://{options['host']}:{options['port']} "
+            f"(latency {options['latency']}s, fail rate {options['fail_rate']:.0%}), Ctrl-C to stop"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from orders.models import PaymentCallback
+from orders.services import PaymentServices
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay payment callbacks that are still pending, in batches: each batch is checked with the "
+        "gateway and applied with one order UPDATE. Safe to run repeatedly or next to live traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument(
+            '--older-than', type=int, default=60,
+            help="Only callbacks received at least this many seconds ago, fresh ones are still being processed inline",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['older_than'])
+        pending = PaymentCallback.objects.filter(state=PaymentCallback.PENDING, received_at__lte=cutoff).order_by('pk')
+        totals = [0, 0, 0]
+        last_pk = 0
+        while True:
+            # walk by primary key, callbacks that stay pending are not fetched again
+            batch = list(pending.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            counts = PaymentServices.process_callbacks(batch)
+            totals = [total + count for total, count in zip(totals, counts)]
+            self.stdout.write(f"batch up to #{last_pk}: {counts[0]} paid, {counts[1]} rejected, {counts[2]} still pending")
+
+        paid, rejected, still_pending = totals
+        message = f"Replayed {sum(totals)} callbacks: {paid} paid, {rejected} rejected, {still_pending} still pending"
+        self.stdout.write(self.style.WARNING(message) if still_pending else self.style.SUCCESS(message))
@@ -37,6 +37,8 @@ class Order(models.Model):
         (READY_TO_SHIP, 'Ready to ship'), 
         (CANCELED, 'Canceled'), 
     }
+    # fulfilment only moves forward along this list, Canceled leaves it for good
+    STATUS_FLOW = [NOT_PAID, READY_TO_SHIP, SHIPPED, DELIVERED]
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=NOT_PAID)
@@ -44,6 +46,12 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta: 
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='order_user_created_idx'), 
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'), 
+        ]
+    
     def __str__(self):
         return f"Order {self.id} by {self.user.first_name} - {self.status}"
     
@@ -55,5 +63,41 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     
+    class Meta: 
+        indexes = [
+            # covers "which products has this user ordered" without reading the item rows
+            models.Index(fields=['order', 'product'], name='orderitem_order_product_idx'), 
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity} X {self.product.name}"
+
+
+class PaymentCallback(models.Model): 
+    """ One row per gateway transaction, however often the gateway repeats its callback """
+    PENDING = 'Pending'
+    PAID = 'Paid'
+    REJECTED = 'Rejected'
+    STATE_CHOICES = [
+        (PENDING, 'Pending'), 
+        (PAID, 'Paid'), 
+        (REJECTED, 'Rejected'), 
+    ]
+    tran_id = models.CharField(max_length=64, unique=True)
+    val_id = models.CharField(max_length=64, blank=True)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='payment_callbacks')
+    gateway_status = models.CharField(max_length=20, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=PENDING)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta: 
+        indexes = [
+            # the reconciliation command walks the pending callbacks
+            models.Index(fields=['state', 'received_at'], name='paymentcb_state_received_idx'), 
+        ]
+    
     def __str__(self):
-        return f"{self.quantity} X {self.product.name}"
\ No newline at end of file
+        return f"{self.tran_id} - {self.gateway_status} ({self.state})"
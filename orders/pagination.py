@@ -0,0 +1,7 @@
+from products.pagination import KeysetPagination
+
+
+class OrderPagination(KeysetPagination):
+    """ Newest orders first, seeking on (created_at, id) so deep pages cost the same as the first """
+    page_size = 20
+    page_ordering = ['-created_at', '-id']
@@ -0,0 +1,130 @@
+"""
+SSLCommerz payment gateway client.
+
+One client per process keeps a pooled requests.Session, so calls reuse open
+TLS connections instead of handshaking every time. Every call has connect
+and read timeouts. Connection failures are retried with exponential
+backoff, and so are 502/503/504 answers to the GET lookups. A POST that
+reached the gateway is never repeated, since a second session request
+could open a second checkout session. A slow or down gateway therefore
+costs a worker a bounded amount of time and surfaces as PaymentGatewayError.
+Configured by settings.SSLCOMMERZ.
+"""
+
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests import RequestException, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+SESSION_PATH = '/gwprocess/v4/api.php'
+VALIDATION_PATH = '/validator/api/validationserverAPI.php'
+TRANSACTION_PATH = '/validator/api/merchantTransIDvalidationAPI.php'
+
+DEFAULTS = {
+    'STORE_ID': '',
+    'STORE_PASS': '',
+    'SANDBOX': True,
+    'BASE_URL': '',
+    'TIMEOUT': (3.05, 10),
+    'RETRIES': 2,
+    'BACKOFF': 0.5,
+    'POOL_SIZE': 10,
+}
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class PaymentGateway:
+    def __init__(self, store_id, store_pass, base_url, timeout, retries, backoff, pool_size):
+        self.store_id = store_id
+        self.store_pass = store_pass
+        self.base_url = base_url.rstrip('/')
+        self.timeout = tuple(timeout) if isinstance(timeout, (list, tuple)) else timeout
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            # a read timeout may mean the gateway acted on the request, so it is not repeated
+            read=0,
+            status=retries,
+            status_forcelist=(502, 503, 504),
+            # only the lookups are repeated after an answer, a POST is retried on connect errors alone
+            allowed_methods=frozenset({'GET'}),
+            backoff_factor=backoff,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_settings(cls):
+        config = {**DEFAULTS, **getattr(settings, 'SSLCOMMERZ', {})}
+        mode = 'sandbox' if config['SANDBOX'] else 'securepay'
+        return cls(
+            store_id=config['STORE_ID'],
+            store_pass=config['STORE_PASS'],
+            base_url=config['BASE_URL'] or f'https://{mode}.sslcommerz.com',
+            timeout=config['TIMEOUT'],
+            retries=config['RETRIES'],
+            backoff=config['BACKOFF'],
+            pool_size=config['POOL_SIZE'],
+        )
+
+    def call(self, method, path, payload):
+        payload = {**payload, 'store_id': self.store_id, 'store_passwd': self.store_pass}
+        body = 'data' if method == 'POST' else 'params'
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **{body: payload})
+            response.raise_for_status()
+            return response.json()
+        except (RequestException, ValueError) as error:
+            raise PaymentGatewayError(f"{method} {path} failed: {error}") from error
+
+    def create_session(self, post_body):
+        """ Start a checkout session, returns the gateway's answer (status, GatewayPageURL, sessionkey, ...) """
+        return self.call('POST', SESSION_PATH, post_body)
+
+    def validate(self, val_id):
+        """ Look up a completed payment by the val_id the gateway sent to our callback """
+        return self.call('GET', VALIDATION_PATH, {'val_id': val_id, 'format': 'json'})
+
+    def query_transaction(self, tran_id):
+        """ All payment attempts the gateway recorded for one of our tran_ids """
+        return self.call('GET', TRANSACTION_PATH, {'tran_id': tran_id, 'format': 'json'})
+
+    # the pool is shared by worker threads, so the async variants run the call in a thread
+    # of their own and never hold the event loop (or the ASGI sync thread) while waiting on it
+    async def acreate_session(self, post_body):
+        return await sync_to_async(self.create_session, thread_sensitive=False)(post_body)
+
+    async def avalidate(self, val_id):
+        return await sync_to_async(self.validate, thread_sensitive=False)(val_id)
+
+    async def aquery_transaction(self, tran_id):
+        return await sync_to_async(self.query_transaction, thread_sensitive=False)(tran_id)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """ The process-wide client, built on first use """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = PaymentGateway.from_settings()
+    return _gateway
+
+
+def reset_gateway(**kwargs):
+    """ Drop the client so the next call picks up changed settings (connected to setting_changed) """
+    global _gateway
+    if kwargs.get('setting', 'SSLCOMMERZ') == 'SSLCOMMERZ':
+        _gateway = None
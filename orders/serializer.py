@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from orders.models import Cart, CartItem, Order, OrderItem
-from products.serializers import ProductSerializer
+from products.serializers import ProductSerializer, SimpleUserSerializer
+from api.fieldsets import SparseFieldsetSerializerMixin
 from products.models import Product 
-from orders.services import OrderServices
+from orders.services import OrderServices, CartServices
 
 
 
@@ -23,19 +24,12 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         product_id = self.validated_data['product_id']
         quantity = self.validated_data['quantity']
 
-        try: 
-            cart_item = CartItem.objects.get(cart_id = cart_id, product_id = product_id)
-            cart_item.quantity += quantity
-            self.instance = cart_item.save()
-        except CartItem.DoesNotExist: 
-            self.instance = CartItem.objects.create(cart_id = cart_id, **self.validated_data)
+        # a single upsert both validates the product and inserts or increments the line
+        self.instance = CartServices.add_item(cart_id, product_id, quantity)
+        if self.instance is None: 
+            raise serializers.ValidationError({'product_id': [f"Product {product_id} does not exist"]})
         return self.instance
 
-    def validate_product_id(self, value): 
-        if not Product.objects.filter(pk = value): 
-            raise serializers.ValidationError(f"Product {value} does not exist")
-        return value
-
 
 class UpdateCartItemSerializer(serializers.ModelSerializer): 
     class Meta: 
@@ -43,6 +37,32 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         fields = ['quantity']
 
 
+class CartBatchOperationSerializer(serializers.Serializer): 
+    ADD = 'add'
+    SET = 'set'
+    REMOVE = 'remove'
+    op = serializers.ChoiceField(choices=[ADD, SET, REMOVE])
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    
+    def validate(self, attrs): 
+        if attrs['op'] != self.REMOVE and 'quantity' not in attrs: 
+            raise serializers.ValidationError({'quantity': [f"This field is required for '{attrs['op']}'."]})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer): 
+    operations = CartBatchOperationSerializer(many=True, allow_empty=False, max_length=100)
+    
+    def save(self, **kwargs): 
+        CartServices.apply_batch(self.context['cart_id'], self.validated_data['operations'])
+        self.instance = Cart.objects.prefetch_related('items__product').get(pk=self.context['cart_id'])
+        return self.instance
+    
+    def to_representation(self, instance): 
+        return CartSerializer(instance).data
+
+
 class CartItemSerializer(serializers.ModelSerializer): 
     product = SimpleProductSerializer()
     total_price = serializers.SerializerMethodField(method_name='get_total_price')
@@ -54,13 +74,15 @@ class CartItemSerializer(serializers.ModelSerializer):
         return item.product.price*item.quantity
      
 
-class CartSerializer(serializers.ModelSerializer): 
+class CartSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer): 
     items = CartItemSerializer(many = True, read_only = True)
     total = serializers.SerializerMethodField(method_name='get_total_price')
     class Meta: 
         model = Cart 
         fields = ['id', 'user', 'items', 'total']
         read_only_fields = ['user']
+    expandable_fields = {'user': SimpleUserSerializer}
+    field_sources = {'total': ['items__product']}
     def get_total_price(self, cart:Cart): 
         # total = 0
         # items = CartItem.objects.filter(cart = cart)
@@ -108,24 +130,21 @@ class UpdateOrderSerializer(serializers.ModelSerializer):
         model = Order 
         fields = ['status']
     
-    # def update(self, instance, validate_data): 
-    #     user = self.context['user']
-    #     new_status = validate_data['status']
-        
-    #     if new_status == Order.CANCELED: 
-    #         return OrderServices.cancel_order(order=instance, user= user)
-          
-    #     if not user.is_staff: 
-    #         raise serializers.ValidationError({'detail': 'You are not the admin'})
-          
-    #     return super().update(instance=instance, validated_data= validate_data)
+    def update(self, instance, validated_data): 
+        # canceling goes through the service so the order's stock is returned
+        if validated_data.get('status') == Order.CANCELED: 
+            return OrderServices.cancel_order(order=instance, user=self.context['user'])
+        if not self.context['user'].is_staff: 
+            raise serializers.ValidationError({'detail': 'You are not the admin'})
+        return super().update(instance, validated_data)
     
     
 class EmptySerializer(serializers.Serializer): 
     pass
     
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many = True)
     class Meta: 
         model = Order
-        fields = ['id', 'user', 'status', 'total_price', 'created_at', 'items']
\ No newline at end of file
+        fields = ['id', 'user', 'status', 'total_price', 'created_at', 'items']
+    expandable_fields = {'user': SimpleUserSerializer}
\ No newline at end of file
@@ -1,13 +1,36 @@
-from orders.models import Cart, CartItem, Order, OrderItem
-from django.db import transaction
+from orders.cache import invalidate_purchased_product_ids
+from orders.models import Cart, CartItem, Order, OrderItem, PaymentCallback
+from orders.payments import PaymentGatewayError, get_gateway
+from products.models import Product
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from uuid import UUID
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.functions import Now
 from rest_framework.exceptions import PermissionDenied, ValidationError
 
+class StockShortage(Exception): 
+    pass
+
+
+class InsufficientStock(ValidationError): 
+    """ 400 listing each short cart line, with quantities kept as numbers """
+    def __init__(self, items): 
+        super().__init__()
+        self.detail = {'detail': 'Not enough stock for some items', 'items': items}
+
+
 class OrderServices: 
+    # cart lines are reserved in chunks, one conditional UPDATE per chunk
+    STOCK_BATCH_SIZE = 100
+    
     @staticmethod
     def create_order(user_id, cart_id): 
         with transaction.atomic(): 
             cart = Cart.objects.get(pk=cart_id)
             cart_items = cart.items.select_related('product').all()
+            OrderServices.reserve_stock({item.product_id: item.quantity for item in cart_items})
             total_price = sum(
                 [item.product.price*item.quantity for item in cart_items])
 
@@ -27,15 +50,300 @@ class OrderServices:
 
     @staticmethod
     def cancel_order(order, user): 
-        if user.is_staff: 
-            order.status == Order.CANCELED
-            order.save()
-            return order
-        if order.user != user: 
-            raise PermissionDenied({'detail':'You can only cancel your own order'})
-        if order.status == Order.DELIVERED: 
-            raise ValidationError({'detail': 'This order can not be canceled'})
+        if not user.is_staff: 
+            if order.user_id != user.id: 
+                raise PermissionDenied({'detail':'You can only cancel your own order'})
+            if order.status == Order.DELIVERED: 
+                raise ValidationError({'detail': 'This order can not be canceled'})
         
+        with transaction.atomic(): 
+            orders = Order.objects.filter(pk=order.pk).exclude(status=Order.CANCELED)
+            if not user.is_staff: 
+                orders = orders.exclude(status=Order.DELIVERED)
+            # only the request that actually moves the order to Canceled gives the stock back
+            if orders.update(status=Order.CANCELED, updated_at=Now()): 
+                quantities = {}
+                for product_id, quantity in order.items.values_list('product_id', 'quantity'): 
+                    quantities[product_id] = quantities.get(product_id, 0) + quantity
+                OrderServices.release_stock(quantities)
+                # the status changed with update(), which sends no post_save
+                invalidate_purchased_product_ids(order.user_id)
         order.status = Order.CANCELED
-        order.save()
-        return order
\ No newline at end of file
+        return order
+    
+    @staticmethod
+    def advance_status(order_ids, status): 
+        """
+        Move orders forward to `status` in one conditional UPDATE. Orders already at or past it, 
+        or canceled, are left alone, so replaying the same change is harmless. Returns the count moved.
+        """
+        earlier = Order.STATUS_FLOW[:Order.STATUS_FLOW.index(status)]
+        if not order_ids or not earlier: 
+            return 0
+        return Order.objects.filter(pk__in=order_ids, status__in=earlier).update(status=status, updated_at=Now())
+    
+    @staticmethod
+    def reserve_stock(quantities): 
+        """
+        Take {product_id: quantity} out of stock, all or nothing. Each chunk of lines is one
+        UPDATE ... WHERE stock >= quantity, and chunks go in product id order so concurrent
+        checkouts lock rows in the same order and can not deadlock. Raises InsufficientStock
+        listing every short line.
+        
+        Stock is part of the cached catalog payload, so updated_at moves with it and the update
+        bumps the catalog version (products/cache.py): every checkout invalidates the anonymous
+        catalog cache, so shoppers never see a product in stock after it sold out.
+        """
+        product_ids = sorted(quantities)
+        try: 
+            with transaction.atomic(): 
+                for chunk in OrderServices._chunks(product_ids): 
+                    requested = OrderServices._quantity_of(chunk, quantities)
+                    updated = Product.objects.filter(pk__in=chunk, stock__gte=requested).update(
+                        stock=F('stock') - requested, updated_at=Now())
+                    if updated != len(chunk): 
+                        raise StockShortage
+        except StockShortage: 
+            # the savepoint is rolled back, so the stock read here is untouched by this checkout
+            products = Product.objects.filter(pk__in=product_ids).values_list('pk', 'name', 'stock')
+            raise InsufficientStock([
+                {'product_id': pk, 'name': name, 'requested': quantities[pk], 'available': stock}
+                for pk, name, stock in products.order_by('pk') if stock < quantities[pk]
+            ])
+    
+    @staticmethod
+    def release_stock(quantities): 
+        """ Put {product_id: quantity} back into stock, in the same order reserve_stock takes it """
+        for chunk in OrderServices._chunks(sorted(quantities)): 
+            Product.objects.filter(pk__in=chunk).update(
+                stock=F('stock') + OrderServices._quantity_of(chunk, quantities), updated_at=Now())
+    
+    @staticmethod
+    def _chunks(product_ids): 
+        size = OrderServices.STOCK_BATCH_SIZE
+        return [product_ids[start:start + size] for start in range(0, len(product_ids), size)]
+    
+    @staticmethod
+    def _quantity_of(product_ids, quantities): 
+        return Case(
+            *[When(pk=product_id, then=Value(quantities[product_id])) for product_id in product_ids], 
+            output_field=PositiveIntegerField(), 
+        )
+
+
+class CartServices: 
+    # Insert the line, or add to the existing one, in one statement. Selecting the product in the
+    # same statement validates it: an unknown product inserts nothing and returns no row.
+    UPSERT_SQL = """
+        INSERT INTO {cart_item} (cart_id, product_id, quantity)
+        SELECT %s, {product}.id, %s FROM {product} WHERE {product}.id = %s
+        ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {cart_item}.quantity + EXCLUDED.quantity
+        RETURNING id, quantity
+    """
+    # The same increment for many lines at once, for products already known to exist
+    ADD_MANY_SQL = """
+        INSERT INTO {cart_item} (cart_id, product_id, quantity) VALUES {rows}
+        ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {cart_item}.quantity + EXCLUDED.quantity
+    """
+    UPSERT_VENDORS = ('postgresql', 'sqlite')
+    
+    @staticmethod
+    def add_item(cart_id, product_id, quantity): 
+        """ Add `quantity` of a product to a cart, returns the CartItem or None when the product does not exist """
+        using = router.db_for_write(CartItem)
+        connection = connections[using]
+        if connection.vendor not in CartServices.UPSERT_VENDORS: 
+            return CartServices._add_item_locked(cart_id, product_id, quantity)
+        
+        sql = CartServices.UPSERT_SQL.format(
+            cart_item=connection.ops.quote_name(CartItem._meta.db_table), 
+            product=connection.ops.quote_name(Product._meta.db_table), 
+        )
+        cart_id_value = CartItem._meta.get_field('cart').get_db_prep_value(cart_id, connection)
+        with connection.cursor() as cursor: 
+            cursor.execute(sql, [cart_id_value, quantity, product_id])
+            row = cursor.fetchone()
+        if row is None: 
+            return None
+        item = CartItem(id=row[0], cart_id=cart_id, product_id=product_id, quantity=row[1])
+        item._state.adding = False
+        item._state.db = using
+        return item
+    
+    @staticmethod
+    def _add_item_locked(cart_id, product_id, quantity): 
+        with transaction.atomic(): 
+            if not Product.objects.filter(pk=product_id).exists(): 
+                return None
+            item, created = CartItem.objects.select_for_update().get_or_create(
+                cart_id=cart_id, product_id=product_id, defaults={'quantity': quantity}
+            )
+            if not created: 
+                CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + quantity)
+                item.refresh_from_db(fields=['quantity'])
+            return item
+    
+    @staticmethod
+    def apply_batch(cart_id, operations): 
+        """
+        Apply a list of {'op': 'add' | 'set' | 'remove', 'product_id', 'quantity'} to a cart in one
+        transaction. Operations are folded per product first, so the database sees one DELETE for
+        the removed lines, one incrementing upsert for the added ones (the same as add_item) and
+        one upsert for the set ones, however long the list is.
+        """
+        # product_id -> ('add', n) relative to the stored line, ('set', n) or ('remove', None)
+        changes = {}
+        for operation in operations: 
+            op, product_id, quantity = operation['op'], operation['product_id'], operation.get('quantity')
+            previous = changes.get(product_id)
+            if op == 'add' and previous is not None: 
+                kind, current = previous
+                changes[product_id] = ('set', quantity) if kind == 'remove' else (kind, current + quantity)
+            else: 
+                changes[product_id] = (op, quantity)
+        
+        known = set(Product.objects.filter(pk__in=changes).values_list('pk', flat=True))
+        unknown = [
+            {'product_id': [f"Product {operation['product_id']} does not exist"]} if operation['product_id'] not in known else {}
+            for operation in operations
+        ]
+        if any(unknown): 
+            raise ValidationError({'operations': unknown})
+        
+        removed = [product_id for product_id, (kind, _) in changes.items() if kind == 'remove']
+        added = {product_id: quantity for product_id, (kind, quantity) in changes.items() if kind == 'add'}
+        replaced = {product_id: quantity for product_id, (kind, quantity) in changes.items() if kind == 'set'}
+        with transaction.atomic(): 
+            if removed: 
+                CartItem.objects.filter(cart_id=cart_id, product_id__in=removed).delete()
+            if added: 
+                CartServices._add_many(cart_id, added)
+            if replaced: 
+                CartItem.objects.bulk_create(
+                    [CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity) for product_id, quantity in sorted(replaced.items())], 
+                    update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'], 
+                )
+    
+    @staticmethod
+    def _add_many(cart_id, quantities): 
+        """ Add {product_id: quantity} to a cart's lines in one statement, incrementing lines that exist """
+        using = router.db_for_write(CartItem)
+        connection = connections[using]
+        if connection.vendor not in CartServices.UPSERT_VENDORS: 
+            for product_id, quantity in sorted(quantities.items()): 
+                CartServices._add_item_locked(cart_id, product_id, quantity)
+            return
+        
+        sql = CartServices.ADD_MANY_SQL.format(
+            cart_item=connection.ops.quote_name(CartItem._meta.db_table), 
+            rows=', '.join(['(%s, %s, %s)'] * len(quantities)), 
+        )
+        cart_id_value = CartItem._meta.get_field('cart').get_db_prep_value(cart_id, connection)
+        params = []
+        # in product id order, like every other multi-row write, so concurrent batches can not deadlock
+        for product_id, quantity in sorted(quantities.items()): 
+            params += [cart_id_value, product_id, quantity]
+        with connection.cursor() as cursor: 
+            cursor.execute(sql, params)
+
+
+class PaymentServices: 
+    # gateway status of a completed payment, in callbacks and validation answers
+    VALID_STATUSES = ('VALID', 'VALIDATED')
+    VALIDATION_WORKERS = 8
+    
+    @staticmethod
+    def record_callback(data): 
+        """
+        Store a gateway callback once per tran_id. Returns the stored callback when it needs 
+        processing, None for repeats. A successful payment replaces an earlier failed or 
+        canceled attempt of the same transaction.
+        """
+        tran_id = data.get('tran_id')
+        if not tran_id: 
+            return None
+        fields = {
+            'val_id': data.get('val_id') or '', 
+            'gateway_status': data.get('status') or '', 
+            'amount': PaymentServices._amount_of(data.get('amount')), 
+            'order_id': PaymentServices._order_id_of(tran_id), 
+            'payload': {key: data.get(key) for key in data}, 
+        }
+        try: 
+            with transaction.atomic(): 
+                return PaymentCallback.objects.create(tran_id=tran_id, **fields)
+        except IntegrityError: 
+            pass
+        if fields['gateway_status'] not in PaymentServices.VALID_STATUSES: 
+            return None
+        replaced = PaymentCallback.objects.filter(tran_id=tran_id).exclude(
+            gateway_status__in=PaymentServices.VALID_STATUSES
+        ).update(**fields, state=PaymentCallback.PENDING, processed_at=None)
+        return PaymentCallback.objects.get(tran_id=tran_id) if replaced else None
+    
+    @staticmethod
+    def process_callbacks(callbacks): 
+        """
+        Check pending callbacks with the gateway and apply them: paid orders move to Ready to ship 
+        in one UPDATE, and each callback is marked Paid or Rejected. Callbacks the gateway could not 
+        be asked about stay Pending for the reconciliation command. Returns (paid, rejected, pending).
+        """
+        callbacks = [callback for callback in callbacks if callback.state == PaymentCallback.PENDING]
+        if not callbacks: 
+            return 0, 0, 0
+        totals = dict(Order.objects.filter(
+            pk__in={callback.order_id for callback in callbacks if callback.order_id}
+        ).values_list('pk', 'total_price'))
+        
+        if len(callbacks) == 1: 
+            verdicts = [PaymentServices._verify(callbacks[0], totals)]
+        else: 
+            # validation is a gateway round trip per callback, the pooled client takes them in parallel
+            with ThreadPoolExecutor(min(len(callbacks), PaymentServices.VALIDATION_WORKERS)) as executor: 
+                verdicts = list(executor.map(lambda callback: PaymentServices._verify(callback, totals), callbacks))
+        
+        paid = [callback for callback, verdict in zip(callbacks, verdicts) if verdict is True]
+        rejected = [callback for callback, verdict in zip(callbacks, verdicts) if verdict is False]
+        with transaction.atomic(): 
+            OrderServices.advance_status([callback.order_id for callback in paid], Order.READY_TO_SHIP)
+            for state, done in [(PaymentCallback.PAID, paid), (PaymentCallback.REJECTED, rejected)]: 
+                if done: 
+                    PaymentCallback.objects.filter(
+                        pk__in=[callback.pk for callback in done], state=PaymentCallback.PENDING
+                    ).update(state=state, processed_at=Now())
+        return len(paid), len(rejected), len(callbacks) - len(paid) - len(rejected)
+    
+    @staticmethod
+    def _verify(callback, totals): 
+        """ True for a genuine payment of the whole order, False when it is not one, None when the gateway is unreachable """
+        total = totals.get(callback.order_id)
+        if callback.gateway_status not in PaymentServices.VALID_STATUSES or total is None or not callback.val_id: 
+            return False
+        try: 
+            answer = get_gateway().validate(callback.val_id)
+        except PaymentGatewayError: 
+            return None
+        return (
+            answer.get('status') in PaymentServices.VALID_STATUSES
+            and answer.get('tran_id') == callback.tran_id
+            and PaymentServices._amount_of(answer.get('amount')) == total
+        )
+    
+    @staticmethod
+    def _order_id_of(tran_id): 
+        """ The order a tran_id ("tr_<order id>") pays for, None when there is no such order """
+        try: 
+            order_id = UUID(tran_id.partition('_')[2])
+        except ValueError: 
+            return None
+        return Order.objects.filter(pk=order_id).values_list('pk', flat=True).first()
+    
+    @staticmethod
+    def _amount_of(value): 
+        try: 
+            amount = Decimal(value).quantize(Decimal('0.01'))
+        except (TypeError, InvalidOperation): 
+            return None
+        # NaN survives quantize() and cannot be compared
+        # anything that does not fit the amount column is not a price we charged
+        return amount if amount.is_finite() and abs(amount) < 10 ** 8 else None
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from orders.cache import invalidate_purchased_product_ids
+from orders.models import Order
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_purchases(sender, instance, using, raw=False, **kwargs):
+    if not raw: 
+        invalidate_purchased_product_ids(instance.user_id, using)
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import threading
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import mock
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.urls import reverse
+from rest_framework.test import APIClient
+from urllib3.exceptions import ConnectTimeoutError, ReadTimeoutError
+from orders.cache import get_purchased_product_ids, load_purchased_product_ids
+from orders.models import Cart, CartItem, Order, OrderItem
+from orders.payments import SESSION_PATH, PaymentGateway
+from orders.services import CartServices, InsufficientStock, OrderServices, PaymentServices
+from products.models import Category, Product
+from users.models import User
 
-# Create your tests here.
+
+# the threads write through connections of their own, which SQLite test databases do not allow
+@skipUnlessDBFeature('test_db_allows_multiple_connections')
+class ConcurrentAddItemTests(TransactionTestCase):
+    THREADS = 8
+    ADDS = 20
+
+    def setUp(self):
+        user = User.objects.create_user(email='buyer@example.com')
+        category = Category.objects.create(name='Lamps')
+        self.product = Product.objects.create(name='Desk lamp', description='', price=Decimal('10.00'), stock=0, category=category)
+        self.cart = Cart.objects.create(user=user)
+
+    def test_concurrent_adds_lose_no_increment(self):
+        errors = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(self.ADDS):
+                    CartServices.add_item(self.cart.id, self.product.id, 2)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            list(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity')),
+            [(self.product.id, self.THREADS * self.ADDS * 2)],
+        )
+
+
+class ApplyBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        cls.lamp, cls.bulb, cls.shade = [
+            Product.objects.create(name=name, description='', price=Decimal('10.00'), stock=0, category=category)
+            for name in ('Desk lamp', 'Bulb', 'Shade')
+        ]
+        cls.cart = Cart.objects.create(user=User.objects.create_user(email='buyer@example.com'))
+
+    def quantities(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity'))
+
+    def test_add_increments_the_stored_line(self):
+        CartServices.add_item(self.cart.id, self.lamp.id, 2)
+        CartServices.apply_batch(self.cart.id, [
+            {'op': 'add', 'product_id': self.lamp.id, 'quantity': 3},
+            {'op': 'add', 'product_id': self.bulb.id, 'quantity': 1},
+            {'op': 'add', 'product_id': self.bulb.id, 'quantity': 4},
+        ])
+        self.assertEqual(self.quantities(), {self.lamp.id: 5, self.bulb.id: 5})
+
+    def test_unknown_product_adds_nothing(self):
+        self.assertIsNone(CartServices.add_item(self.cart.id, self.shade.id + 1, 1))
+        self.assertEqual(self.quantities(), {})
+
+    def test_set_and_remove(self):
+        CartServices.add_item(self.cart.id, self.lamp.id, 2)
+        CartServices.add_item(self.cart.id, self.bulb.id, 2)
+        CartServices.apply_batch(self.cart.id, [
+            {'op': 'set', 'product_id': self.lamp.id, 'quantity': 7},
+            {'op': 'remove', 'product_id': self.bulb.id},
+            {'op': 'remove', 'product_id': self.shade.id},
+            {'op': 'add', 'product_id': self.shade.id, 'quantity': 1},
+        ])
+        self.assertEqual(self.quantities(), {self.lamp.id: 7, self.shade.id: 1})
+
+
+class StockReservationTests(TestCase):
+    LONG_AGO = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        cls.product = Product.objects.create(name='Desk lamp', description='', price=Decimal('10.00'), stock=5, category=category)
+
+    def age_change_marker(self):
+        Product.objects.filter(pk=self.product.pk).update(updated_at=self.LONG_AGO)
+
+    def test_reserve_and_release_move_the_change_marker(self):
+        self.age_change_marker()
+        OrderServices.reserve_stock({self.product.id: 3})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 2)
+        self.assertGreater(self.product.updated_at, self.LONG_AGO)
+
+        self.age_change_marker()
+        OrderServices.release_stock({self.product.id: 3})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+        self.assertGreater(self.product.updated_at, self.LONG_AGO)
+
+    def test_shortage_takes_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            OrderServices.reserve_stock({self.product.id: 6})
+        self.assertEqual(raised.exception.detail['items'], [
+            {'product_id': self.product.id, 'name': 'Desk lamp', 'requested': 6, 'available': 5},
+        ])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+
+class PurchasedProductsCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='buyer@example.com')
+        category = Category.objects.create(name='Lamps')
+        cls.lamp, cls.bulb = [
+            Product.objects.create(name=name, description='', price=Decimal('10.00'), stock=5, category=category)
+            for name in ('Desk lamp', 'Bulb')
+        ]
+        cls.add_order(cls.lamp)
+
+    @classmethod
+    def add_order(cls, product):
+        order = Order.objects.create(user=cls.user, total_price=product.price)
+        OrderItem.objects.create(order=order, product=product, price=product.price, quantity=1, total_price=product.price)
+
+    def test_lookups_after_the_first_run_no_order_query(self):
+        self.assertEqual(get_purchased_product_ids(self.user.id), {self.lamp.id})
+        with self.assertNumQueries(1):
+            self.assertEqual(get_purchased_product_ids(self.user.id), {self.lamp.id})
+
+    def test_set_loaded_before_an_order_commits_is_not_kept(self):
+        def load_then_order(user_id, using=None):
+            product_ids = load_purchased_product_ids(user_id, using)
+            # the order commits after the set was read and before it is cached
+            with self.captureOnCommitCallbacks(execute=True):
+                self.add_order(self.bulb)
+            return product_ids
+
+        with mock.patch('orders.cache.load_purchased_product_ids', side_effect=load_then_order):
+            self.assertEqual(get_purchased_product_ids(self.user.id), {self.lamp.id})
+        self.assertEqual(get_purchased_product_ids(self.user.id), {self.lamp.id, self.bulb.id})
+
+
+class PaymentGatewayRetryTests(SimpleTestCase):
+    def setUp(self):
+        gateway = PaymentGateway('store', 'secret', 'https://gateway.test', timeout=(1, 1), retries=2, backoff=0, pool_size=1)
+        self.retry = gateway.session.get_adapter('https://gateway.test').max_retries
+
+    def test_post_is_not_repeated_after_an_answer(self):
+        self.assertFalse(self.retry.is_retry('POST', 503))
+        with self.assertRaises(ReadTimeoutError):
+            self.retry.increment('POST', SESSION_PATH, error=ReadTimeoutError(None, SESSION_PATH, 'read timed out'))
+
+    def test_post_is_retried_on_connect_errors(self):
+        retry = self.retry.increment('POST', SESSION_PATH, error=ConnectTimeoutError())
+        self.assertEqual(retry.connect, 1)
+
+    def test_lookups_are_retried_on_gateway_errors(self):
+        self.assertTrue(self.retry.is_retry('GET', 503))
+
+
+class PaymentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='buyer@example.com', first_name='Ayesha')
+        category = Category.objects.create(name='Lamps')
+        product = Product.objects.create(name='Desk lamp', description='', price=Decimal('10.00'), stock=5, category=category)
+        cls.order = Order.objects.create(user=cls.user, total_price=Decimal('30.00'))
+        OrderItem.objects.create(order=cls.order, product=product, price=product.price, quantity=3, total_price=Decimal('30.00'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.gateway = mock.Mock()
+        patcher = mock.patch('orders.services.get_gateway', return_value=self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_initiate_charges_the_order_total(self):
+        self.gateway.create_session.return_value = {'status': 'SUCCESS', 'GatewayPageURL': 'https://gateway.test/pay'}
+        with mock.patch('orders.views.get_gateway', return_value=self.gateway):
+            response = self.client.post(
+                reverse('initiate-payment'), {'orderId': str(self.order.pk), 'amount': '1.00', 'numItems': 1}, format='json'
+            )
+        self.assertEqual(response.data, {'payment_url': 'https://gateway.test/pay'})
+        post_body = self.gateway.create_session.call_args.args[0]
+        self.assertEqual(post_body['total_amount'], '30.00')
+        self.assertEqual(post_body['num_of_item'], 3)
+        self.assertEqual(post_body['tran_id'], f'tr_{self.order.pk}')
+
+    def test_initiate_refuses_other_users_orders(self):
+        self.client.force_authenticate(User.objects.create_user(email='other@example.com'))
+        response = self.client.post(reverse('initiate-payment'), {'orderId': str(self.order.pk)}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+    def pay(self, amount):
+        callback = PaymentServices.record_callback({
+            'tran_id': f'tr_{self.order.pk}', 'val_id': 'val1', 'status': 'VALID', 'amount': amount,
+        })
+        self.gateway.validate.return_value = {'status': 'VALID', 'tran_id': f'tr_{self.order.pk}', 'amount': amount}
+        return PaymentServices.process_callbacks([callback])
+
+    def test_exact_amount_pays_the_order(self):
+        self.assertEqual(self.pay('30.00'), (1, 0, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.READY_TO_SHIP)
+
+    def test_garbage_amounts_are_not_amounts(self):
+        for amount in ('NaN', 'sNaN', 'Infinity', '-Infinity', 'ten', '1e9', None):
+            with self.subTest(amount=amount):
+                self.assertIsNone(PaymentServices._amount_of(amount))
+
+    def test_callback_with_a_garbage_amount_redirects(self):
+        for index, amount in enumerate(('NaN', 'Infinity', 'ten')):
+            with self.subTest(amount=amount):
+                response = self.client.post(reverse('payment-success'), {'tran_id': f'tr_x{index}', 'amount': amount, 'status': 'VALID'})
+                self.assertEqual(response.status_code, 302)
+        self.gateway.validate.assert_not_called()
+
+    def test_any_other_amount_is_rejected(self):
+        self.assertEqual(self.pay('31.00'), (0, 1, 0))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, Order.NOT_PAID)
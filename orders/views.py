@@ -1,21 +1,29 @@
+from uuid import UUID
 from django.shortcuts import render, redirect
+from django.db.models import Sum
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, ListModelMixin
-from orders.serializer import CartSerializer, CartItemSerializer, AddCartItemSerializer, UpdateCartItemSerializer, OrderSerializer, CreateOrderSerializer, UpdateOrderSerializer, EmptySerializer
+from orders.serializer import CartSerializer, CartItemSerializer, AddCartItemSerializer, UpdateCartItemSerializer, OrderSerializer, CreateOrderSerializer, UpdateOrderSerializer, EmptySerializer, CartBatchSerializer
 from orders.models import Cart, CartItem, Order, OrderItem
 from rest_framework import permissions
-from rest_framework.decorators import action, api_view
-from orders.services import OrderServices
+from rest_framework.decorators import action, api_view, permission_classes
+from orders.services import OrderServices, PaymentServices
+from orders.cache import get_purchased_product_ids
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import permissions
-from sslcommerz_lib import SSLCOMMERZ
+from orders.payments import PaymentGatewayError, get_gateway
 from django.conf import settings
 from django.http import HttpResponseRedirect
 from rest_framework.views import APIView
+from rest_framework.generics import get_object_or_404
+from django_filters.rest_framework import DjangoFilterBackend
+from orders.filters import OrderFilter
+from orders.pagination import OrderPagination
+from api.fieldsets import SparseFieldsetMixin
 
 
-class CartViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet, ListModelMixin): 
+class CartViewSet(SparseFieldsetMixin, CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet, ListModelMixin): 
     serializer_class = CartSerializer 
     permission_classes = [permissions.IsAuthenticated]
     def perform_create(self, serializer):
@@ -24,7 +32,7 @@ class CartViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, Gener
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Cart.objects.none()
-        return Cart.objects.prefetch_related('items__product').filter(user = self.request.user)
+        return Cart.objects.filter(user = self.request.user)
     
     def create(self, request, *args, **kwargs):
         existing_cart = Cart.objects.filter(user = request.user).first();  
@@ -39,6 +47,8 @@ class CartViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, Gener
 class CartItemViewSet(ModelViewSet): 
     http_method_names = ['get', 'post', 'patch', 'delete']
     def get_serializer_class(self):
+        if self.action == 'batch': 
+            return CartBatchSerializer
         if self.request.method == 'POST':
             return AddCartItemSerializer
         elif self.request.method == 'PATCH': 
@@ -51,9 +61,34 @@ class CartItemViewSet(ModelViewSet):
     def get_queryset(self):
         return CartItem.objects.select_related('product').filter(cart_id = self.kwargs.get('cart_pk'))
     
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def batch(self, request, cart_pk = None): 
+        """
+        Apply several cart changes in one request and one transaction: 
+        - body: {"operations": [{"op": "add" | "set" | "remove", "product_id": 1, "quantity": 2}, ...]}
+        - add increments a line (creating it), set replaces its quantity, remove deletes it
+        - operations apply in order, all or nothing
+        - returns the resulting cart
+        """
+        get_object_or_404(Cart, pk = cart_pk, user = request.user)
+        serializer = self.get_serializer(data = request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+    
 
-class OrderViewSet(ModelViewSet): 
+class OrderViewSet(SparseFieldsetMixin, ModelViewSet): 
+    """
+    Orders, newest first: 
+    - customers see their own orders, staff see everyone's
+    - cursor paginated on created_at, follow `next` / `previous`
+    - filter by `status`, `created_at__gte` / `created_at__lt` and (for staff) `user`
+    - ?fields= / ?expand=user narrow or widen each order, items are only loaded when rendered
+    """
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderFilter
+    pagination_class = OrderPagination
     
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk = None): 
@@ -64,7 +99,7 @@ class OrderViewSet(ModelViewSet):
     @action(detail= True, methods=['patch'])
     def update_status(self, request, pk = None): 
         order = self.get_object()
-        serializer = UpdateOrderSerializer(order, data = request.data, partial = True)
+        serializer = UpdateOrderSerializer(order, data = request.data, partial = True, context = self.get_serializer_context())
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response({'status': f'Order status updated to {request.data['status']}'})
@@ -81,7 +116,7 @@ class OrderViewSet(ModelViewSet):
     def get_serializer_context(self):
         if getattr(self, 'swagger_fake_view', False):
             return {}
-        return {'user_id': self.request.user.id, 'user': self.request.user}
+        return {**super().get_serializer_context(), 'user_id': self.request.user.id, 'user': self.request.user}
     
     def get_permissions(self):
         if self.action in ['update_status', 'destroy']:
@@ -90,27 +125,36 @@ class OrderViewSet(ModelViewSet):
     
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
-            return {}
+            return Order.objects.none()
         if self.request.user.is_staff: 
-            return Order.objects.prefetch_related('items__product').all()
-        return Order.objects.prefetch_related('items__product').filter(user=self.request.user)
+            return Order.objects.all()
+        return Order.objects.filter(user=self.request.user)
 
 
 @api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
 def initiate_payment(request):
-
+    """
+    Start a gateway checkout session for one of the user's unpaid orders
+    - the amount and item count come from the order, whatever the client sends
+    """
     user = request.user
-    amount = request.data.get("amount")
-    order_id = request.data.get("orderId")
-    num_items = request.data.get("numItems")
+    try: 
+        order_id = UUID(str(request.data.get("orderId")))
+    except ValueError: 
+        return Response({"error": "Invalid order id"}, status=status.HTTP_400_BAD_REQUEST)
+    order = (
+        Order.objects.filter(pk=order_id, user=user, status=Order.NOT_PAID)
+        .annotate(num_items=Sum('items__quantity'))
+        .first()
+    )
+    if order is None: 
+        return Response({"error": "No unpaid order with this id"}, status=status.HTTP_404_NOT_FOUND)
     
-    ssl_settings = {'store_id': 'phima6975dc6e2e54d',
-                'store_pass': 'phima6975dc6e2e54d@ssl', 'issandbox': True}
-    sslcz = SSLCOMMERZ(ssl_settings)
     post_body = {}
-    post_body['total_amount'] = amount
+    post_body['total_amount'] = str(order.total_price)
     post_body['currency'] = "BDT"
-    post_body['tran_id'] = f"tr_{order_id}"
+    post_body['tran_id'] = f"tr_{order.pk}"
     post_body['success_url'] = f"{settings.BACKEND_URL}/api/payment/success"
     post_body['fail_url'] = f"{settings.BACKEND_URL}/api/payment/fail"
     post_body['cancel_url'] = f"{settings.BACKEND_URL}/api/payment/cancel"
@@ -123,13 +167,16 @@ def initiate_payment(request):
     post_body['cus_country'] = "Bangladesh"
     post_body['shipping_method'] = "NO"
     post_body['multi_card_name'] = ""
-    post_body['num_of_item'] = num_items
+    post_body['num_of_item'] = order.num_items or 0
     post_body['product_name'] = "E-commerce Products"
     post_body['product_category'] = "General Category"
     post_body['product_profile'] = "general"
 
 
-    response = sslcz.createSession(post_body) # API response
+    try: 
+        response = get_gateway().create_session(post_body) # API response
+    except PaymentGatewayError: 
+        return Response({"error": "Payment gateway unavailable, please try again"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     
     if response.get("status") == 'SUCCESS' : 
         return Response({"payment_url": response.get("GatewayPageURL")})
@@ -139,18 +186,29 @@ def initiate_payment(request):
 
 @api_view(["POST"])
 def payment_success(request): 
-    order_id = request.data.get("tran_id").split('_')[1]
-    order = Order.objects.get(id = order_id)
-    order.status = "Ready to ship"
-    order.save()
+    """
+    Gateway callback for a completed payment: 
+    - recorded once per tran_id, repeats of the same callback only redirect
+    - the order moves to Ready to ship once the gateway confirms the payment
+    - callbacks the gateway could not confirm yet are left for `manage.py reconcile_payments`
+    """
+    callback = PaymentServices.record_callback(request.data)
+    if callback is not None: 
+        PaymentServices.process_callbacks([callback])
     return HttpResponseRedirect(f"{settings.FRONTEND_URL}/dashboard/orders")
 
 @api_view(["POST"])
 def payment_cancel(request): 
+    callback = PaymentServices.record_callback(request.data)
+    if callback is not None: 
+        PaymentServices.process_callbacks([callback])
     return HttpResponseRedirect(f"{settings.FRONTEND_URL}/dashboard/orders")
 
 @api_view(["POST"])
 def payment_fail(request): 
+    callback = PaymentServices.record_callback(request.data)
+    if callback is not None: 
+        PaymentServices.process_callbacks([callback])
     return HttpResponseRedirect(f"{settings.FRONTEND_URL}/dashboard/orders")
 
 
@@ -160,6 +218,28 @@ class HasOrderedProduct(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request, product_id): 
-        user = request.user
-        has_ordered = OrderItem.objects.filter(order__user = user, product_id = product_id).exists(); 
-        return Response({"has_ordered": has_ordered})
\ No newline at end of file
+        has_ordered = product_id in get_purchased_product_ids(request.user.id)
+        return Response({"has_ordered": has_ordered})
+
+
+class HasOrderedProducts(APIView): 
+    """
+    Which of these products has the user ordered: 
+    - `?product_ids=1,2,3` (up to 200 ids)
+    - returns {"ordered": [ids]}, a subset of the ids asked for
+    - canceled orders do not count
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_ids = 200
+    
+    def get(self, request): 
+        raw = request.query_params.get('product_ids', '')
+        try: 
+            product_ids = [int(value) for value in raw.split(',') if value.strip()]
+        except ValueError: 
+            return Response({"product_ids": ["Expected a comma separated list of ids"]}, status=status.HTTP_400_BAD_REQUEST)
+        if len(product_ids) > self.max_ids: 
+            return Response({"product_ids": [f"At most {self.max_ids} ids per request"]}, status=status.HTTP_400_BAD_REQUEST)
+        
+        purchased = get_purchased_product_ids(request.user.id)
+        return Response({"ordered": [product_id for product_id in dict.fromkeys(product_ids) if product_id in purchased]})
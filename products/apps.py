@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductsConfig(AppConfig):
     name = 'products'
+
+    def ready(self):
+        import products.signals
+        from products.search import ensure_sqlite_triggers
+        post_migrate.connect(ensure_sqlite_triggers, sender=self)
@@ -0,0 +1,177 @@
+"""
+Response cache for the anonymous, read-only catalog endpoints.
+
+Every cache key embeds the current catalog version. Any write to Product,
+Category or ProductImage bumps the version once its transaction commits, so
+entries cached before the write are never read again and simply expire.
+The version has to be seen by every process, so the cache is only used
+when settings.CATALOG_CACHE_ALIAS names a shared backend (api/caching.py).
+On a process-local one, a write in one worker would leave the others
+serving their old entries, so responses are then not cached at all.
+
+Stock is part of the cached product payload on purpose. Checkout and
+cancel change it with ProductQuerySet.update, which bumps the version like
+any other write, so the cache is emptied once per checkout. That keeps
+sold-out products from being shown as available for up to
+CATALOG_CACHE_TIMEOUT. The price is a lower hit rate while orders are
+coming in quickly.
+
+A hit reads the version and the entry, nothing else. Hits and misses are
+only counted for a sample of requests (CATALOG_CACHE_STATS_SAMPLE_RATE):
+counting every one would write the same counter entry on every request,
+which on the database cache serializes all anonymous traffic on one row.
+"""
+
+import hashlib
+import random
+import time
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+from api.caching import is_shared
+from api.replicas import use_primary
+
+VERSION_KEY = 'catalog:version'
+HITS_KEY = 'catalog:hits'
+MISSES_KEY = 'catalog:misses'
+
+
+def get_alias():
+    return getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')
+
+
+def get_cache():
+    return caches[get_alias()]
+
+
+def is_enabled():
+    return is_shared(get_alias())
+
+
+def get_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_stats_sample_rate():
+    return getattr(settings, 'CATALOG_CACHE_STATS_SAMPLE_RATE', 0.01)
+
+
+def increment(key, delta=1):
+    cache = get_cache()
+    # add() is a no-op when the key exists, incr() then works on every backend
+    cache.add(key, 0, timeout=None)
+    try:
+        value = cache.incr(key, delta)
+    except ValueError:
+        # evicted between add() and incr()
+        cache.set(key, delta, timeout=None)
+        return delta
+    # incr() is a get and a set on the database and file backends, which restores the default timeout
+    cache.touch(key, None)
+    return value
+
+
+def record(key):
+    """ Count a hit or a miss for a sample of requests, each sampled one standing for 1 / rate """
+    rate = get_stats_sample_rate()
+    if rate > 0 and random.random() < rate:
+        increment(key, round(1 / rate))
+
+
+def get_catalog_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # seeded from the clock so a version lost to eviction never repeats an older one
+        cache.add(VERSION_KEY, time.time_ns() // 1000, timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _bump_catalog_version():
+    # set() with no timeout, incr() would give the version the default timeout on some backends.
+    # The clock keeps two processes bumping at once from writing the same new version.
+    version = max(get_catalog_version() + 1, time.time_ns() // 1000)
+    get_cache().set(VERSION_KEY, version, timeout=None)
+
+
+def bump_catalog_version(using=DEFAULT_DB_ALIAS):
+    """ Invalidate every cached catalog response once the current transaction commits """
+    connection = connections[using]
+    if connection.in_atomic_block and any(func is _bump_catalog_version for _, func, _ in connection.run_on_commit):
+        return
+    transaction.on_commit(_bump_catalog_version, using=using)
+
+
+def get_stats():
+    cache = get_cache()
+    return {
+        'version': get_catalog_version(),
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
+
+
+def build_key(request, view):
+    # the whole query string is part of the key, in a stable order
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    raw = '|'.join([
+        request.build_absolute_uri(request.path),
+        query,
+        request.accepted_renderer.format,
+    ])
+    digest = hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return f'catalog:response:{get_catalog_version()}:{view.basename}:{view.action}:{digest}'
+
+
+class CatalogCacheMixin:
+    """
+    Serve list and retrieve for anonymous users from the catalog cache.
+    The serialized data is cached, so a hit skips the ORM queries and the serializers.
+    """
+    cached_headers = ('ETag', 'Last-Modified')
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated or not is_enabled():
+            return handler(request, *args, **kwargs)
+
+        cache = get_cache()
+        key = build_key(request, self)
+        cached = cache.get(key)
+        if cached is not None:
+            record(HITS_KEY)
+            data, status_code, headers = cached
+            response = Response(data, status=status_code, headers=headers)
+            response['X-Cache'] = 'HIT'
+            # validators were cached with the body, so conditional requests need no query either
+            return get_conditional_response(
+                request,
+                etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+                response=response,
+            )
+
+        record(MISSES_KEY)
+        # cached under the current version, so read where that version was written
+        with use_primary():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {name: response[name] for name in self.cached_headers if response.has_header(name)}
+            cache.set(key, (response.data, response.status_code, headers), timeout=get_timeout())
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
@@ -0,0 +1,75 @@
+"""
+Record formats shared by the import_catalog / export_catalog commands.
+
+A catalog stream is a sequence of records, one per line, each tagged with its
+`type`: category, product or image. Records are keyed by natural keys rather
+than database ids so a stream can be loaded into any database:
+- category: name
+- product:  (category, name)
+- image:    (category, product, image) for images from before the image
+            pipeline, `image` being the stored Cloudinary reference, or
+            (category, product, original) with the names of the stored
+            original and its `variants` for pipeline images
+"""
+
+import csv
+import json
+
+CATEGORY = 'category'
+PRODUCT = 'product'
+IMAGE = 'image'
+RECORD_TYPES = (CATEGORY, PRODUCT, IMAGE)
+
+# fields a record of each type cannot be imported without
+REQUIRED_FIELDS = {
+    CATEGORY: ('name',),
+    PRODUCT: ('category', 'name', 'price'),
+    # and an `image` or an `original`
+    IMAGE: ('category', 'product'),
+}
+
+CSV_COLUMNS = ['type', 'category', 'name', 'description', 'price', 'stock', 'product', 'image', 'original', 'variants']
+# nested values, written to CSV cells as JSON
+JSON_COLUMNS = ('variants',)
+
+FORMATS = ('ndjson', 'csv')
+
+
+def guess_format(path, default='ndjson'):
+    if path and path.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def read_records(stream, fmt):
+    """ Yield record dicts one at a time without loading the stream """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            record = {key: value for key, value in row.items() if value not in (None, '')}
+            for column in JSON_COLUMNS:
+                if column in record:
+                    record[column] = json.loads(record[column])
+            yield record
+        return
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+class RecordWriter:
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(stream, fieldnames=CSV_COLUMNS, extrasaction='ignore')
+            self.csv.writeheader()
+
+    def write(self, record):
+        if self.fmt == 'csv':
+            self.csv.writerow({
+                key: json.dumps(value) if key in JSON_COLUMNS and value is not None else value
+                for key, value in record.items()
+            })
+        else:
+            self.stream.write(json.dumps(record, default=str) + '\n')
@@ -0,0 +1,74 @@
+"""
+Conditional GET (ETag / Last-Modified) for catalog endpoints.
+
+Validators are derived from max(updated_at) and the row count of the filtered
+queryset with a single aggregate query, so a 304 never runs the serializer.
+Lists only get the ETag. A list changes without its max(updated_at)
+moving when a product other than the newest is deleted or leaves the
+filtered set, which only the count in the ETag catches, so answering
+If-Modified-Since there would send wrong 304s.
+"""
+
+import hashlib
+from urllib.parse import urlencode
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def compute_validators(request, queryset, marker_field='updated_at'):
+    state = queryset.order_by().aggregate(last_modified=Max(marker_field), total=Count('pk'))
+    if not state['total']:
+        return None, None
+    last_modified = int(state['last_modified'].timestamp())
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    raw = '|'.join([
+        request.path,
+        query,
+        request.accepted_renderer.format,
+        state['last_modified'].isoformat(),
+        str(state['total']),
+    ])
+    etag = '"%s"' % hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return etag, last_modified
+
+
+def set_validators(response, etag, last_modified):
+    if etag:
+        response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Answer list and retrieve with a 304 when the client's If-None-Match (and for retrieve
+    If-Modified-Since) still matches, and send the validators on full responses.
+    """
+    change_marker_field = 'updated_at'
+
+    def conditional_response(self, handler, queryset, request, *args, last_modified_header=True, **kwargs):
+        etag, last_modified = compute_validators(request, queryset, self.change_marker_field)
+        if not last_modified_header:
+            last_modified = None
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return set_validators(not_modified, etag, last_modified)
+        return set_validators(handler(request, *args, **kwargs), etag, last_modified)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(super().list, queryset, request, *args, last_modified_header=False, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try: 
+            queryset = self.get_queryset().filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError): 
+            # malformed lookup, let get_object() answer with its 404
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(super().retrieve, queryset, request, *args, **kwargs)
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+from rest_framework.utils.encoders import JSONEncoder
+from products.models import Product
+from products.serializers import ProductSerializer
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_product_chunks(queryset, chunk_size):
+    """
+    Walk the queryset in primary key order one chunk at a time, seeking past the last id
+    instead of holding a cursor open, with each chunk's images prefetched in one query.
+    """
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk').prefetch_related('images')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1].pk
+
+
+def flatten(value):
+    if isinstance(value, list):
+        return ' '.join(str(item.get('image', item)) if isinstance(item, dict) else str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return value
+
+
+def render_ndjson(rows, header=False):
+    return ''.join(json.dumps(row, cls=JSONEncoder) + '\n' for row in rows)
+
+
+def render_csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=ProductSerializer.Meta.fields)
+    if header:
+        writer.writeheader()
+    writer.writerows({key: flatten(value) for key, value in row.items()} for row in rows)
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    'ndjson': render_ndjson,
+    'csv': render_csv,
+}
+
+
+def stream_products(request, fmt, updated_since=None, chunk_size=500):
+    """ Yield the rendered catalog one chunk at a time, so memory is bounded by chunk_size """
+    render = RENDERERS[fmt]
+    queryset = Product.objects.all()
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    if fmt == 'csv':
+        yield render([], header=True)
+    for chunk in iter_product_chunks(queryset, chunk_size):
+        yield render(ProductSerializer(chunk, many=True, context={'request': request}).data)
@@ -0,0 +1,159 @@
+"""
+Serializer-free list rendering for hot read-only endpoints.
+
+A FastList reads the page with .values() and turns every rendered field
+into a precompiled converter over the row dict, so no model instance or
+serializer is created per row. Plain fields are a dict lookup, computed
+fields get a converter written to return exactly what the serializer
+field would, so the rendered JSON is byte-identical. Anything the FastList
+can not reproduce (unknown field types, ?expand=) falls back to the
+serializer. The FastList is off unless settings.FAST_LIST_RENDERING is
+set, so a view that declares one still renders through its serializer
+by default.
+"""
+
+from operator import itemgetter
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from api.fieldsets import requested_fieldset
+from api.profiling import span
+from products.images import stored_url, variant_urls
+from products.models import ProductImage
+from products.serializers import price_with_tax
+
+# serializer fields whose to_representation returns the database value unchanged
+PLAIN_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.FloatField,
+    serializers.BooleanField, serializers.PrimaryKeyRelatedField,
+)
+
+
+def is_plain(field):
+    if isinstance(field, serializers.DecimalField):
+        # stored values already have the field's decimal places, and the renderer
+        # turns an uncoerced Decimal into the same float either way
+        coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        return not coerce_to_string and not field.normalize_output and field.source != '*'
+    return type(field) in PLAIN_FIELDS and field.source != '*' and '.' not in field.source
+
+
+class FastList:
+    """
+    Build list rows for `serializer` (the narrowed instance the view would have used).
+    Subclasses map computed field names to methods returning (columns, make_converter),
+    where make_converter(rows) gets the whole page and returns a converter for one row.
+    """
+    computed_fields = {}
+
+    def __init__(self, serializer):
+        self.context = serializer.context
+        self.columns = ['id']
+        self.fields = []
+        self.supported = True
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in self.computed_fields:
+                columns, make_converter = getattr(self, self.computed_fields[name])()
+            elif is_plain(field):
+                columns, make_converter = [field.source], self.lookup(field.source)
+            else:
+                self.supported = False
+                return
+            self.add_columns(columns)
+            self.fields.append((name, make_converter))
+
+    def lookup(self, column):
+        getter = itemgetter(column)
+        return lambda rows: getter
+
+    def add_columns(self, names):
+        self.columns += [name for name in names if name not in self.columns]
+
+    def build(self, rows):
+        rows = list(rows)
+        converters = [(name, make_converter(rows)) for name, make_converter in self.fields]
+        return [{name: convert(row) for name, convert in converters} for row in rows]
+
+
+class ProductFastList(FastList):
+    computed_fields = {
+        'price_with_tax': 'price_with_tax',
+        'rating_histogram': 'rating_histogram',
+        'images': 'images',
+    }
+
+    def price_with_tax(self):
+        getter = itemgetter('price')
+        return ['price'], lambda rows: lambda row: price_with_tax(getter(row))
+
+    def rating_histogram(self):
+        columns = [f'rating_{stars}_count' for stars in range(1, 6)]
+        getters = [(str(stars), itemgetter(column)) for stars, column in enumerate(columns, start=1)]
+        return columns, lambda rows: lambda row: {stars: getter(row) for stars, getter in getters}
+
+    def images(self):
+        # one query for the whole page, in the order prefetch_related('images') would return them,
+        # rendered as ProductImageSerializer would from the values rows
+        request = self.context.get('request')
+
+        def image_url(original, image):
+            # ProductImageField: the uploaded original, else the Cloudinary image from before the pipeline
+            if original:
+                return stored_url(original, request)
+            if not image or getattr(image, 'url', None) is None:
+                return None
+            return request.build_absolute_uri(image.url) if request is not None else image.url
+
+        def make_converter(rows):
+            images = {}
+            product_ids = [row['id'] for row in rows]
+            for image in ProductImage.objects.filter(product_id__in=product_ids).values(
+                'id', 'product_id', 'original', 'image', 'status', 'variants'
+            ):
+                images.setdefault(image['product_id'], []).append({
+                    'id': image['id'],
+                    'image': image_url(image['original'], image['image']),
+                    'status': image['status'],
+                    'variants': variant_urls(image['variants'], request),
+                })
+            return lambda row: images.get(row['id'], [])
+        return [], make_converter
+
+
+class CategoryFastList(FastList):
+    pass
+
+
+class FastListMixin:
+    """
+    Declare a `fast_list_class`, list then bypasses the serializer whenever settings.FAST_LIST_RENDERING
+    is on and the FastList supports the request
+    """
+    fast_list_class = None
+
+    def get_fast_list(self):
+        if not settings.FAST_LIST_RENDERING or self.fast_list_class is None or requested_fieldset(self.request)[1]:
+            return None
+        fast_list = self.fast_list_class(self.get_serializer())
+        return fast_list if fast_list.supported else None
+
+    def list(self, request, *args, **kwargs):
+        fast_list = self.get_fast_list()
+        if fast_list is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # cursors read the ordering columns from the rows
+        ordering = [*queryset.query.order_by, *(getattr(self.paginator, 'page_ordering', None) or [])]
+        fast_list.add_columns(key.lstrip('-') for key in ordering if isinstance(key, str) and '__' not in key)
+        queryset = queryset.prefetch_related(None).values(*fast_list.columns)
+
+        page = self.paginate_queryset(queryset)
+        with span('serialize'):
+            rows = fast_list.build(page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
@@ -0,0 +1,64 @@
+"""
+Model fields.
+
+CloudinaryField stores the same column as cloudinary's CloudinaryField
+and reads and writes the same values, but it only imports the cloudinary
+SDK once a stored value is used. The SDK pulls in urllib3 and its own
+configuration, and only images from before the image pipeline
+(products/images.py) use the field, so processes that keep images in
+local storage never need it.
+"""
+
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models
+from django.utils.functional import cached_property
+
+
+class CloudinaryField(models.Field):
+    description = "A resource stored in Cloudinary"
+
+    def __init__(self, *args, **kwargs):
+        kwargs['max_length'] = 255
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['max_length']
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'CharField'
+
+    @cached_property
+    def sdk_field(self):
+        """ The cloudinary field the values are handled by, created on first use """
+        from cloudinary.models import CloudinaryField as SDKCloudinaryField
+        field = SDKCloudinaryField(self.verbose_name, blank=self.blank, null=self.null)
+        field.set_attributes_from_name(self.name)
+        field.model = self.model
+        return field
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.sdk_field.parse_cloudinary_resource(value)
+
+    def to_python(self, value):
+        if value is None or value is False:
+            return value
+        return self.sdk_field.to_python(value)
+
+    def pre_save(self, model_instance, add):
+        value = super().pre_save(model_instance, add)
+        if isinstance(value, UploadedFile):
+            return self.sdk_field.pre_save(model_instance, add)
+        return value
+
+    def get_prep_value(self, value):
+        if not value:
+            return self.get_default()
+        return self.sdk_field.get_prep_value(value)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self.value_from_object(obj))
+
+    def formfield(self, **kwargs):
+        return self.sdk_field.formfield(**kwargs)
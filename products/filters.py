@@ -1,11 +1,39 @@
-from django_filters.rest_framework import FilterSet
-from products.models import Product 
+from django_filters.rest_framework import FilterSet, NumberFilter
+from rest_framework.filters import SearchFilter
+from products.models import Product, Review 
+from products.search import search_products
 
 
 class ProductFilter(FilterSet): 
+    min_rating = NumberFilter(field_name='average_rating', lookup_expr='gte')
+    
     class Meta: 
         model = Product
         fields = {
             'category_id': ['exact'],
             'price': ['gt', 'lt'], 
-        }
\ No newline at end of file
+        }
+
+
+class ReviewFilter(FilterSet): 
+    class Meta: 
+        model = Review
+        fields = {
+            'ratings': ['exact', 'gte', 'lte'], 
+        }
+
+
+class ProductSearchFilter(SearchFilter): 
+    """
+    `?search=` backed by the full-text index in products.search.
+    Results come best match first unless the client asks for an explicit `?ordering=`.
+    Falls back to DRF's icontains search on databases without a full-text backend.
+    """
+    def filter_queryset(self, request, queryset, view):
+        search = request.query_params.get(self.search_param, '')
+        if not search.strip(): 
+            return queryset
+        results = search_products(queryset, search)
+        if results is None: 
+            return super().filter_queryset(request, queryset, view)
+        return results
@@ -0,0 +1,147 @@
+"""
+Product image pipeline.
+
+An upload stores the original through the image storage and leaves the
+ProductImage Pending. The variants in settings.PRODUCT_IMAGES['VARIANTS']
+are then rendered as WebP and JPEG and the image is marked Ready, so list
+views can ship a card sized image instead of the full original. Rendering
+is done by `manage.py process_product_images --loop` when
+PRODUCT_IMAGES['WORKER'] says one runs, otherwise by the upload request
+once it commits. Images it could not render stay Pending for the
+command. The storage is any Django storage class named in
+PRODUCT_IMAGES['STORAGE'], Cloudinary by default. Pillow is imported by
+the functions that decode and encode, so requests that only build URLs
+never load it.
+"""
+
+import logging
+import os
+from functools import lru_cache
+from io import BytesIO
+from uuid import uuid4
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# format -> (file extension, save options)
+VARIANT_FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'optimize': True, 'progressive': True}),
+}
+
+
+@lru_cache(maxsize=None)
+def get_image_storage():
+    config = settings.PRODUCT_IMAGES['STORAGE']
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def original_upload_to(instance, filename):
+    _, extension = os.path.splitext(filename)
+    return f'originals/{instance.product_id}/{uuid4().hex}{extension.lower()}'
+
+
+def stored_url(name, request=None):
+    """ URL of a name in the image storage, absolute when there is a request """
+    location = get_image_storage().url(name)
+    return request.build_absolute_uri(location) if request is not None else location
+
+
+def variant_urls(variants, request=None):
+    """ {variant: {format: url}} for the stored variant names, absolute when there is a request """
+    return {
+        variant: {format: stored_url(name, request) for format, name in names.items()}
+        for variant, names in variants.items()
+    }
+
+
+def render_variants(name):
+    """ Render every configured variant of the stored original `name`, returns {variant: {format: stored name}} """
+    from PIL import Image, ImageOps
+    storage = get_image_storage()
+    config = settings.PRODUCT_IMAGES
+    sizes = sorted(config['VARIANTS'].items(), key=lambda item: item[1], reverse=True)
+    stem = os.path.splitext(name.replace('originals/', 'variants/', 1))[0]
+
+    with storage.open(name, 'rb') as source:
+        picture = Image.open(source)
+        # JPEG originals are decoded at a reduced scale that still covers the largest variant
+        picture.draft('RGB', sizes[0][1])
+        picture = ImageOps.exif_transpose(picture)
+        picture.load()
+
+    has_alpha = picture.mode in ('RGBA', 'LA') or 'transparency' in picture.info
+    picture = picture.convert('RGBA' if has_alpha else 'RGB')
+    variants = {}
+    # each variant is scaled down from the previous, larger one
+    for variant, size in sizes:
+        picture = picture.copy()
+        picture.thumbnail(size, Image.LANCZOS)
+        variants[variant] = {
+            format: storage.save(f'{stem}-{variant}.{extension}', ContentFile(encode(picture, format, options, config['QUALITY'])))
+            for format, (extension, options) in VARIANT_FORMATS.items()
+        }
+    return variants
+
+
+def process_pending_image(pk=None):
+    """
+    Render the variants of one Pending image, the given one or else the oldest, and mark it
+    Ready, or Failed when it can not be decoded. Returns the new status, None when nothing was pending
+    """
+    from PIL import Image
+    from products.models import ProductImage
+    with transaction.atomic():
+        # the row stays locked while it renders, a crashed worker leaves it Pending for the next one
+        pending = ProductImage.objects.select_for_update(skip_locked=True).filter(status=ProductImage.PENDING).exclude(original='')
+        if pk is not None:
+            pending = pending.filter(pk=pk)
+        image = pending.order_by('pk').first()
+        if image is None:
+            return None
+        try:
+            image.variants = render_variants(image.original.name)
+            image.status = ProductImage.READY
+        except (OSError, ValueError, Image.DecompressionBombError) as error:
+            # Pillow raises these for unreadable or unsupported images
+            logger.warning("Image %s (%s): %s", image.pk, image.original.name, error)
+            image.status = ProductImage.FAILED
+        image.save(update_fields=['variants', 'status'])
+        return image.status
+
+
+def process_after_upload(image):
+    """ Render a new upload's variants once its transaction commits, unless a worker will """
+    if settings.PRODUCT_IMAGES.get('WORKER'):
+        return
+
+    def process():
+        try:
+            process_pending_image(image.pk)
+        except Exception:
+            # e.g. the storage is unreachable, the image stays Pending for `manage.py process_product_images`
+            logger.exception("Rendering the variants of image %s failed", image.pk)
+
+    transaction.on_commit(process)
+
+
+def encode(picture, format, options, quality):
+    from PIL import Image
+    if format == 'jpeg' and picture.mode == 'RGBA':
+        # JPEG has no transparency, flatten onto white like the storefront background
+        background = Image.new('RGB', picture.size, 'white')
+        background.paste(picture, mask=picture.getchannel('A'))
+        picture = background
+    buffer = BytesIO()
+    picture.save(buffer, quality=quality, **options)
+    return buffer.getvalue()
+
+
+def delete_stored_files(name, variants):
+    storage = get_image_storage()
+    for stored in [name, *(stored for names in variants.values() for stored in names.values())]:
+        if stored:
+            storage.delete(stored)
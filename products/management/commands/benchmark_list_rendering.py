@@ -0,0 +1,87 @@
+import random
+import time
+import tracemalloc
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from products.fastlist import ProductFastList
+from products.models import Category, Product, ProductImage
+from products.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare building product list rows with ProductSerializer against the serializer-free "
+        "FastList path: rows/sec, peak traced memory, and a byte-for-byte check of the rendered JSON. "
+        "Seeded rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help="Rows per rendered page")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--fields', help="Render only these fields, as with ?fields=")
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        query = f"?fields={options['fields']}" if options['fields'] else ''
+        request = Request(APIRequestFactory().get(f'/api/products/{query}'))
+
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), transaction.atomic():
+            self.seed(rows)
+            queryset = Product.objects.order_by('-pk')
+
+            def serializer_path():
+                page = list(queryset.prefetch_related('images')[:rows])
+                return ProductSerializer(page, many=True, context={'request': request}).data
+
+            def fast_path():
+                fast_list = ProductFastList(ProductSerializer(context={'request': request}))
+                return fast_list.build(queryset.values(*fast_list.columns)[:rows])
+
+            renderer = JSONRenderer()
+            if renderer.render(serializer_path()) != renderer.render(fast_path()):
+                raise CommandError("The FastList output differs from ProductSerializer")
+            results = [(name, *self.measure(path, rows, repeat)) for name, path in
+                       [('ProductSerializer', serializer_path), ('FastList', fast_path)]]
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{rows} rows per page, best of {repeat}, rendered JSON identical")
+        self.stdout.write(f"{'path':<18} {'rows/sec':>10} {'ms/page':>9} {'peak KiB':>9}")
+        for name, elapsed, peak in results:
+            self.stdout.write(f"{name:<18} {rows / elapsed:>10.0f} {elapsed * 1000:>9.1f} {peak / 1024:>9.0f}")
+        self.stdout.write(f"speedup {results[0][1] / results[1][1]:.1f}x, memory {results[0][2] / max(results[1][2], 1):.1f}x less")
+
+    def seed(self, count):
+        rng = random.Random(count)
+        category = Category.objects.create(name='List rendering benchmark')
+        products = Product.objects.bulk_create(
+            Product(
+                name=f'Product {index}',
+                description=' '.join(rng.choices(['steel', 'cotton', 'wireless', 'classic', 'portable'], k=30)),
+                price=Decimal(rng.randint(100, 50_000)) / 100,
+                stock=rng.randint(0, 500),
+                category=category,
+            )
+            for index in range(count)
+        )
+        ProductImage.objects.bulk_create(
+            ProductImage(product=product, image=f'products/{product.pk}-{index}.jpg')
+            for product in products for index in range(rng.randint(0, 3))
+        )
+
+    def measure(self, path, rows, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            path()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        path()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return best, peak
@@ -0,0 +1,93 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from products.models import Category, Product
+from products.search import search_products
+
+
+WORDS = [
+    'smart', 'phone', 'laptop', 'wireless', 'headphones', 'cotton', 'shirt', 'leather',
+    'wallet', 'kitchen', 'blender', 'steel', 'bottle', 'novel', 'history', 'science',
+    'camera', 'lens', 'gaming', 'mouse', 'keyboard', 'desk', 'lamp', 'organic', 'tea',
+    'running', 'shoes', 'watch', 'backpack', 'charger', 'portable', 'speaker', 'classic',
+]
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'te', 'zu', 'no', 'vi', 'sha', 'pen', 'dor', 'lex', 'tri', 'mo', 'qua', 'sel']
+QUERIES = ['phone', 'wire', 'leather wallet', 'gaming keyboard', 'portable speak', 'organic tea', 'kalo', 'shapen dor']
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ?search= latency of the full-text index against the old icontains "
+        "SearchFilter at growing catalog sizes. Seeded rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per query")
+        parser.add_argument('--batch-size', type=int, default=5_000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            category = Category.objects.create(name='Benchmark')
+            seeded = 0
+            rows = []
+            for size in sorted(options['sizes']):
+                seeded += self.seed(category, size - seeded, options['batch_size'])
+                rows.append(self.measure(size, options['repeat']))
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{'products':>10} {'icontains ms':>14} {'full-text ms':>14} {'speedup':>8}")
+        for size, icontains_ms, fulltext_ms in rows:
+            self.stdout.write(
+                f"{size:>10} {icontains_ms:>14.2f} {fulltext_ms:>14.2f} {icontains_ms / fulltext_ms:>7.1f}x"
+            )
+
+    def seed(self, category, count, batch_size):
+        rng = random.Random(count)
+        # a few very common catalog words on top of a long tail of brand/model-like words
+        vocabulary = WORDS + [a + b + c for a in SYLLABLES for b in SYLLABLES for c in ('', *SYLLABLES[:8])]
+        created = 0
+        while created < count:
+            batch = [
+                Product(
+                    name=f"{rng.choice(vocabulary)} {rng.choice(WORDS)} {rng.choice(vocabulary)}",
+                    description=' '.join(rng.choices(vocabulary, k=20)),
+                    price=Decimal(rng.randint(100, 100_000)) / 100,
+                    stock=rng.randint(0, 500),
+                    category=category,
+                )
+                for _ in range(min(batch_size, count - created))
+            ]
+            Product.objects.bulk_create(batch)
+            created += len(batch)
+        return created
+
+    def measure(self, size, repeat):
+        queryset = Product.objects.select_related('category')
+
+        def icontains(query):
+            condition = Q()
+            for term in query.split():
+                condition &= Q(name__icontains=term) | Q(description__icontains=term)
+            return queryset.filter(condition)
+
+        def fulltext(query):
+            return search_products(queryset, query)
+
+        return size, self.time_page(icontains, repeat), self.time_page(fulltext, repeat)
+
+    def time_page(self, build, repeat):
+        # one paginated API page: a count plus the first 10 rows
+        timings = []
+        for query in QUERIES:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                results = build(query)
+                results.count()
+                list(results[:10])
+                timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from products.cache import bump_catalog_version, get_stats, is_enabled, reset_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Report hit/miss counts of the catalog response cache. The counters live in the shared cache "
+        "(settings.CATALOG_CACHE_ALIAS), so they include every web worker. They are estimated from a sample "
+        "of requests, settings.CATALOG_CACHE_STATS_SAMPLE_RATE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help="Reset the hit/miss counters after reporting")
+        parser.add_argument('--invalidate', action='store_true', help="Bump the catalog version, dropping every cached response")
+
+    def handle(self, *args, **options):
+        if not is_enabled():
+            self.stderr.write("The catalog cache is off, settings.CATALOG_CACHE_ALIAS is local to each process")
+        stats = get_stats()
+        lookups = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / lookups * 100 if lookups else 0
+        self.stdout.write(f"Catalog version: {stats['version']}")
+        self.stdout.write(f"Hits: {stats['hits']}  Misses: {stats['misses']}  Hit ratio: {ratio:.1f}%")
+        if options['reset']:
+            reset_stats()
+            self.stdout.write("Counters reset")
+        if options['invalidate']:
+            bump_catalog_version()
+            self.stdout.write("Catalog version bumped")
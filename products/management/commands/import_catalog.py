@@ -0,0 +1,229 @@
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.utils import timezone
+from products.cache import bump_catalog_version
+from products.catalog_io import CATEGORY, FORMATS, IMAGE, PRODUCT, REQUIRED_FIELDS, guess_format, read_records
+from products.models import Category, Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream an NDJSON or CSV catalog (see export_catalog) into the database. Rows are upserted "
+        "by natural key in batches with bulk_create/bulk_update, holding at most one batch per record type in memory. "
+        "The natural keys are unique in the database, so a re-run or a concurrent run updates rows instead of duplicating them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults from the file extension, else ndjson")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        self.buffers = {CATEGORY: [], PRODUCT: [], IMAGE: []}
+        self.stats = {'created': 0, 'updated': 0, 'skipped': 0}
+        # categories are few, so their ids are kept for the whole run
+        self.category_ids = dict(Category.objects.values_list('name', 'pk'))
+        self.start = time.perf_counter()
+        self.rows = 0
+
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        try:
+            for line_number, record in enumerate(read_records(stream, fmt), start=1):
+                record_type = record.get('type')
+                if record_type not in self.buffers:
+                    raise CommandError(f"Record {line_number}: unknown type {record_type!r}")
+                self.validate(line_number, record)
+                self.buffers[record_type].append(record)
+                self.rows += 1
+                if len(self.buffers[record_type]) >= self.batch_size:
+                    self.flush(record_type)
+            for record_type in (CATEGORY, PRODUCT, IMAGE):
+                self.flush(record_type)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - self.start
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.rows} records in {elapsed:.1f}s ({self.rows / max(elapsed, 1e-9):.0f} rows/sec): "
+            f"{self.stats['created']} created, {self.stats['updated']} updated, {self.stats['skipped']} unchanged"
+        ))
+
+    def validate(self, line_number, record):
+        # checked while the line number is known, the record is only used once its batch is flushed
+        missing = [field for field in REQUIRED_FIELDS[record['type']] if field not in record]
+        if missing:
+            raise CommandError(f"Record {line_number}: {record['type']} without {', '.join(missing)}")
+        if record['type'] == IMAGE and not (record.get('image') or record.get('original')):
+            raise CommandError(f"Record {line_number}: image without image or original")
+        if record['type'] == PRODUCT:
+            try:
+                price = Decimal(str(record['price']))
+            except InvalidOperation:
+                price = None
+            if price is None or not price.is_finite():
+                raise CommandError(f"Record {line_number}: invalid price {record['price']!r}")
+            record['price'] = price
+            stock = record.get('stock', 0)
+            try:
+                count = Decimal(str(stock))
+            except InvalidOperation:
+                count = None
+            if count is None or not count.is_finite() or count < 0 or count != count.to_integral_value():
+                raise CommandError(f"Record {line_number}: invalid stock {stock!r}")
+            record['stock'] = int(count)
+
+    def flush(self, record_type):
+        # a batch may reference rows still waiting in the buffers of the types it depends on
+        dependencies = {CATEGORY: [], PRODUCT: [CATEGORY], IMAGE: [CATEGORY, PRODUCT]}[record_type]
+        for dependency in dependencies:
+            self.flush(dependency)
+        records, self.buffers[record_type] = self.buffers[record_type], []
+        if not records:
+            return
+        with transaction.atomic():
+            upserts = {CATEGORY: self.upsert_categories, PRODUCT: self.upsert_products, IMAGE: self.upsert_images}
+            upserts[record_type](records)
+        elapsed = time.perf_counter() - self.start
+        self.stderr.write(f"{self.rows} rows read, {self.rows / max(elapsed, 1e-9):.0f} rows/sec")
+
+    def upsert_categories(self, records):
+        records = {record['name']: record for record in records}
+        existing = Category.objects.in_bulk(
+            [self.category_ids[name] for name in records if name in self.category_ids]
+        )
+        to_create, to_update = [], []
+        for name, record in records.items():
+            category = existing.get(self.category_ids.get(name))
+            description = record.get('description')
+            if category is None:
+                to_create.append(Category(name=name, description=description))
+            elif category.description != description:
+                category.description = description
+                category.updated_at = timezone.now()
+                to_update.append(category)
+            else:
+                self.stats['skipped'] += 1
+        # a run that created the same category meanwhile is updated instead
+        created = Category.objects.bulk_create(
+            to_create, update_conflicts=True, unique_fields=['name'], update_fields=['description', 'updated_at'],
+        )
+        for category in created:
+            self.category_ids[category.name] = category.pk
+        Category.objects.bulk_update(to_update, ['description', 'updated_at'])
+        if to_create or to_update:
+            # bulk_create and bulk_update skip the signals that invalidate the catalog cache
+            bump_catalog_version()
+        self.count(to_create, to_update)
+
+    def upsert_products(self, records):
+        keyed = {}
+        for record in records:
+            category_id = self.category_ids.get(record.get('category'))
+            if category_id is None:
+                raise CommandError(f"Product {record.get('name')!r} references unknown category {record.get('category')!r}")
+            keyed[(category_id, record['name'])] = record
+
+        existing = {
+            (product.category_id, product.name): product
+            for product in Product.objects.filter(self.product_lookup(keyed)).only(
+                'pk', 'category_id', 'name', 'description', 'price', 'stock'
+            )
+        }
+        now = timezone.now()
+        to_create, to_update = [], []
+        for (category_id, name), record in keyed.items():
+            values = {
+                'description': record.get('description', ''),
+                'price': record['price'],
+                'stock': record['stock'],
+            }
+            product = existing.get((category_id, name))
+            if product is None:
+                to_create.append(Product(category_id=category_id, name=name, **values))
+            elif any(getattr(product, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+                to_update.append(product)
+            else:
+                self.stats['skipped'] += 1
+        Product.objects.bulk_create(
+            to_create, update_conflicts=True, unique_fields=['category', 'name'],
+            update_fields=['description', 'price', 'stock', 'updated_at'],
+        )
+        Product.objects.bulk_update(to_update, ['description', 'price', 'stock', 'updated_at'])
+        self.count(to_create, to_update)
+
+    def upsert_images(self, records):
+        # keyed by the original's name for pipeline images, by the Cloudinary reference for older ones
+        image_field = ProductImage._meta.get_field('image')
+        keyed = {}
+        for record in records:
+            category_id = self.category_ids.get(record.get('category'))
+            if record.get('original'):
+                key = ('original', record['original'])
+            else:
+                key = ('image', image_field.get_prep_value(image_field.to_python(record['image'])))
+            keyed[(category_id, record['product'], *key)] = record
+        product_ids = {
+            (category_id, name): pk
+            for pk, category_id, name in Product.objects.filter(
+                self.product_lookup({(category_id, product) for category_id, product, _, _ in keyed})
+            ).values_list('pk', 'category_id', 'name')
+        }
+        wanted = {}
+        for (category_id, product, field, name), record in keyed.items():
+            product_id = product_ids.get((category_id, product))
+            if product_id is None:
+                raise CommandError(f"Image {name!r} references unknown product {product!r}")
+            if field == 'image':
+                # served by Cloudinary as they are, there is nothing to render
+                image = ProductImage(product_id=product_id, image=name, status=ProductImage.READY)
+            else:
+                # without variants the original is rendered again, e.g. by `manage.py process_product_images`
+                variants = record.get('variants') or {}
+                image = ProductImage(
+                    product_id=product_id, original=name, variants=variants,
+                    status=ProductImage.READY if variants else ProductImage.PENDING,
+                )
+            wanted[(product_id, field, name)] = image
+
+        existing = set()
+        for product_id, image, original in ProductImage.objects.filter(
+            product_id__in={product_id for product_id, _, _ in wanted}
+        ).values_list('product_id', 'image', 'original'):
+            if original:
+                existing.add((product_id, 'original', original))
+            if image:
+                existing.add((product_id, 'image', image_field.get_prep_value(image)))
+        to_create = [image for key, image in wanted.items() if key not in existing]
+        self.stats['skipped'] += len(wanted) - len(to_create)
+        ProductImage.objects.bulk_create(to_create)
+        if to_create:
+            # bulk_create skips signals, the products' change markers (and the catalog cache) move here instead
+            Product.objects.filter(pk__in={image.product_id for image in to_create}).update(updated_at=Now())
+        self.count(to_create, [])
+
+    def product_lookup(self, keys):
+        condition = Q(pk__in=[])
+        by_category = {}
+        for category_id, name in keys:
+            by_category.setdefault(category_id, []).append(name)
+        for category_id, names in by_category.items():
+            condition |= Q(category_id=category_id, name__in=names)
+        return condition
+
+    def count(self, created, updated):
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(updated)
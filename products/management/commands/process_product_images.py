@@ -0,0 +1,38 @@
+import time
+from django.core.management.base import BaseCommand
+from products.images import process_pending_image
+from products.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the thumbnail/card/detail variants of pending product images and mark them Ready. "
+        "Processes what is pending and exits, or keeps polling with --loop. Several workers can run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new uploads until interrupted")
+        parser.add_argument('--interval', type=float, default=2, help="Seconds between polls when nothing is pending")
+
+    def handle(self, *args, **options):
+        stats = {ProductImage.READY: 0, ProductImage.FAILED: 0}
+        start = time.perf_counter()
+        try:
+            while True:
+                status = self.process_next()
+                if status is not None:
+                    stats[status] += 1
+                elif options['loop']:
+                    time.sleep(options['interval'])
+                else:
+                    break
+        except KeyboardInterrupt:
+            pass
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{stats[ProductImage.READY]} images ready, {stats[ProductImage.FAILED]} failed in {elapsed:.2f}s"
+        )
+
+    def process_next(self):
+        """ Render one pending image, returns its new status or None when nothing is pending """
+        return process_pending_image()
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from products.models import Category
+
+
+class Command(BaseCommand):
+    help = "Recompute Category.product_count from the product table and fix any drifted rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report categories whose count is wrong")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = [
+                (category.pk, category.name, category.product_count, category.actual)
+                for category in Category.objects.annotate(actual=Count('products')).order_by('pk')
+                if category.product_count != category.actual
+            ]
+            for pk, name, stored, actual in drifted:
+                self.stdout.write(f"Category {pk} ({name}): stored {stored}, actual {actual}")
+            if drifted and not options['dry_run']:
+                Category.refresh_product_counts([pk for pk, *_ in drifted])
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All category product counts are correct"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} categories have a wrong product count"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drifted)} category product counts"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored review count, rating sum, average and histogram of every product that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report products whose aggregates are wrong")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            products = Product.objects.annotate(
+                actual_count=Count('review'), actual_sum=Sum('review__ratings', default=0)
+            ).order_by('pk').values_list('pk', 'review_count', 'rating_sum', 'actual_count', 'actual_sum')
+            drifted = [pk for pk, count, total, actual_count, actual_sum in products.iterator()
+                       if (count, total) != (actual_count, actual_sum)]
+            if drifted and not options['dry_run']:
+                Product.refresh_rating_aggregates(drifted)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All product rating aggregates are correct"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} products have wrong rating aggregates: {drifted}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired rating aggregates of {len(drifted)} products"))
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-17 18:44
+
+import cloudinary.models
+import products.images
+import products.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_review_product_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='original',
+            field=models.ImageField(blank=True, storage=products.images.get_image_storage, upload_to=products.images.original_upload_to, validators=[products.validators.validate_file_size]),
+        ),
+        # existing images are served from Cloudinary as they are, so they start out Ready
+        migrations.AddField(
+            model_name='productimage',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Ready', 'Ready'), ('Failed', 'Failed')], default='Ready', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Ready', 'Ready'), ('Failed', 'Failed')], default='Pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=cloudinary.models.CloudinaryField(blank=True, max_length=255, null=True, verbose_name='image'),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['status'], name='productimage_status_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 18:52
+
+import products.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_image_pipeline'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=products.fields.CloudinaryField(blank=True, null=True, verbose_name='image'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 19:39
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    """ Name the rows that break the new constraints, they have to be merged by hand first """
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    duplicates = [
+        f"category {row['name']!r}"
+        for row in Category.objects.values('name').annotate(rows=Count('pk')).filter(rows__gt=1)
+    ] + [
+        f"product {row['name']!r} in category {row['category']}"
+        for row in Product.objects.values('category', 'name').annotate(rows=Count('pk')).filter(rows__gt=1)
+    ]
+    if duplicates:
+        raise RuntimeError(f"Merge the duplicate catalog rows before migrating: {', '.join(duplicates)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_lazy_cloudinary_field'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_category_name_idx',
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('category', 'name'), name='product_category_name_uniq'),
+        ),
+    ]
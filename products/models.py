@@ -1,16 +1,72 @@
 from django.db import models
+from django.db.models import Avg, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from products.validators import validate_file_size
-from cloudinary.models import CloudinaryField
+from products.cache import bump_catalog_version
+from products.images import get_image_storage, original_upload_to
+from products.fields import CloudinaryField
 
 class Category(models.Model): 
-    name = models.CharField(max_length=100)
+    # natural key of import_catalog upserts
+    name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self): 
         return self.name
     
+    @classmethod
+    def refresh_product_counts(cls, category_ids=None): 
+        """ Recompute the stored product_count from the product table, for the given categories or all of them """
+        counts = Product.objects.filter(category=OuterRef('pk')).order_by().values('category').annotate(total=Count('pk')).values('total')
+        categories = cls.objects.all() if category_ids is None else cls.objects.filter(pk__in=set(category_ids))
+        return categories.update(product_count=Coalesce(Subquery(counts), 0), updated_at=Now())
+
+
+class ProductQuerySet(models.QuerySet): 
+    """
+    Bulk operations skip the save/delete signals that keep Category.product_count and the
+    catalog cache in step, so they refresh the counts of every category they touched and
+    invalidate the cache themselves.
+    """
+    def bulk_create(self, objs, *args, **kwargs): 
+        bump_catalog_version(self.db)
+        objs = super().bulk_create(objs, *args, **kwargs)
+        Category.refresh_product_counts({obj.category_id for obj in objs})
+        return objs
+    
+    def bulk_update(self, objs, fields, *args, **kwargs): 
+        bump_catalog_version(self.db)
+        objs = list(objs)
+        if 'category' not in fields and 'category_id' not in fields: 
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        previous = set(self.model.objects.filter(pk__in=[obj.pk for obj in objs]).values_list('category_id', flat=True))
+        updated = super().bulk_update(objs, fields, *args, **kwargs)
+        Category.refresh_product_counts(previous | {obj.category_id for obj in objs})
+        return updated
+    
+    def update(self, **kwargs): 
+        bump_catalog_version(self.db)
+        if 'category' not in kwargs and 'category_id' not in kwargs: 
+            return super().update(**kwargs)
+        previous = set(self.order_by().values_list('category_id', flat=True).distinct())
+        updated = super().update(**kwargs)
+        category = kwargs.get('category', kwargs.get('category_id'))
+        Category.refresh_product_counts(previous | {getattr(category, 'pk', category)})
+        return updated
+    
+    def delete(self): 
+        bump_catalog_version(self.db)
+        from products.signals import deferred_product_counts
+        affected = set(self.order_by().values_list('category_id', flat=True).distinct())
+        with deferred_product_counts(): 
+            deleted = super().delete()
+        Category.refresh_product_counts(affected)
+        return deleted
+    
 
 class Product(models.Model): 
     name = models.CharField(max_length=100)
@@ -20,14 +76,100 @@ class Product(models.Model):
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False, db_index=True)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    objects = ProductQuerySet.as_manager()
+    
+    class Meta: 
+        constraints = [
+            # natural key of import_catalog upserts
+            models.UniqueConstraint(fields=['category', 'name'], name='product_category_name_uniq'), 
+        ]
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values): 
+        instance = super().from_db(db, field_names, values)
+        # remembered so a save can tell when the product moved to another category
+        if 'category_id' in instance.__dict__: 
+            instance._loaded_category_id = instance.category_id
+        return instance
+    
+    @property
+    def rating_histogram(self): 
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
+    
+    @classmethod
+    def apply_rating_change(cls, product_id, added=None, removed=None): 
+        """
+        Fold one review being added, removed or re-rated (both) into the stored aggregates
+        with a single UPDATE, so concurrent reviews never lose each other's changes.
+        """
+        count_delta = (added is not None) - (removed is not None)
+        sum_delta = (added or 0) - (removed or 0)
+        changes = {
+            'review_count': F('review_count') + count_delta, 
+            'rating_sum': F('rating_sum') + sum_delta, 
+            'average_rating': Coalesce(
+                Cast(F('rating_sum') + sum_delta, FloatField()) / NullIf(F('review_count') + count_delta, 0), 
+                Value(0.0), 
+            ), 
+            'updated_at': Now(), 
+        }
+        for star, delta in ((added, 1), (removed, -1)): 
+            if star is not None: 
+                field = f'rating_{star}_count'
+                changes[field] = changes.get(field, F(field)) + delta
+        return cls.objects.filter(pk=product_id).update(**changes)
+    
+    @classmethod
+    def refresh_rating_aggregates(cls, product_ids=None): 
+        """ Recompute the stored rating aggregates from the review table """
+        products = cls.objects.all() if product_ids is None else cls.objects.filter(pk__in=set(product_ids))
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        
+        def aggregate(expression): 
+            return Coalesce(Subquery(reviews.annotate(value=expression).values('value')), 0)
+        
+        changes = {f'rating_{star}_count': aggregate(Count('pk', filter=Q(ratings=star))) for star in range(1, 6)}
+        return products.update(
+            review_count=aggregate(Count('pk')), 
+            rating_sum=aggregate(Sum('ratings')), 
+            average_rating=aggregate(Avg('ratings')), 
+            updated_at=Now(), 
+            **changes, 
+        )
+    
 class ProductImage(models.Model): 
+    PENDING = 'Pending'
+    READY = 'Ready'
+    FAILED = 'Failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'), 
+        (READY, 'Ready'), 
+        (FAILED, 'Failed'), 
+    ]
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = CloudinaryField('image')
-    # image = models.ImageField(upload_to='products/images/', validators=[validate_file_size])
+    # images uploaded before the pipeline, new uploads go to `original`
+    image = CloudinaryField('image', blank=True, null=True)
+    original = models.ImageField(upload_to=original_upload_to, storage=get_image_storage, blank=True, validators=[validate_file_size])
+    # {variant: {format: stored name}}, filled in by `manage.py process_product_images`
+    variants = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    
+    class Meta: 
+        indexes = [
+            models.Index(fields=['status'], name='productimage_status_idx'), 
+        ]
     
 class Review(models.Model): 
     product = models.ForeignKey(Product, on_delete= models.CASCADE)
@@ -37,5 +179,10 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta: 
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='review_product_created_idx'), 
+        ]
+    
     def __str__(self):
         return f"Review by {self.user.first_name} on {self.product.name}"
\ No newline at end of file
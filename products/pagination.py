@@ -1,4 +1,177 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from functools import partial
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
-class DefaultPagination(PageNumberPagination): 
-    page_size = 10
\ No newline at end of file
+class DefaultPagination(PageNumberPagination):
+    page_size = 10
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks past the last row seen instead of using OFFSET, and never counts.
+    The page order is whatever the queryset is already ordered by (OrderingFilter, search rank),
+    or `page_ordering` when set, with `id` appended as the tie breaker so every row has a unique position.
+    """
+    page_size = 10
+    page_ordering = None
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor['reverse'])
+
+        queryset = queryset.order_by(*(self.invert(key) if self.reverse else key for key in self.ordering))
+        if cursor:
+            queryset = queryset.filter(self.seek(cursor['position']))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.first, self.last = (rows[0], rows[-1]) if rows else (None, None)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor(self.last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first is None:
+            return None
+        return self.encode_cursor(self.first, reverse=True)
+
+    def get_ordering(self, queryset):
+        ordering = [key for key in queryset.query.order_by if isinstance(key, str)]
+        if len(ordering) != len(queryset.query.order_by):
+            ordering = []
+        if self.page_ordering is not None:
+            ordering = list(self.page_ordering)
+        if not ordering or ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('id')
+        return ordering
+
+    def invert(self, key):
+        return key[1:] if key.startswith('-') else f'-{key}'
+
+    def seek(self, position):
+        """ Rows strictly after `position` in the page order: (a > x) or (a = x and b > y) ... """
+        names = [key.lstrip('-') for key in self.ordering]
+        condition = Q()
+        for index, key in enumerate(self.ordering):
+            descending = key.startswith('-') != self.reverse
+            step = Q(**{f"{names[index]}__{'lt' if descending else 'gt'}": position[index]})
+            for name, value in zip(names[:index], position[:index]):
+                step &= Q(**{name: value})
+            condition |= step
+        return condition
+
+    def encode_cursor(self, row, reverse):
+        # rows are model instances, or dicts on the serializer-free list path
+        read = row.__getitem__ if isinstance(row, dict) else partial(getattr, row)
+        position = [self.dump_value(read(key.lstrip('-'))) for key in self.ordering]
+        payload = json.dumps({'o': self.ordering, 'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        token = urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            payload = json.loads(urlsafe_b64decode(token.encode()).decode())
+            # a cursor is only valid for the ordering it was issued under
+            if payload['o'] != self.ordering or len(payload['p']) != len(self.ordering):
+                raise ValueError
+            return {'position': payload['p'], 'reverse': bool(payload['r'])}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def dump_value(self, value):
+        if isinstance(value, float):
+            return repr(value)
+        return value if isinstance(value, (int, str)) or value is None else str(value)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.cursor_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'The pagination cursor value.',
+            'schema': {'type': 'string'},
+        }]
+
+
+class ReviewPagination(KeysetPagination):
+    """ Newest reviews first """
+    page_size = 20
+    page_ordering = ['-created_at', '-id']
+
+
+class CatalogPagination(DefaultPagination):
+    """
+    Page-number pagination by default, for clients that need page numbers and a total count.
+    `?pagination=cursor` (or any `?cursor=` returned by a previous page) switches to keyset pagination.
+    """
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def __init__(self):
+        self.keyset = self.keyset_class()
+        self.keyset.page_size = self.page_size
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'cursor'
+                or self.keyset.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.use_keyset(request)
+        if self.keyset_mode:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset_mode:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + self.keyset.get_schema_operation_parameters(view) + [{
+            'name': self.mode_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Set to "cursor" for keyset pagination without a total count.',
+            'schema': {'type': 'string', 'enum': ['cursor']},
+        }]
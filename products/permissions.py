@@ -13,4 +13,4 @@ class IsReviewAuthorOrReadOnly(permissions.BasePermission):
         if request.user.is_staff: 
             return True
         
-        return obj.user == request.user
\ No newline at end of file
+        return obj.user_id == request.user.id
\ No newline at end of file
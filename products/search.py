@@ -0,0 +1,132 @@
+"""
+Full-text search over Product.name and Product.description
+
+The index itself lives in the database and is kept up to date there
+(see products/migrations/0004_product_search_index.py):
+- PostgreSQL: a stored, generated `search_vector` tsvector column with a GIN index
+- SQLite: an external-content FTS5 table `products_product_fts` maintained by triggers
+Name matches are weighted above description matches on both backends.
+"""
+
+import re
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Round
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+SQLITE_FTS_TABLE = 'products_product_fts'
+# ranks are rounded before ordering, so the value a keyset cursor stores compares
+# exactly equal to the one in the database (ts_rank is a float4 on PostgreSQL)
+RANK_PRECISION = 6
+
+
+def parse_terms(search):
+    return TERM_PATTERN.findall(search or '')
+
+
+class PostgresSearchBackend:
+    match_sql = '"products_product"."search_vector" @@ to_tsquery(\'english\', %s)'
+    rank_sql = 'ts_rank("products_product"."search_vector", to_tsquery(\'english\', %s))'
+
+    def build_query(self, terms):
+        # every term is prefix matched and all of them must be present
+        return ' & '.join(f"{term}:*" for term in terms)
+
+    def search(self, queryset, terms):
+        query = self.build_query(terms)
+        return queryset.filter(
+            RawSQL(self.match_sql, (query,), output_field=BooleanField())
+        ).annotate(
+            search_rank=Round(RawSQL(self.rank_sql, (query,), output_field=FloatField()), RANK_PRECISION)
+        ).order_by('-search_rank', 'id')
+
+
+class SQLiteSearchBackend:
+    # joined rather than correlated so bm25() is computed once per match inside the FTS scan,
+    # it is lower for better matches so it is negated to keep higher rank = better everywhere
+    rank_sql = f'-bm25({SQLITE_FTS_TABLE}, 10.0, 1.0)'
+
+    def build_query(self, terms):
+        return ' AND '.join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, terms):
+        query = self.build_query(terms)
+        return queryset.extra(
+            tables=[SQLITE_FTS_TABLE],
+            where=[f'{SQLITE_FTS_TABLE}.rowid = "products_product"."id"', f'{SQLITE_FTS_TABLE} MATCH %s'],
+            params=[query],
+        ).annotate(
+            search_rank=Round(RawSQL(self.rank_sql, (), output_field=FloatField()), RANK_PRECISION)
+        ).order_by('-search_rank', 'id')
+
+
+SQLITE_TRIGGERS = {
+    'products_product_fts_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_ai AFTER INSERT ON products_product BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+    'products_product_fts_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_ad AFTER DELETE ON products_product BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+        END
+    """,
+    'products_product_fts_au': f"""
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_au AFTER UPDATE OF name, description ON products_product BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, name, description)
+            VALUES ('delete', old.id, old.name, old.description);
+            INSERT INTO {SQLITE_FTS_TABLE}(rowid, name, description)
+            VALUES (new.id, new.name, new.description);
+        END
+    """,
+}
+
+
+def ensure_sqlite_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    SQLite drops triggers whenever a migration rebuilds products_product, so
+    they are re-created after every migrate run and the index is rebuilt if
+    any of them had gone missing.
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' OR name = %s", [SQLITE_FTS_TABLE])
+        existing = {row[0] for row in cursor.fetchall()}
+        if SQLITE_FTS_TABLE not in existing:
+            return
+        missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        if missing:
+            cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    backend_class = SEARCH_BACKENDS.get(connections[using].vendor)
+    return backend_class() if backend_class else None
+
+
+def search_products(queryset, search):
+    """
+    Filter a Product queryset down to the rows matching `search`, best match
+    first by `search_rank`. Returns None when the database has no full-text
+    backend so the caller can fall back to plain `icontains` filtering.
+    """
+    backend = get_search_backend(queryset.db)
+    if backend is None:
+        return None
+    terms = parse_terms(search)
+    if not terms:
+        return queryset.none()
+    return backend.search(queryset, terms)
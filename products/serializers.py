@@ -1,11 +1,14 @@
 from rest_framework import serializers
 from decimal import Decimal
+from functools import lru_cache
 from products.models import Category, Product, Review, ProductImage
+from products.images import variant_urls
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from api.fieldsets import SparseFieldsetSerializerMixin
 
 
-class CategorySerializer(serializers.ModelSerializer): 
+class CategorySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer): 
     class Meta: 
         model = Category
         fields = ['id', 'name', 'description', 'product_count']
@@ -31,21 +34,48 @@ class CategorySerializer(serializers.ModelSerializer):
 #     def calculate_tax(self, product): 
 #         return round(product.price * Decimal(1.1), 2)
     
+TAX_RATE = Decimal(1.1)
+
+
+@lru_cache(maxsize=4096)
+def price_with_tax(price): 
+    # catalogs reuse a small set of prices, so most rows skip the Decimal arithmetic
+    return round(price * TAX_RATE, 2)
+
+
+class ProductImageField(serializers.ImageField): 
+    """ The uploaded original, or for images from before the pipeline their Cloudinary image """
+    def get_attribute(self, instance): 
+        return instance.original or instance.image
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
-    image = serializers.ImageField()
+    image = ProductImageField(source='original')
+    variants = serializers.SerializerMethodField()
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'status', 'variants']
+        read_only_fields = ['status']
+    
+    def get_variants(self, image): 
+        return variant_urls(image.variants, self.context.get('request'))
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     images =  ProductImageSerializer(many = True, read_only = True)
     class Meta: 
         model = Product
-        fields = ['id', 'name', 'description', 'stock', 'price', 'category', 'price_with_tax', 'images']
+        fields = ['id', 'name', 'description', 'stock', 'price', 'category', 'price_with_tax', 'images', 
+                  'review_count', 'average_rating', 'rating_histogram']
+    expandable_fields = {'category': CategorySerializer}
+    field_sources = {
+        'price_with_tax': ['price'], 
+        'rating_histogram': [f'rating_{stars}_count' for stars in range(1, 6)], 
+    }
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
     price_with_tax = serializers.SerializerMethodField(method_name='calculate_tax')
     def calculate_tax(self, product):
-        return round(product.price * Decimal(1.1), 2)
+        return price_with_tax(product.price)
 
 
 
@@ -61,14 +91,11 @@ class SimpleUserSerializer(serializers.ModelSerializer):
 
 
 class ReviewSerializer(serializers.ModelSerializer): 
-    user = serializers.SerializerMethodField(method_name='get_user')
+    user = SimpleUserSerializer(read_only=True)
     class Meta: 
         model = Review 
         fields = ['id', 'user', 'product', 'ratings', 'comment', 'created_at', 'updated_at']
         read_only_fields = ['user', 'product']
-        
-    def get_user(self, obj): 
-        return SimpleUserSerializer(obj.user).data
     
     def create(self, validated_data):
         product_id = self.context['product_pk']
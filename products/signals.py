@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from products.models import Category, Product, ProductImage
+from products.cache import bump_catalog_version
+from products.images import delete_stored_files
+
+
+_counts_deferred = ContextVar('product_counts_deferred', default=False)
+
+
+@contextmanager
+def deferred_product_counts(): 
+    """ Skip per-row count updates while a bulk operation refreshes the counts itself """
+    token = _counts_deferred.set(True)
+    try: 
+        yield
+    finally: 
+        _counts_deferred.reset(token)
+
+
+def adjust_product_count(category_id, delta): 
+    if category_id is not None: 
+        Category.objects.filter(pk=category_id).update(product_count=F('product_count') + delta, updated_at=Now())
+
+
+@receiver(post_save, sender=Product)
+def update_count_on_save(sender, instance, created, raw=False, **kwargs): 
+    if created: 
+        adjust_product_count(instance.category_id, 1)
+    elif not hasattr(instance, '_loaded_category_id'): 
+        # saved from an instance that was not loaded from the database (e.g. loaddata)
+        Category.refresh_product_counts([instance.category_id])
+    elif instance._loaded_category_id != instance.category_id: 
+        adjust_product_count(instance._loaded_category_id, -1)
+        adjust_product_count(instance.category_id, 1)
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Product)
+def update_count_on_delete(sender, instance, **kwargs): 
+    if not _counts_deferred.get(): 
+        adjust_product_count(instance.category_id, -1)
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def touch_product_on_image_change(sender, instance, **kwargs): 
+    # images are part of the product representation, so they move its change marker too
+    Product.objects.filter(pk=instance.product_id).update(updated_at=Now())
+
+
+@receiver(post_delete, sender=ProductImage)
+def delete_image_files(sender, instance, using, **kwargs): 
+    # only once the row is really gone, a rolled back delete keeps its files
+    name, variants = instance.original.name, instance.variants
+    if name or variants: 
+        transaction.on_commit(lambda: delete_stored_files(name, variants), using=using)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=ProductImage)
+def invalidate_catalog_cache(sender, using, **kwargs): 
+    bump_catalog_version(using)
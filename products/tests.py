@@ -1,3 +1,421 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from products.cache import _bump_catalog_version, get_catalog_version, get_stats
+from products.fastlist import ProductFastList
+from products.images import process_after_upload
+from products.models import Category, Product, ProductImage, Review
+from products.views import ReviewViewSet
+from users.models import User
 
-# Create your tests here.
+
+# a process-local alias turns the response cache off, so the validators are computed on every request
+@override_settings(CATALOG_CACHE_ALIAS='default')
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Lamps', description='Desk lamps')
+        cls.products = [
+            Product.objects.create(name=f'Lamp {index}', description='A lamp', price=10, stock=5, category=cls.category)
+            for index in range(3)
+        ]
+
+    def test_list_sends_only_an_etag(self):
+        response = self.client.get(reverse('products-list'))
+        self.assertIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(reverse('products-list'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_list_ignores_if_modified_since(self):
+        response = self.client.get(reverse('products-list'), HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_an_older_product_changes_the_list_etag(self):
+        etag = self.client.get(reverse('products-list'))['ETag']
+        self.products[0].delete()
+        response = self.client.get(reverse('products-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_answers_if_modified_since(self):
+        url = reverse('products-detail', args=[self.products[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+
+@override_settings(CATALOG_CACHE_STATS_SAMPLE_RATE=0)
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        Product.objects.create(name='Desk lamp', description='A lamp', price=10, stock=5, category=category)
+
+    def test_hit_reads_the_version_and_the_entry(self):
+        self.assertEqual(self.client.get(reverse('products-list'))['X-Cache'], 'MISS')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(reverse('products-list'))['X-Cache'], 'HIT')
+
+    @override_settings(CATALOG_CACHE_STATS_SAMPLE_RATE=0.5)
+    def test_sampled_requests_count_for_the_others(self):
+        with mock.patch('products.cache.random.random', return_value=0.1):
+            self.client.get(reverse('products-list'))
+            self.client.get(reverse('products-list'))
+        with mock.patch('products.cache.random.random', return_value=0.9):
+            self.client.get(reverse('products-list'))
+        self.assertEqual((get_stats()['misses'], get_stats()['hits']), (2, 2))
+
+
+class CatalogVersionTests(TestCase):
+    def test_bumped_version_does_not_expire(self):
+        with tempfile.TemporaryDirectory() as directory:
+            caches = {**settings.CACHES, 'files': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}
+            with override_settings(CACHES=caches, CATALOG_CACHE_ALIAS='files'):
+                _bump_catalog_version()
+                version = get_catalog_version()
+                with mock.patch('django.core.cache.backends.filebased.time.time', return_value=time.time() + 3600):
+                    self.assertEqual(get_catalog_version(), version)
+                    _bump_catalog_version()
+                    self.assertGreater(get_catalog_version(), version)
+
+
+@override_settings(CATALOG_CACHE_ALIAS='default')
+class SparseFieldsetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = category = Category.objects.create(name='Lamps', description='Desk lamps')
+        for index in range(3):
+            product = Product.objects.create(name=f'Lamp {index}', description='A lamp', price=10, stock=5, category=category)
+            ProductImage.objects.create(product=product, original=f'originals/{product.pk}/lamp.jpg')
+
+    def products(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('products-list') + query)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_fields_narrow_the_columns_and_skip_prefetches(self):
+        response, queries = self.products('?fields=id,name')
+        self.assertEqual([set(product) for product in response.data['results']], [{'id', 'name'}] * 3)
+        product_query = next(sql for sql in queries if 'FROM "products_product"' in sql and '"products_product"."name"' in sql)
+        self.assertNotIn('"products_product"."description"', product_query)
+        self.assertFalse(any('products_productimage' in sql for sql in queries))
+
+    def test_expand_joins_the_relation(self):
+        _, full_queries = self.products('')
+        response, queries = self.products('?fields=id&expand=category')
+        self.assertEqual(response.data['results'][0]['category']['name'], 'Lamps')
+        self.assertEqual(len(queries), len(full_queries) - 1)
+        self.assertFalse(any('FROM "products_category"' in sql for sql in queries))
+
+    def test_unknown_names_are_rejected(self):
+        response, _ = self.products('?fields=id,bogus')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unknown: bogus.', response.data['fields'][0])
+        self.assertIn('price_with_tax', response.data['fields'][0])
+        response, _ = self.products('?expand=images')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Valid: category.', response.data['expand'][0])
+
+
+@override_settings(CATALOG_CACHE_ALIAS='default')
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        for index in range(25):
+            # three prices and three search ranks, so most rows tie with others on the ordering column
+            Product.objects.create(
+                name=f'Lamp {index}', description=' '.join(['lamp'] * (index % 3 + 1)),
+                price=(index % 3 + 1) * 10, stock=5, category=category,
+            )
+
+    def walk(self, query):
+        pages, url = [], reverse('products-list') + query
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([product['id'] for product in response.data['results']])
+            url = response.data['next']
+        return pages, response.data['previous']
+
+    def page_number_order(self, query):
+        ids, page = [], 1
+        while True:
+            response = self.client.get(reverse('products-list') + f'{query}&page={page}')
+            ids += [product['id'] for product in response.data['results']]
+            if not response.data['next']:
+                return ids
+            page += 1
+
+    def assert_walks(self, query):
+        pages, previous = self.walk(f'{query}&pagination=cursor')
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids, self.page_number_order(query))
+        # and back again from the last page
+        back = []
+        while previous:
+            response = self.client.get(previous)
+            back.insert(0, [product['id'] for product in response.data['results']])
+            previous = response.data['previous']
+        self.assertEqual(back, pages[:-1])
+
+    def test_ties_on_price_have_no_duplicates_or_gaps(self):
+        self.assert_walks('?ordering=price')
+        self.assert_walks('?ordering=-price')
+        pages, _ = self.walk('?ordering=price&pagination=cursor')
+        prices = dict(Product.objects.values_list('pk', 'price'))
+        ids = [pk for page in pages for pk in page]
+        self.assertEqual(ids, sorted(ids, key=lambda pk: (prices[pk], pk)))
+
+    def test_search_rank_order(self):
+        self.assert_walks('?search=lamp')
+
+    def test_tampered_cursor_is_not_found(self):
+        response = self.client.get(reverse('products-list') + '?ordering=price&pagination=cursor')
+        cursor = parse_qs(urlsplit(response.data['next']).query)['cursor'][0]
+        for query in ('?cursor=not-a-cursor', f'?ordering=-price&cursor={cursor}', f'?ordering=price&cursor={cursor[:-4]}'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(reverse('products-list') + query).status_code, 404)
+
+
+class ImportCatalogTests(TestCase):
+    def import_lines(self, *records):
+        stream = io.StringIO(''.join(json.dumps(record) + '\n' for record in records))
+        with mock.patch('sys.stdin', stream):
+            call_command('import_catalog', '-', stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_product_without_price_reports_its_line(self):
+        with self.assertRaisesMessage(CommandError, 'Record 2: product without price'):
+            self.import_lines(
+                {'type': 'category', 'name': 'Lamps'},
+                {'type': 'product', 'category': 'Lamps', 'name': 'Desk lamp'},
+            )
+
+    def test_invalid_price_reports_its_line(self):
+        with self.assertRaisesMessage(CommandError, "Record 2: invalid price 'ten'"):
+            self.import_lines(
+                {'type': 'category', 'name': 'Lamps'},
+                {'type': 'product', 'category': 'Lamps', 'name': 'Desk lamp', 'price': 'ten'},
+            )
+
+    def test_invalid_stock_reports_its_line(self):
+        for stock in ('ten', -1, 2.5):
+            with self.subTest(stock=stock), self.assertRaisesMessage(CommandError, f'Record 2: invalid stock {stock!r}'):
+                self.import_lines(
+                    {'type': 'category', 'name': 'Lamps'},
+                    {'type': 'product', 'category': 'Lamps', 'name': 'Desk lamp', 'price': '10', 'stock': stock},
+                )
+        self.assertFalse(Product.objects.exists())
+
+    def test_batches_upsert_and_a_rerun_changes_nothing(self):
+        records = [{'type': 'category', 'name': f'Category {index}'} for index in range(3)] + [
+            {'type': 'product', 'category': f'Category {index % 3}', 'name': f'Lamp {index}', 'price': '10', 'stock': index}
+            for index in range(7)
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.ndjson')
+            with open(path, 'w') as file:
+                file.writelines(json.dumps(record) + '\n' for record in records)
+            for expected in ('10 created, 0 updated', '0 created, 0 updated, 10 unchanged'):
+                stdout = io.StringIO()
+                call_command('import_catalog', path, '--batch-size', '2', stdout=stdout, stderr=io.StringIO())
+                self.assertIn(expected, stdout.getvalue())
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(Product.objects.count(), 7)
+        self.assertEqual(Product.objects.get(name='Lamp 5').stock, 5)
+        self.assertEqual(Category.objects.get(name='Category 1').product_count, 2)
+
+    def test_existing_rows_are_updated_not_duplicated(self):
+        category = Category.objects.create(name='Lamps')
+        Product.objects.create(name='Desk lamp', description='', price=10, stock=5, category=category)
+        self.import_lines(
+            {'type': 'category', 'name': 'Lamps'},
+            {'type': 'product', 'category': 'Lamps', 'name': 'Desk lamp', 'price': '12', 'stock': '3'},
+        )
+        product = Product.objects.get()
+        self.assertEqual((product.price, product.stock), (12, 3))
+
+    def test_category_upsert_bumps_the_catalog_version(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_lines({'type': 'category', 'name': 'Lamps', 'description': 'Desk lamps'})
+        self.assertGreater(get_catalog_version(), version)
+
+
+class ReviewListQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        cls.product = Product.objects.create(name='Desk lamp', description='A lamp', price=10, stock=5, category=category)
+
+    def add_reviews(self, count):
+        first = Review.objects.count()
+        for index in range(first, first + count):
+            user = User.objects.create_user(email=f'reviewer{index}@example.com', first_name=f'Reviewer {index}')
+            Review.objects.create(user=user, product=self.product, ratings=4, comment='Bright')
+
+    def test_query_count_does_not_grow_with_authors(self):
+        url = reverse('product-review-list', args=[self.product.pk])
+        self.add_reviews(1)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.client.get(url).data['results']), 1)
+        self.add_reviews(5)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(len({review['user']['id'] for review in response.data['results']}), 6)
+
+
+@override_settings(CATALOG_CACHE_ALIAS='default')
+class ReviewRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        cls.product = Product.objects.create(name='Desk lamp', description='A lamp', price=10, stock=5, category=category)
+        cls.user = User.objects.create_user(email='reviewer@example.com', first_name='Reviewer')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.review = Review.objects.create(user=self.user, product=self.product, ratings=4, comment='Bright')
+        Product.apply_rating_change(self.product.pk, added=4)
+        self.url = reverse('product-review-detail', args=[self.product.pk, self.review.pk])
+
+    def test_update_moves_the_rating(self):
+        response = self.client.patch(self.url, {'ratings': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.review_count, self.product.rating_sum), (1, 5))
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+    def test_update_uses_the_rating_committed_by_a_concurrent_edit(self):
+        get_object = ReviewViewSet.get_object
+
+        def stale_get_object(view):
+            review = get_object(view)
+            # another request changes the rating after this one loaded the review
+            Review.objects.filter(pk=review.pk).update(ratings=2)
+            Product.apply_rating_change(review.product_id, added=2, removed=4)
+            return review
+
+        with mock.patch.object(ReviewViewSet, 'get_object', stale_get_object):
+            response = self.client.patch(self.url, {'ratings': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.review_count, self.product.rating_sum), (1, 5))
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 0, 5: 1})
+
+@override_settings(CATALOG_CACHE_ALIAS='default')
+class FastListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        for index in range(3):
+            product = Product.objects.create(name=f'Lamp {index}', description='A lamp', price='19.99', stock=5, category=category)
+            ProductImage.objects.create(product=product, original=f'originals/{product.pk}/lamp.jpg')
+            ProductImage.objects.create(
+                product=product, original=f'originals/{product.pk}/shade.jpg', status=ProductImage.READY,
+                variants={'card': {'webp': f'variants/{product.pk}/card.webp', 'jpeg': f'variants/{product.pk}/card.jpg'}},
+            )
+
+    def test_off_by_default(self):
+        with mock.patch.object(ProductFastList, 'build') as build:
+            self.assertEqual(self.client.get(reverse('products-list')).status_code, 200)
+        build.assert_not_called()
+
+    def test_renders_what_the_serializer_renders(self):
+        expected = self.client.get(reverse('products-list')).content
+        spy = mock.patch.object(ProductFastList, 'build', autospec=True, side_effect=ProductFastList.build)
+        with override_settings(FAST_LIST_RENDERING=True), spy as build:
+            content = self.client.get(reverse('products-list')).content
+        build.assert_called_once()
+        self.assertIn(b'card.webp', content)
+        self.assertEqual(content, expected)
+
+
+class CatalogRoundTripTests(TestCase):
+    LEGACY = 'image/upload/v1612345/products/lamp.jpg'
+    VARIANTS = {'card': {'webp': 'variants/1/lamp-card.webp', 'jpeg': 'variants/1/lamp-card.jpg'}}
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps', description='Desk lamps')
+        product = Product.objects.create(name='Desk lamp', description='A lamp', price='19.99', stock=5, category=category)
+        ProductImage.objects.create(product=product, image=cls.LEGACY, status=ProductImage.READY)
+        ProductImage.objects.create(product=product, original='originals/1/lamp.jpg', variants=cls.VARIANTS, status=ProductImage.READY)
+        ProductImage.objects.create(product=product, original='originals/1/shade.jpg')
+
+    def images(self):
+        image_field = ProductImage._meta.get_field('image')
+        return sorted(
+            (image_field.get_prep_value(image) or '', original, variants, status)
+            for image, original, variants, status in ProductImage.objects.values_list('image', 'original', 'variants', 'status')
+        )
+
+    def round_trip(self, fmt):
+        expected = self.images()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f'catalog.{fmt}')
+            call_command('export_catalog', '--output', path, stderr=io.StringIO())
+            ProductImage.objects.all().delete()
+            call_command('import_catalog', path, stdout=io.StringIO(), stderr=io.StringIO())
+            self.assertEqual(self.images(), expected)
+            stdout = io.StringIO()
+            call_command('import_catalog', path, stdout=stdout, stderr=io.StringIO())
+        self.assertIn('0 created, 0 updated', stdout.getvalue())
+
+    def test_ndjson_round_trip(self):
+        self.round_trip('ndjson')
+
+    def test_csv_round_trip(self):
+        self.round_trip('csv')
+
+    def test_legacy_images_import_ready(self):
+        ProductImage.objects.all().delete()
+        stream = io.StringIO(json.dumps({'type': 'image', 'category': 'Lamps', 'product': 'Desk lamp', 'image': self.LEGACY}) + '\n')
+        with mock.patch('sys.stdin', stream):
+            call_command('import_catalog', '-', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(ProductImage.objects.get().status, ProductImage.READY)
+
+
+class ProcessAfterUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Lamps')
+        product = Product.objects.create(name='Desk lamp', description='A lamp', price='19.99', stock=5, category=category)
+        cls.image = ProductImage.objects.create(product=product, original='originals/1/lamp.jpg')
+
+    @override_settings(PRODUCT_IMAGES={**settings.PRODUCT_IMAGES, 'WORKER': False})
+    def test_renders_once_the_upload_commits(self):
+        with mock.patch('products.images.process_pending_image') as process:
+            with self.captureOnCommitCallbacks(execute=True):
+                process_after_upload(self.image)
+                process.assert_not_called()
+        process.assert_called_once_with(self.image.pk)
+
+    @override_settings(PRODUCT_IMAGES={**settings.PRODUCT_IMAGES, 'WORKER': False})
+    def test_failed_rendering_leaves_the_image_pending(self):
+        with mock.patch('products.images.render_variants', side_effect=RuntimeError('storage down')):
+            with self.assertLogs('products.images', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                process_after_upload(self.image)
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.status, ProductImage.PENDING)
+
+    @override_settings(PRODUCT_IMAGES={**settings.PRODUCT_IMAGES, 'WORKER': True})
+    def test_left_to_the_worker_when_one_runs(self):
+        with mock.patch('products.images.process_pending_image') as process:
+            with self.captureOnCommitCallbacks(execute=True):
+                process_after_upload(self.image)
+        process.assert_not_called()
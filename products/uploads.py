@@ -0,0 +1,32 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework.exceptions import ValidationError
+from products.validators import MAX_FILE_SIZE_MB, validate_file_size
+
+# room for the multipart boundaries and headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler): 
+    """
+    Stream uploaded files straight to a temporary file, never into memory, and apply
+    validate_file_size while the upload arrives: a body too large to hold an allowed file is
+    refused before it is read, and a file is dropped as soon as it passes the limit.
+    """
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None): 
+        if content_length > MAX_FILE_SIZE_MB * 1024 * 1024 + MULTIPART_OVERHEAD: 
+            raise ValidationError({'image': [f"File can not be larger than {MAX_FILE_SIZE_MB} MB"]})
+    
+    def new_file(self, *args, **kwargs): 
+        super().new_file(*args, **kwargs)
+        self.received = 0
+    
+    def receive_data_chunk(self, raw_data, start): 
+        self.received += len(raw_data)
+        self.file.size = self.received
+        try: 
+            validate_file_size(self.file)
+        except DjangoValidationError as error: 
+            self.upload_interrupted()
+            raise ValidationError({self.field_name: error.messages})
+        return super().receive_data_chunk(raw_data, start)
@@ -1,10 +1,10 @@
 from django.core.exceptions import ValidationError
 
+MAX_FILE_SIZE_MB = 10
+
 
 def validate_file_size(file): 
-    max_size = 10
-    max_size_in_bytes = max_size*1024*1024
+    max_size_in_bytes = MAX_FILE_SIZE_MB*1024*1024
     
     if file.size > max_size_in_bytes: 
-        raise ValidationError(f"File can not be larger than {max_size} MB")
-
+        raise ValidationError(f"File can not be larger than {MAX_FILE_SIZE_MB} MB")
@@ -1,40 +1,56 @@
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from datetime import datetime, time
+from django.db import transaction
 from rest_framework.decorators import api_view
 from rest_framework.response import Response 
 from products.models import Product, Category, Review, ProductImage
-from rest_framework import status
+from rest_framework import status, permissions
 from products.serializers import ProductSerializer, CategorySerializer, ReviewSerializer, ProductImageSerializer
-from django.db.models import Count
 from rest_framework.views import APIView
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.viewsets import ModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
-from products.filters import ProductFilter
-from rest_framework.filters import SearchFilter, OrderingFilter
-from products.pagination import DefaultPagination
+from products.filters import ProductFilter, ProductSearchFilter, ReviewFilter
+from rest_framework.filters import OrderingFilter
+from products.pagination import CatalogPagination, ReviewPagination
 from api.permissions import IsAdminOrReadOnly
 from products.permissions import IsReviewAuthorOrReadOnly
+from products.cache import CatalogCacheMixin
+from products.conditional import ConditionalGetMixin
+from api.fieldsets import SparseFieldsetMixin
+from products.fastlist import CategoryFastList, FastListMixin, ProductFastList
+from products.exports import EXPORT_FORMATS, stream_products
+from products.uploads import LimitedTemporaryFileUploadHandler
+from products.images import process_after_upload
 from drf_yasg.utils import swagger_auto_schema
 
 """ Main views"""
 
 
-class ProductViewSet(ModelViewSet): 
+class ProductViewSet(CatalogCacheMixin, ConditionalGetMixin, FastListMixin, SparseFieldsetMixin, ModelViewSet): 
     """
     API endpoint for managing products in the e-commerce store
     - Allow authenticated admin to create, update, and delete products
     - Allows Users to browse and filter product 
-    - Support searching by name, description and category
-    - Support ordering by price and updated_at
+    - Support full-text searching by name and description, best match first
+    - Support ordering by price, average rating and review count, and filtering by min_rating
+    - Support page-number pagination, or keyset pagination with ?pagination=cursor
+    - Anonymous reads are served from the versioned catalog cache
+    - Send ETag / Last-Modified and answer matching conditional GETs with 304
+    - Support ?fields= (e.g. id,name,price for grids) and ?expand=category, only the rendered fields are loaded
+    - With settings.FAST_LIST_RENDERING on, lists are built straight from .values() rows without the serializer (products.fastlist)
     """
     serializer_class = ProductSerializer
-    queryset = Product.objects.select_related('category').all()
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    fast_list_class = ProductFastList
+    queryset = Product.objects.all()
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
     filterset_class = ProductFilter
     search_fields = ['name', 'description']
-    ordering_fields = ['price']
-    pagination_class = DefaultPagination
+    ordering_fields = ['price', 'average_rating', 'review_count']
+    pagination_class = CatalogPagination
     permission_classes = [IsAdminOrReadOnly]    
     # def get_queryset(self):
     #     queryset = Product.objects.all()
@@ -63,36 +79,109 @@ class ProductViewSet(ModelViewSet):
      
         
 class ProductImageViewSet(ModelViewSet): 
+    """
+    Images of a product: 
+    - uploads stream to disk and are refused as soon as they pass the size limit
+    - a new image is Pending until its variants are rendered, right after the upload or by `manage.py process_product_images`
+    - `variants` has thumbnail, card and detail sizes as WebP and JPEG, use them instead of `image` in lists
+    """
     serializer_class = ProductImageSerializer
     permission_classes = [IsAdminOrReadOnly]
+    
+    def initialize_request(self, request, *args, **kwargs): 
+        request.upload_handlers = [LimitedTemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+    
     def get_queryset(self):
         return ProductImage.objects.prefetch_related('product').filter(product_id=self.kwargs.get('product_pk'))
     
     def perform_create(self, serializer): 
-        serializer.save(product_id=self.kwargs.get('product_pk'))
+        image = serializer.save(product_id=self.kwargs.get('product_pk'))
+        process_after_upload(image)
        
-class CategoryViewSet(ModelViewSet): 
+class CategoryViewSet(CatalogCacheMixin, ConditionalGetMixin, FastListMixin, SparseFieldsetMixin, ModelViewSet): 
     permission_classes = [IsAdminOrReadOnly]
-    queryset = Category.objects.annotate(product_count = Count('products')).all()
+    queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    fast_list_class = CategoryFastList
     
 
 class ReviewViewSet(ModelViewSet): 
+    """
+    Reviews of a product, newest first: 
+    - cursor paginated, follow `next` / `previous`
+    - filter by `ratings`, `ratings__gte`, `ratings__lte`
+    - authors come from the same query, so a page is a constant number of queries
+    """
     serializer_class = ReviewSerializer
     permission_classes = [IsReviewAuthorOrReadOnly]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ReviewFilter
+    pagination_class = ReviewPagination
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic(): 
+            review = serializer.save(user=self.request.user)
+            Product.apply_rating_change(review.product_id, added=review.ratings)
         
     def perform_update(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic(): 
+            # the instance was read before the transaction, a concurrent edit may have changed its rating since
+            serializer.instance = Review.objects.select_for_update().get(pk=serializer.instance.pk)
+            previous_rating = serializer.instance.ratings
+            review = serializer.save(user=self.request.user)
+            if review.ratings != previous_rating: 
+                Product.apply_rating_change(review.product_id, added=review.ratings, removed=previous_rating)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic(): 
+            instance.delete()
+            Product.apply_rating_change(instance.product_id, removed=instance.ratings)
     
     def get_queryset(self):
-        return Review.objects.filter(product_id=self.kwargs.get('product_pk'))
+        return Review.objects.select_related('user').filter(product_id=self.kwargs.get('product_pk'))
     
     def get_serializer_context(self):
         return {'product_pk': self.kwargs.get('product_pk')}
     
+
+class ProductExportView(APIView): 
+    """
+    Full catalog export for marketplace partners, admin only
+    - Streams NDJSON (default) or CSV with ?output=csv
+    - Reads products in chunks with their images prefetched per chunk, so memory stays flat
+    - ?updated_since=<ISO date or datetime> returns only products changed since then
+    """
+    permission_classes = [permissions.IsAdminUser]
+    chunk_size = 500
+    
+    def get(self, request): 
+        fmt = request.query_params.get('output', 'ndjson')
+        if fmt not in EXPORT_FORMATS: 
+            return Response({'output': f"Choose one of: {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        updated_since = None
+        value = request.query_params.get('updated_since')
+        if value: 
+            try: 
+                parsed = parse_datetime(value) or parse_date(value)
+            except ValueError: 
+                parsed = None
+            if parsed is None: 
+                return Response({'updated_since': "Use an ISO 8601 date or datetime"}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(parsed, datetime): 
+                parsed = datetime.combine(parsed, time.min)
+            if timezone.is_naive(parsed): 
+                parsed = timezone.make_aware(parsed)
+            updated_since = parsed
+        
+        response = StreamingHttpResponse(
+            stream_products(request, fmt, updated_since, self.chunk_size), 
+            content_type=EXPORT_FORMATS[fmt], 
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+    
     
     
     
@@ -200,7 +289,7 @@ class ProductDetails(RetrieveUpdateDestroyAPIView):
 @api_view(['GET', 'POST'])
 def view_categories(request): 
     if request.method == 'GET': 
-        categories = Category.objects.annotate(product_count=Count('products')).all()
+        categories = Category.objects.all()
         serializer = CategorySerializer(categories, many = True)
         return Response(serializer.data)
     if request.method == 'POST': 
@@ -214,7 +303,7 @@ def view_categories(request):
 
 class ViewCategories(APIView): 
     def get(self, request): 
-        categories = Category.objects.annotate(product_count=Count('products')).all()
+        categories = Category.objects.all()
         serializer = CategorySerializer(categories, many=True)
         return Response(serializer.data)
     def post(self, request): 
@@ -227,7 +316,7 @@ class ViewCategories(APIView):
 
 
 class CategoryView(ListCreateAPIView): 
-    queryset = Category.objects.annotate(product_count=Count('products')).all()
+    queryset = Category.objects.all()
     serializer_class = CategorySerializer
     
     
@@ -241,13 +330,12 @@ def view_specific_category(request, pk):
 
 class ViewSpecificCategory(APIView): 
     def get(self, request, pk): 
-        category = get_object_or_404(Category.objects.annotate(product_count=Count('products')).all(), pk=pk)
+        category = get_object_or_404(Category.objects.all(), pk=pk)
         serializer = CategorySerializer(category)
         return Response(serializer.data)
     
     def put(self, request, pk): 
-        category = get_object_or_404(Category.objects.annotate(
-            product_count=Count('products')).all(), pk=pk)
+        category = get_object_or_404(Category.objects.all(), pk=pk)
         serializer = CategorySerializer(category, data = request.data)
         if serializer.is_valid(): 
             serializer.save()
@@ -256,14 +344,13 @@ class ViewSpecificCategory(APIView):
             return Response(serializer.errors, status= status.HTTP_400_BAD_REQUEST)
     
     def delete(self, request, pk): 
-        category = get_object_or_404(Category.objects.annotate(
-            product_count=Count('products')).all(), pk=pk)
+        category = get_object_or_404(Category.objects.all(), pk=pk)
         category.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class CategoryDetails(RetrieveUpdateDestroyAPIView): 
-    queryset = Category.objects.annotate(product_count=Count('products')).all()
+    queryset = Category.objects.all()
     serializer_class = CategorySerializer
     
     
\ No newline at end of file
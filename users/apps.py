@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.core.signals import setting_changed
 
 
 class UsersConfig(AppConfig):
     name = 'users'
+
+    def ready(self):
+        import users.signals
+        from users.authentication import reset_user_cache
+        setting_changed.connect(reset_user_cache)
@@ -0,0 +1,193 @@
+"""
+JWT authentication without a user query per request.
+
+CachedJWTAuthentication resolves the token's user from a bounded,
+short-lived cache in the process. It can also consult a Django cache
+shared by all processes before falling back to the database. Saving or
+deleting a User drops the entry in this process and in the shared cache,
+so an entry stays stale at most TTL seconds in other processes. The
+active flag and password revocation checks of simplejwt run on every
+request, just as without the cache. Configured by settings.JWT_USER_CACHE.
+
+A request that misses may read the row just before a change commits and
+store it just after the change dropped the entry. Both tiers therefore
+keep a generation per user, moved by every invalidation: the process
+cache refuses a row loaded under an older generation, and shared entries
+carry the generation they were loaded under and count as a miss once it
+moved. QuerySet.update() sends no signals, UserQuerySet in
+users/managers.py invalidates the users it touches; raw SQL must call
+invalidate_user itself.
+"""
+
+import itertools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+KEY = 'auth:user:{user_id}'
+GENERATION_KEY = 'auth:user:{user_id}:generation'
+
+DEFAULTS = {
+    'MAX_SIZE': 10000,
+    'TTL': 30,
+    'SHARED_CACHE_ALIAS': None,
+    'SHARED_TTL': 300,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'JWT_USER_CACHE', {})}
+
+
+class UserCache:
+    """
+    Least recently used entries with a time to live, safe to share between threads.
+    set() only stores under the key's current generation, which invalidate() moves.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.generations = OrderedDict()
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def generation(self, key):
+        with self.lock:
+            return self.generations.get(key, 0)
+
+    def set(self, key, value, generation=0):
+        with self.lock:
+            if generation != self.generations.get(key, 0):
+                return
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.generations[key] = next(self.counter)
+            self.generations.move_to_end(key)
+            while len(self.generations) > self.max_size:
+                self.generations.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generations.clear()
+
+
+_local = None
+_local_lock = threading.Lock()
+
+
+def get_local_cache():
+    global _local
+    if _local is None:
+        with _local_lock:
+            if _local is None:
+                config = get_config()
+                _local = UserCache(config['MAX_SIZE'], config['TTL'])
+    return _local
+
+
+def get_shared_cache():
+    alias = get_config()['SHARED_CACHE_ALIAS']
+    return caches[alias] if alias else None
+
+
+def invalidate_user(user_id, using=None):
+    """ Forget a user now and again once the transaction commits, so no request caches the old row in between """
+    key = KEY.format(user_id=user_id)
+
+    def forget():
+        get_local_cache().invalidate(key)
+        shared = get_shared_cache()
+        if shared is not None:
+            # the entry stays until it expires, under a generation no reader accepts any more
+            shared.set(GENERATION_KEY.format(user_id=user_id), uuid.uuid4().hex, get_config()['SHARED_TTL'])
+
+    forget()
+    transaction.on_commit(forget, using=using)
+
+
+def reset_user_cache(**kwargs):
+    """ Drop the process cache so it is rebuilt with changed settings (connected to setting_changed) """
+    global _local
+    if kwargs.get('setting', 'JWT_USER_CACHE') == 'JWT_USER_CACHE':
+        _local = None
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = self.get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+    def get_cached_user(self, user_id):
+        """ A fresh User instance for every request, built from the cached column values """
+        key = KEY.format(user_id=user_id)
+        local, shared = get_local_cache(), get_shared_cache()
+        row = local.get(key)
+        if row is None:
+            # generations are read before the row, a change committing meanwhile leaves them behind
+            local_generation, generation = local.generation(key), None
+            if shared is not None:
+                generation_key = GENERATION_KEY.format(user_id=user_id)
+                found = shared.get_many([key, generation_key])
+                generation = found.get(generation_key)
+                entry = found.get(key)
+                if entry is not None and entry[0] == generation:
+                    row = entry[1]
+            if row is None:
+                row = self.load_row(user_id)
+                if row is None:
+                    return None
+                if shared is not None:
+                    shared.set(key, (generation, row), get_config()['SHARED_TTL'])
+            local.set(key, row, local_generation)
+        return self.user_model.from_db(router.db_for_read(self.user_model), list(row), list(row.values()))
+
+    def load_row(self, user_id):
+        columns = [field.attname for field in self.user_model._meta.concrete_fields]
+        # a replica lagging behind the generation read in get_cached_user would cache the old row under it
+        values = self.user_model.objects.using(DEFAULT_DB_ALIAS).filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(*columns).first()
+        return dict(zip(columns, values)) if values is not None else None
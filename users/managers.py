@@ -1,6 +1,18 @@
 from django.contrib.auth.base_user import BaseUserManager 
+from django.db import models
+from rest_framework_simplejwt.settings import api_settings
+from users.authentication import invalidate_user
 
-class CustomUserManager(BaseUserManager): 
+class UserQuerySet(models.QuerySet): 
+    def update(self, **kwargs): 
+        # update() and bulk_update() send no post_save, so the users they touch are dropped from the JWT user cache here
+        user_ids = list(self.values_list(api_settings.USER_ID_FIELD, flat = True))
+        rows = super().update(**kwargs)
+        for user_id in user_ids: 
+            invalidate_user(user_id, self.db)
+        return rows
+
+class CustomUserManager(BaseUserManager.from_queryset(UserQuerySet)): 
     def create_user(self, email, password = None, **extra_fields): 
         if not email: 
             raise ValueError('This Email Field Must Be Set')
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
+from users.authentication import invalidate_user
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, using, **kwargs): 
+    # active and staff flags and the password hash are read from the cached row, so any save drops it
+    invalidate_user(getattr(instance, api_settings.USER_ID_FIELD), using)
@@ -1,3 +1,85 @@
-from django.test import TestCase
+from unittest import mock
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from api.models import OutboxEmail
+from users.authentication import CachedJWTAuthentication, get_local_cache
+from users.models import User
 
-# Create your tests here.
+
+class RegistrationEmailTests(TestCase):
+    payload = {'email': 'new@example.com', 'password': 'a-long-Passw0rd', 'first_name': 'Nadia'}
+
+    def test_signup_sends_the_activation_email(self):
+        response = self.client.post(reverse('user-list'), self.payload)
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(User.objects.get(email='new@example.com').is_active)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+        self.assertIn('/activate/', mail.outbox[0].body)
+
+    @override_settings(EMAIL_BACKEND='api.mail.OutboxEmailBackend', EMAIL_OUTBOX={'WORKER': True})
+    def test_signup_queues_the_activation_email_in_the_outbox(self):
+        self.client.post(reverse('user-list'), self.payload)
+        message = OutboxEmail.objects.get()
+        self.assertEqual(message.recipients, ['new@example.com'])
+        self.assertIn(b'/activate/', bytes(message.message))
+
+    @override_settings(EMAIL_BACKEND='api.mail.OutboxEmailBackend', EMAIL_OUTBOX={'WORKER': True})
+    def test_failed_signup_queues_nothing(self):
+        self.client.post(reverse('user-list'), {**self.payload, 'password': '123'})
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+@override_settings(JWT_USER_CACHE={'SHARED_CACHE_ALIAS': 'shared'})
+class CachedUserTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='buyer@example.com', first_name='Ayesha')
+
+    def setUp(self):
+        # the shared entries roll back with each test, the process cache does not
+        get_local_cache().clear()
+        self.authentication = CachedJWTAuthentication()
+        self.load_row = CachedJWTAuthentication.load_row
+
+    def get(self):
+        return self.authentication.get_cached_user(self.user.pk)
+
+    def test_second_lookup_runs_no_query(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().first_name, 'Ayesha')
+
+    def test_row_loaded_before_a_change_is_not_kept(self):
+        def load_then_change(authentication, user_id):
+            row = self.load_row(authentication, user_id)
+            # the change commits after the row was read and before it is cached
+            User.objects.filter(pk=user_id).update(first_name='Nadia')
+            return row
+
+        with mock.patch.object(CachedJWTAuthentication, 'load_row', autospec=True, side_effect=load_then_change):
+            self.assertEqual(self.get().first_name, 'Ayesha')
+        self.assertEqual(self.get().first_name, 'Nadia')
+
+    def test_stale_shared_entry_is_a_miss(self):
+        self.get()
+        # another process changed the user, this one still holds the row and only the shared generation moved
+        User.objects.filter(pk=self.user.pk).update(first_name='Nadia')
+        with mock.patch.object(CachedJWTAuthentication, 'load_row', autospec=True, side_effect=self.load_row) as load_row:
+            self.assertEqual(self.get().first_name, 'Nadia')
+        load_row.assert_called_once()
+
+    def test_queryset_updates_invalidate(self):
+        self.get()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertFalse(self.get().is_active)
+        self.user.first_name = 'Nadia'
+        User.objects.bulk_update([self.user], ['first_name'])
+        self.assertEqual(self.get().first_name, 'Nadia')
+
+    def test_save_invalidates(self):
+        self.get()
+        self.user.first_name = 'Nadia'
+        self.user.save()
+        self.assertEqual(self.get().first_name, 'Nadia')